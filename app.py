@@ -1,31 +1,113 @@
+import json
 import os
-from flask import Flask, render_template, request, redirect, url_for, session, send_file
+import time
+from flask import Flask, g, render_template, request, redirect, url_for, session, send_file, jsonify
 import pandas as pd
 
 from modules import db
 from modules import auth
 from modules import preprocessing
 from modules import model
+from modules import registry
+from modules import ingest
+from modules import jobs
 from modules import dashboard as dash
 from modules import report as rep
+from modules import rescore
+from modules import retention
+from modules import columnar
+from modules import compute
+from modules import cohort
+from modules import metrics
+from modules import sessions
+from modules.artifacts import ArtifactStore
 
 APP_SECRET = os.environ.get("SECRET_KEY", "dev-secret-change-me")
 
+# Optional bearer token that lets a Prometheus scraper read /metrics without a session
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+# Device gateway batches: records and bytes accepted per POST /api/v1/records
+API_MAX_RECORDS = 10_000
+API_MAX_BYTES = 4 * 1024 * 1024
+# Accepted besides application/json; other content types (e.g. cross-site form posts) get 415
+API_NDJSON_MIMETYPES = ("application/x-ndjson", "application/jsonl", "application/ndjson")
+
 app = Flask(__name__)
 app.secret_key = APP_SECRET
+# Session data stays server-side (SQLite); the cookie only holds an opaque id
+app.session_interface = sessions.SqliteSessionInterface()
+
+# Generated report views/CSVs, keyed by user and data version
+report_store = ArtifactStore()
 
 with app.app_context():
     db.init_db()
     auth.ensure_default_users()
+    jobs.fail_orphaned_jobs()
+    rescore.fail_orphaned_runs()
+    db.delete_sessions(expired=True)
+    # Don't hand this connection to forked workers (gunicorn --preload); each thread opens its own
+    db.close_conn()
+
+
+@app.before_request
+def _start_request_metrics():
+    g.metrics_t0 = time.perf_counter()
+    # ?_profile=1 samples this request's stack while an admin has profiling switched on
+    g.sampler = metrics.StackSampler().start() if metrics.profiling_enabled and request.args.get("_profile") else None
 
+@app.after_request
+def _record_request_metrics(response):
+    seconds = time.perf_counter() - g.metrics_t0
+    # Streamed bodies (exports, reports) have no length yet and count as 0 bytes out
+    metrics.observe(f"route.{request.endpoint or 'unmatched'}", seconds,
+                    bytes_in=request.content_length or 0,
+                    bytes_out=0 if response.is_streamed else (response.calculate_content_length() or 0),
+                    error=response.status_code >= 500)
+    if g.get("sampler") is not None:
+        metrics.save_profile(f"{request.method} {request.full_path.rstrip('?')}", g.sampler, g.sampler.stop())
+        g.sampler = None
+    return response
+
+@app.errorhandler(compute.Saturated)
+def _compute_saturated(e):
+    # Back-pressure from the bounded compute executor
+    if request.path.startswith("/api/") or request.accept_mimetypes.best == "application/json":
+        resp = jsonify({"error": str(e)})
+    else:
+        resp = app.response_class(str(e), mimetype="text/plain")
+    resp.status_code = 503
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
+@app.errorhandler(auth.RateLimited)
+def _login_rate_limited(e):
+    resp = app.make_response((render_template("login.html", error=str(e)), 429))
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
+@app.teardown_request
+def _stop_sampler(exc):
+    # Unhandled errors skip after_request; don't leave the sampler thread running
+    if g.get("sampler") is not None:
+        g.sampler.stop()
+
+def _view_window():
+    # Optional ?start=&end=&points= zoom window for dashboard views
+    start = request.args.get("start") or None
+    end = request.args.get("end") or None
+    try:
+        points = int(request.args.get("points", dash.MAX_POINTS_DEFAULT))
+    except ValueError:
+        points = dash.MAX_POINTS_DEFAULT
+    points = min(max(points, 100), 20000)
+    return (pd.Timestamp(start) if start else None), (pd.Timestamp(end) if end else None), points
 
-def _rows_to_df(rows):
-    if not rows:
-        return pd.DataFrame()
-    df = pd.DataFrame([dict(r) for r in rows])
-    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
-    df = df.dropna(subset=["timestamp"]).sort_values("timestamp")
-    return df
+def _grid_param():
+    # Optional ?grid= step (preprocessing.GRID_STEPS) for a resampled dashboard view; unknown -> automatic
+    step = request.args.get("grid") or None
+    return step if step in preprocessing.GRID_STEPS else None
 
 @app.route("/")
 def home():
@@ -48,54 +130,135 @@ def logout():
 @app.route("/data")
 @auth.require_login()
 def data_page():
-    c = db.count_health_records(session["user_id"])
-    return render_template("data.html", record_count=c)
+    return _render_data_page(session["user_id"])
+
+def _render_data_page(user_id: int, **extra):
+    return render_template("data.html", record_count=db.count_health_records(user_id), jobs=_recent_jobs(user_id),
+                           engines=list(model.DETECTORS), engine=db.get_user_engine(user_id),
+                           token_count=db.count_api_tokens(user_id), columnar_available=columnar.available(),
+                           **extra)
+
+@app.route("/data/export")
+@auth.require_login()
+def export_data():
+    # Full history as Parquet (default) or an Arrow IPC stream, written batch by batch from the cursor
+    fmt = request.args.get("format", "parquet")
+    if fmt not in columnar.FORMATS:
+        return jsonify({"error": f"Unknown export format: {fmt}"}), 400
+    if not columnar.available():
+        return jsonify({"error": "Parquet/Arrow export needs the optional 'pyarrow' package."}), 501
+    mimetype, ext = columnar.FORMATS[fmt]
+    return app.response_class(
+        columnar.iter_export(session["user_id"], fmt), mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=health_records{ext}"},
+    )
+
+@app.route("/data/api-token", methods=["POST"])
+@auth.require_login()
+def create_api_token():
+    # Shown once; gateways send it as "Authorization: Bearer <token>"
+    uid = session["user_id"]
+    if request.form.get("action") == "revoke":
+        db.delete_api_tokens(uid)
+        return redirect(url_for("data_page"))
+    return _render_data_page(uid, new_token=auth.issue_api_token(uid))
+
+def _parse_api_records():
+    # JSON array, {"records": [...]}, or NDJSON (one object per line)
+    body = request.get_data(cache=False)
+    if request.mimetype in API_NDJSON_MIMETYPES:
+        return [json.loads(line) for line in body.splitlines() if line.strip()]
+    payload = json.loads(body)
+    if isinstance(payload, dict):
+        payload = payload.get("records")
+    if not isinstance(payload, list):
+        raise preprocessing.SchemaError('Expected a JSON array of records or {"records": [...]}.')
+    return payload
+
+@app.route("/api/v1/records", methods=["POST"])
+@auth.require_api_auth()
+def api_records():
+    """
+    Bulk ingest for device gateways. Each batch is validated, scored and written in one
+    transaction; (user, timestamp) is unique, so retrying a batch is safe.
+    """
+    if not request.is_json and request.mimetype not in API_NDJSON_MIMETYPES:
+        return jsonify({"error": "Send application/json or application/x-ndjson."}), 415
+    if (request.content_length or 0) > API_MAX_BYTES:
+        return jsonify({"error": f"Batch larger than {API_MAX_BYTES} bytes."}), 413
+    try:
+        records = _parse_api_records()
+        if len(records) > API_MAX_RECORDS:
+            return jsonify({"error": f"At most {API_MAX_RECORDS} records per batch."}), 413
+        df = preprocessing.records_to_df(records)
+    except ValueError as e:  # json.JSONDecodeError and SchemaError are both ValueErrors
+        return jsonify({"error": str(e)}), 400
+
+    contamination, feature_cols = rescore.current_settings()
+    try:
+        inserted = compute.run("ingest", ingest.ingest_records, g.user_id, df, contamination=contamination,
+                               feature_cols=feature_cols)
+    except ValueError as e:
+        return jsonify({"error": f"Model error: {e}"}), 422
+    return jsonify({"received": len(records), "inserted": inserted, "duplicates": len(records) - inserted})
+
+def _recent_jobs(user_id: int, active_only: bool = False):
+    statuses = jobs.ACTIVE_STATUSES if active_only else None
+    return [jobs.job_status(j) for j in db.list_jobs(user_id, statuses=statuses, limit=5)]
+
+def _data_form_error(message: str):
+    # JSON 400 for clients that ask for JSON (like the upload's 202 reply), else the data page
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({"error": message}), 400
+    return _render_data_page(session["user_id"], error=message)
 
 @app.route("/data/upload", methods=["POST"])
 @auth.require_login()
 def upload_data():
     f = request.files.get("file")
     if not f:
-        return render_template("data.html", record_count=db.count_health_records(session["user_id"]), error="No file uploaded.")
-    b = f.read()
-    df = preprocessing.read_csv_flex(b)
-    ok, err = preprocessing.validate_schema(df)
-    if not ok:
-        return render_template("data.html", record_count=db.count_health_records(session["user_id"]), error=err)
+        return _data_form_error("No file uploaded.")
 
-    df_clean = preprocessing.clean_health_df(df)
+    # Parse, clean, score and insert in the background; poll /data/jobs/<id> for progress
+    # Optional per-upload engine; blank means the account default
+    engine = request.form.get("engine") or None
+    if engine is not None and engine not in model.DETECTORS:
+        return _data_form_error(f"Unknown detector engine: {engine}")
 
-    # Run anomaly detection (screening)
-    try:
-        df_scored = model.score_anomalies(df_clean, contamination=0.03)
-    except Exception as e:
-        return render_template("data.html", record_count=db.count_health_records(session["user_id"]), error=f"Model error: {e}")
-
-    rows = preprocessing.to_db_rows(df_scored)
-    # add flags/scores/drivers
-    for i, r in enumerate(rows):
-        r["anomaly_flag"] = int(df_scored.iloc[i].get("anomaly_flag", 0))
-        r["anomaly_score"] = float(df_scored.iloc[i].get("anomaly_score", 0.0))
-    # Insert
-    db.insert_health_records(session["user_id"], rows)
+    contamination, feature_cols = rescore.current_settings()
+    job_id = jobs.submit_upload(session["user_id"], f, contamination=contamination, feature_cols=feature_cols,
+                                engine=engine)
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({"job_id": job_id, "status_url": url_for("job_status", job_id=job_id)}), 202
+    return redirect(url_for("data_page", job=job_id))
 
-    return redirect(url_for("dashboard"))
+@app.route("/data/engine", methods=["POST"])
+@auth.require_login()
+def set_engine():
+    # Account default detector for future uploads; stored rows keep their scores
+    engine = request.form.get("engine", "")
+    if engine not in model.DETECTORS:
+        return _data_form_error(f"Unknown detector engine: {engine}")
+    db.set_user_engine(session["user_id"], engine)
+    return redirect(url_for("data_page"))
+
+@app.route("/data/jobs/<job_id>")
+@auth.require_login()
+def job_status(job_id):
+    job = db.get_job(job_id)
+    if job is None or job["user_id"] != session["user_id"]:
+        return jsonify({"error": "Unknown job."}), 404
+    return jsonify(jobs.job_status(job))
 
 @app.route("/data/load-sample")
 @auth.require_login()
 def load_sample():
     # Load sample CSV bundled in /data
     sample_path = os.path.join(os.path.dirname(__file__), "data", "sample_health_data.csv")
+    contamination, feature_cols = rescore.current_settings()
     with open(sample_path, "rb") as fp:
-        b = fp.read()
-    df = preprocessing.read_csv_flex(b)
-    df_clean = preprocessing.clean_health_df(df)
-    df_scored = model.score_anomalies(df_clean, contamination=0.03)
-    rows = preprocessing.to_db_rows(df_scored)
-    for i, r in enumerate(rows):
-        r["anomaly_flag"] = int(df_scored.iloc[i].get("anomaly_flag", 0))
-        r["anomaly_score"] = float(df_scored.iloc[i].get("anomaly_score", 0.0))
-    db.insert_health_records(session["user_id"], rows)
+        compute.run("ingest", ingest.ingest_stream, session["user_id"], fp, contamination=contamination,
+                    feature_cols=feature_cols)
     return redirect(url_for("dashboard"))
 
 @app.route("/data/sample.csv")
@@ -103,84 +266,323 @@ def download_sample():
     sample_path = os.path.join(os.path.dirname(__file__), "data", "sample_health_data.csv")
     return send_file(sample_path, as_attachment=True, download_name="sample_health_data.csv")
 
+def _delete_user_data(user_id: int) -> None:
+    db.delete_user_records(user_id)
+    retention.delete_user_archives(user_id)
+    registry.delete_user_models(user_id)
+    registry.delete_user_state(user_id)
+    report_store.delete_user(user_id)
+
 @app.route("/data/clear")
 @auth.require_login()
 def clear_my_data():
-    db.delete_user_records(session["user_id"])
+    _delete_user_data(session["user_id"])
     return redirect(url_for("data_page"))
 
 @app.route("/dashboard")
 @auth.require_login()
 def dashboard():
-    rows = db.get_health_records(session["user_id"])
-    df = _rows_to_df(rows)
+    uid = session["user_id"]
+    start, end, points = _view_window()
+    step = _grid_param()
+    key = ("dashboard", uid, db.get_data_version(uid), start, end, points, step)
+    payload = dash.payload_cache.get(key)
+    if payload is None:
+        payload = compute.run("dashboard", _build_dashboard_payload, uid, start, end, points, step)
+        dash.payload_cache.put(key, payload, size=sum(len(f["data_json"]) for f in payload["figures"]))
+    return render_template("dashboard.html", points=points,
+                           grid_steps=list(preprocessing.GRID_STEPS), plotly_template=dash.template_json(),
+                           jobs=_recent_jobs(uid, active_only=True), **payload)
+
+def _build_dashboard_payload(user_id: int, start, end, points: int, step=None):
+    # Raw rows for short ranges, a pre-aggregated tier for long ones, or the resampled grid asked for
+    grid_error = None
+    try:
+        df = dash.load_view_frame(user_id, start, end, points, grid=step)
+    except ValueError as e:
+        grid_error, step = str(e), None
+        df = dash.load_view_frame(user_id, start, end, points)
     if df.empty:
-        return render_template("dashboard.html", figures=[], summary={"total_records":0,"anomaly_count":0,"anomaly_rate":"0.0"})
+        return {"figures": [], "summary": {"total_records":0,"anomaly_count":0,"anomaly_rate":"0.0"},
+                "grid": step, "grid_error": grid_error}
 
     # If DB already has anomaly_flag stored, use it; otherwise compute quickly
-    if "anomaly_flag" not in df.columns or df["anomaly_flag"].isna().all():
-        df_scored = model.score_anomalies(df, contamination=0.03)
+    if not df.attrs.get("tier") and ("anomaly_flag" not in df.columns or df["anomaly_flag"].isna().all()):
+        contamination, feature_cols = rescore.current_settings()
+        df_scored = model.score_for_user(user_id, df, contamination=contamination, feature_cols=feature_cols)
         df["anomaly_flag"] = df_scored["anomaly_flag"]
         df["anomaly_score"] = df_scored["anomaly_score"]
 
-    summary = {
-        "total_records": int(len(df)),
-        "anomaly_count": int(df["anomaly_flag"].sum()) if "anomaly_flag" in df.columns else 0,
-    }
-    summary["anomaly_rate"] = round(100.0 * summary["anomaly_count"] / max(summary["total_records"], 1), 2)
+    return {"figures": dash.build_timeseries_figures(df, max_points=points), "summary": dash.view_summary(df),
+            "grid": step, "grid_error": grid_error}
 
-    figs = dash.build_timeseries_figures(df)
+@app.route("/dashboard/series")
+@auth.require_login()
+def dashboard_series():
+    # Finer detail for one metric over the visible range; called by the dashboard on zoom
+    metric = request.args.get("metric", "")
+    if metric not in [m for m, _ in dash.METRICS]:
+        return jsonify({"error": "Unknown metric."}), 400
+    uid = session["user_id"]
+    start, end, points = _view_window()
+    step = _grid_param()
+    key = ("series", uid, db.get_data_version(uid), metric, start, end, points, step)
+    body = dash.payload_cache.get(key)
+    if body is None:
+        body = compute.run("series", _build_series_body, uid, metric, start, end, points, step)
+        dash.payload_cache.put(key, body)
+    return app.response_class(body, mimetype="application/json")
 
-    return render_template("dashboard.html", figures=figs, summary=summary)
+def _build_series_body(user_id: int, metric: str, start, end, points: int, step=None) -> str:
+    try:
+        df = dash.load_view_frame(user_id, start, end, points, metrics=[metric], grid=step)
+    except ValueError:
+        df = dash.load_view_frame(user_id, start, end, points, metrics=[metric])
+    figs = dash.build_timeseries_figures(df, max_points=points, metrics=[metric]) if not df.empty else []
+    return '{"data":' + (figs[0]["data_json"] if figs else "[]") + "}"
 
-@app.route("/report")
-@auth.require_login()
-def report():
-    rows = db.get_health_records(session["user_id"])
-    df = _rows_to_df(rows)
-    if df.empty:
-        return render_template("report.html", report=None)
-    # Ensure anomaly columns exist
-    if "anomaly_flag" not in df.columns or df["anomaly_flag"].isna().all():
-        df = model.score_anomalies(df, contamination=0.03)
-    r = rep.generate_weekly_summary(df)
-    # stash daily df in session via csv (small)
-    if r:
-        session["daily_report_csv"] = r["daily_df"].to_csv(index=False)
-        r["table_html"] = r["table_html"]
-    return render_template("report.html", report={
+def _report_range(user_id: int):
+    # Last ?days= (default 7) ending at the newest rollup day, or explicit ?start=&end= (YYYY-MM-DD).
+    # Returns (start_day, end_day), or None when the user has no data; raises ValueError on bad input.
+    # Rollups, not raw records: they keep covering history archived by modules.retention.
+    latest = db.get_latest_rollup_day(user_id)
+    if latest is None:
+        return None
+    days = min(max(int(request.args.get("days", 7)), 1), 366)
+    end_day = pd.Timestamp(request.args.get("end") or latest).date()
+    start_day = (pd.Timestamp(request.args["start"]).date() if request.args.get("start")
+                 else end_day - pd.Timedelta(days=days - 1))
+    return start_day, end_day
+
+def _report_artifact(user_id: int, start_day, end_day, kind: str):
+    # kind is "view" (JSON for the template) or "csv"; both are built together on a miss
+    key = (user_id, db.get_data_version(user_id), start_day.isoformat(), end_day.isoformat())
+    data = report_store.get(key + (kind,))
+    if data is not None:
+        return data
+    artifacts = compute.run("report", _build_report_artifacts, user_id, start_day, end_day)
+    if artifacts is None:
+        return None
+    for k, v in artifacts.items():
+        report_store.put(key + (k,), v)
+    return artifacts[kind]
+
+def _build_report_artifacts(user_id: int, start_day, end_day):
+    rollups = db.get_daily_rollups(user_id, start_day.isoformat(), end_day.isoformat())
+    drivers = db.get_top_anomaly_drivers(user_id, start=start_day, end=end_day + pd.Timedelta(days=1))
+    r = rep.generate_summary_from_rollups(pd.DataFrame([dict(x) for x in rollups]), drivers)
+    if not r:
+        return None
+    view = {
         "date_range": r.get("date_range",""),
         "records": r.get("records",0),
         "anomalies": r.get("anomalies",0),
         "top_drivers": r.get("top_drivers","N/A"),
         "interpretation": r.get("interpretation",""),
-        "table_html": r.get("table_html","")
-    })
+        "table_html": r.get("table_html",""),
+        "start": start_day.isoformat(),
+        "end": end_day.isoformat(),
+    }
+    return {"view": json.dumps(view).encode("utf-8"), "csv": rep.to_report_csv_bytes(r["daily_df"])}
+
+@app.route("/report")
+@auth.require_login()
+def report():
+    uid = session["user_id"]
+    try:
+        window = _report_range(uid)
+    except ValueError:
+        return render_template("report.html", report=None, error="Invalid report date range.")
+    data = _report_artifact(uid, *window, "view") if window else None
+    if data is None:
+        return render_template("report.html", report=None)
+    return render_template("report.html", report=json.loads(data))
 
 @app.route("/report/download")
 @auth.require_login()
 def download_report():
-    csv_text = session.get("daily_report_csv")
-    if not csv_text:
+    uid = session["user_id"]
+    try:
+        window = _report_range(uid)
+    except ValueError:
+        return redirect(url_for("report"))
+    if window is None or _report_artifact(uid, *window, "csv") is None:
         return redirect(url_for("report"))
-    import io
-    buf = io.BytesIO(csv_text.encode("utf-8"))
-    buf.seek(0)
-    return send_file(buf, as_attachment=True, download_name="weekly_report.csv", mimetype="text/csv")
+    key = (uid, db.get_data_version(uid), window[0].isoformat(), window[1].isoformat(), "csv")
+    fp = report_store.open(key)
+    if fp is None:
+        return redirect(url_for("report"))
+    return send_file(fp, as_attachment=True, download_name="weekly_report.csv", mimetype="text/csv")
 
 @app.route("/admin")
 @auth.require_role("admin")
 def admin():
-    users = db.list_users()
-    users_df = pd.DataFrame([dict(u) for u in users])
+    # Cached user list and maintained record counts: no scans per view
+    users_df = pd.DataFrame(auth.list_users())
     users_table = users_df.to_html(index=False, border=0) if not users_df.empty else "<p>No users</p>"
     total_records = db.count_all_health_records()
-    return render_template("admin.html", users_table=users_table, total_records=total_records)
+    contamination, feature_cols = rescore.current_settings()
+    return render_template("admin.html", users_table=users_table, total_records=total_records,
+                           users=auth.list_users(), roles=auth.ROLES,
+                           contamination=contamination, feature_cols=feature_cols,
+                           all_features=model.FEATURE_COLS_DEFAULT, rescore_running=rescore.is_running(),
+                           rescore_runs=[rescore.run_summary(r) for r in db.list_rescore_runs(limit=5)],
+                           error=request.args.get("error"), user_error=request.args.get("user_error"))
+
+@app.route("/admin/users", methods=["POST"])
+@auth.require_role("admin")
+def admin_user_action():
+    # Role changes, password resets and deletions drop cached lookups and end the user's sessions
+    try:
+        uid = int(request.form.get("user_id", ""))
+        action = request.form.get("action", "")
+        if uid == session["user_id"]:
+            raise ValueError("Use another admin account to change your own.")
+        if auth.get_user(uid) is None:
+            raise ValueError("Unknown user.")
+        if action.startswith("role:"):
+            auth.set_role(uid, action[len("role:"):])
+        elif action == "password":
+            auth.set_password(uid, request.form.get("password", ""))
+        elif action == "delete":
+            _delete_user_data(uid)
+            auth.delete_user(uid)
+        else:
+            raise ValueError(f"Unknown action: {action}")
+    except ValueError as e:
+        return redirect(url_for("admin", user_error=str(e)))
+    return redirect(url_for("admin"))
+
+def _cohort_params():
+    # ?start=&end= (YYYY-MM-DD, inclusive, optional) and ?weeks= for spike detection; ValueError on bad input
+    start = pd.Timestamp(request.args["start"]).date().isoformat() if request.args.get("start") else None
+    end = pd.Timestamp(request.args["end"]).date().isoformat() if request.args.get("end") else None
+    weeks = min(max(int(request.args.get("weeks", cohort.SPIKE_WEEKS)), 2), 52)
+    return start, end, weeks
+
+@app.route("/admin/cohort")
+@auth.require_role("admin")
+def admin_cohort():
+    try:
+        start, end, weeks = _cohort_params()
+    except ValueError:
+        return render_template("cohort.html", tables=None, error="Invalid date range.", ttl=cohort.COHORT_TTL_S,
+                               weeks=cohort.SPIKE_WEEKS)
+    tables = compute.run("cohort", cohort.summary, start, end, weeks)
+    html = {k: df.to_html(index=False, border=0, na_rep="") for k, df in tables.items()}
+    return render_template("cohort.html", tables=html, counts={k: len(df) for k, df in tables.items()},
+                           start=start or "", end=end or "", weeks=weeks, ttl=cohort.COHORT_TTL_S,
+                           columnar=columnar.available())
+
+@app.route("/admin/cohort/export/<table>")
+@auth.require_role("admin")
+def admin_cohort_export(table):
+    fmt = request.args.get("format", "csv")
+    if table not in cohort.TABLES:
+        return jsonify({"error": f"Unknown cohort table: {table}"}), 404
+    if fmt != "csv" and fmt not in columnar.FORMATS:
+        return jsonify({"error": f"Unknown export format: {fmt}"}), 400
+    if fmt != "csv" and not columnar.available():
+        return jsonify({"error": "Parquet/Arrow export needs the optional 'pyarrow' package."}), 501
+    try:
+        start, end, weeks = _cohort_params()
+    except ValueError:
+        return jsonify({"error": "Invalid date range."}), 400
+    df = compute.run("cohort", cohort.summary, start, end, weeks)[table]
+    if fmt == "csv":
+        body, mimetype, ext = df.to_csv(index=False).encode("utf-8"), "text/csv", ".csv"
+    else:
+        body = columnar.frame_bytes(df, fmt)
+        mimetype, ext = columnar.FORMATS[fmt]
+    return app.response_class(body, mimetype=mimetype,
+                              headers={"Content-Disposition": f"attachment; filename=cohort_{table}{ext}"})
+
+@app.route("/admin/rescore", methods=["POST"])
+@auth.require_role("admin")
+def admin_rescore():
+    # Refit and rescore every user in worker processes; progress shows on the admin page
+    try:
+        contamination = float(request.form.get("contamination", ""))
+        workers = int(request.form["workers"]) if request.form.get("workers") else None
+        run_id = rescore.start_background(contamination, request.form.getlist("features"), workers)
+    except ValueError as e:
+        return redirect(url_for("admin", error=str(e)))
+    if run_id is None:
+        return redirect(url_for("admin", error="A rescore is already running."))
+    return redirect(url_for("admin"))
+
+@app.route("/admin/retention")
+@auth.require_role("admin")
+def admin_retention():
+    users = db.list_users()
+    return render_template("retention.html", users=users, roles=sorted({u["role"] for u in users}),
+                           policies=retention.get_policies(), plan=retention.plan(), space=db.space_stats(),
+                           archives=[retention.archive_summary(a) for a in db.list_archives()], running=retention.is_running(),
+                           runs=[retention.run_summary(r) for r in db.list_retention_runs(limit=10)],
+                           error=request.args.get("error"), message=request.args.get("message"))
+
+@app.route("/admin/retention", methods=["POST"])
+@auth.require_role("admin")
+def admin_retention_action():
+    action = request.form.get("action")
+    try:
+        if action == "policy":
+            target = request.form.get("target", "")
+            days = int(request.form["days"]) if request.form.get("days") else None
+            if target.startswith("user:"):
+                retention.set_policy(days, user_id=int(target[5:]))
+            else:
+                retention.set_policy(days, role=target[5:])
+        elif action == "run":
+            if retention.start_background(convert_vacuum=bool(request.form.get("convert_vacuum"))) is None:
+                return redirect(url_for("admin_retention", error="A retention run is already running."))
+        elif action == "rehydrate":
+            n = retention.rehydrate(int(request.form["user_id"]), request.form.get("start") or None,
+                                    request.form.get("end") or None)
+            return redirect(url_for("admin_retention", message=f"Restored {n} records."))
+    except (KeyError, ValueError) as e:
+        return redirect(url_for("admin_retention", error=str(e) or "Invalid input."))
+    return redirect(url_for("admin_retention"))
+
+@app.route("/admin/metrics")
+@auth.require_role("admin")
+def admin_metrics():
+    return render_template("metrics.html", stages=metrics.snapshot(), profiles=metrics.profiles(),
+                           profiling=metrics.profiling_enabled, compute=compute.stats())
+
+@app.route("/admin/metrics", methods=["POST"])
+@auth.require_role("admin")
+def admin_metrics_action():
+    action = request.form.get("action")
+    if action == "reset":
+        metrics.reset()
+    elif action in ("profile-on", "profile-off"):
+        metrics.set_profiling(action == "profile-on")
+    return redirect(url_for("admin_metrics"))
+
+@app.route("/admin/metrics/profile/<int:idx>")
+@auth.require_role("admin")
+def admin_metrics_profile(idx):
+    # Collapsed stacks ("a;b;c count" per line) for flamegraph.pl or speedscope
+    profiles = metrics.profiles()
+    if not 0 <= idx < len(profiles):
+        return jsonify({"error": "Unknown profile."}), 404
+    return app.response_class(profiles[idx]["collapsed"] + "\n", mimetype="text/plain")
+
+@app.route("/metrics")
+def prometheus_metrics():
+    token_ok = METRICS_TOKEN and request.headers.get("Authorization") == f"Bearer {METRICS_TOKEN}"
+    if not token_ok and session.get("role") != "admin":
+        return jsonify({"error": "Authentication required."}), 401
+    return app.response_class(metrics.prometheus_text(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/admin/reset-db")
 @auth.require_role("admin")
 def admin_reset_db():
     db.reset_db()
+    retention.clear_archives()
+    registry.clear_registry()
+    report_store.clear()
     auth.ensure_default_users()
     return redirect(url_for("admin"))
 
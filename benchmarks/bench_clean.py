@@ -0,0 +1,75 @@
+"""
+Cleaning benchmark: raw upload frame -> cleaned frame.
+
+Compares the legacy step-wise path (remove_duplicates -> coerce_types_and_fill ->
+clip_outliers: a frame copy per step, three loops over the numeric columns and two
+quantile calls per column) with the fused clean_health_df (one float matrix cleaned
+in place). Input is minute-level synthetic data with sensor gaps and duplicate readings,
+read back from CSV so timestamps and numbers start as parsed text, as in an upload.
+Peak memory is traced with tracemalloc (NumPy and pandas buffers included).
+
+    python -m benchmarks.bench_clean --sizes 100000 1000000
+"""
+import argparse
+import io
+import time
+import tracemalloc
+
+import pandas as pd
+
+from modules import preprocessing
+
+from .synthetic import generate_user
+
+
+def legacy_clean(df: pd.DataFrame) -> pd.DataFrame:
+    df2 = df.copy()
+    df2.columns = [str(c).strip().lower() for c in df2.columns]
+    df2 = preprocessing.remove_duplicates(df2)
+    df2 = preprocessing.coerce_types_and_fill(df2)
+    return preprocessing.clip_outliers(df2)
+
+
+def fused_clean(df: pd.DataFrame) -> pd.DataFrame:
+    return preprocessing.clean_health_df(df)
+
+
+def make_upload_frame(n: int, seed: int = 0) -> pd.DataFrame:
+    days = -(-n // 1440)
+    df = generate_user(1, days=days, freq="1min", missing_rate=0.02, duplicate_rate=0.002, seed=seed)
+    csv = df.drop(columns=["is_anomaly"]).head(n).to_csv(index=False)
+    return pd.read_csv(io.StringIO(csv))
+
+
+def _run(fn, df: pd.DataFrame, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(df)
+        best = min(best, time.perf_counter() - t0)
+    del out
+    # Separate traced run: tracemalloc slows allocation-heavy code down
+    tracemalloc.start()
+    out = fn(df)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, len(out)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    ap.add_argument("--repeat", type=int, default=3, help="best of N timed runs per path")
+    args = ap.parse_args()
+
+    print(f"{'rows':>10} {'path':>7} {'seconds':>9} {'rows/sec':>12} {'peak MiB':>9} {'input MiB':>10}")
+    for n in args.sizes:
+        df = make_upload_frame(n)
+        size_mb = df.memory_usage(deep=True).sum() / 2**20
+        for name, fn in (("legacy", legacy_clean), ("fused", fused_clean)):
+            secs, peak, rows = _run(fn, df, args.repeat)
+            print(f"{n:>10} {name:>7} {secs:>9.3f} {n / secs:>12,.0f} {peak / 2**20:>9.1f} {size_mb:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Ingest throughput benchmark: scored DataFrame -> health_records.
+
+Compares the legacy path (to_db_rows + per-row iloc + insert_health_records)
+with the columnar path (to_db_tuples + insert_health_tuples).
+
+    python -m benchmarks.bench_ingest --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from modules import db, preprocessing
+
+
+def make_scored_frame(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "timestamp": pd.date_range("2025-01-01", periods=n, freq="min"),
+        "heart_rate": rng.normal(75, 10, n),
+        "steps": rng.poisson(20, n).astype(float),
+        "sleep_hours": rng.uniform(0, 1, n),
+        "calories": rng.normal(60, 15, n),
+        "blood_pressure_systolic": rng.normal(120, 8, n),
+        "blood_pressure_diastolic": rng.normal(78, 6, n),
+        "glucose": rng.normal(100, 12, n),
+    })
+    df["anomaly_flag"] = (rng.uniform(size=n) < 0.03).astype(int)
+    df["anomaly_score"] = rng.uniform(size=n)
+    return df
+
+
+def legacy_ingest(df: pd.DataFrame, db_path: str) -> None:
+    rows = preprocessing.to_db_rows(df)
+    for i, r in enumerate(rows):
+        r["anomaly_flag"] = int(df.iloc[i].get("anomaly_flag", 0))
+        r["anomaly_score"] = float(df.iloc[i].get("anomaly_score", 0.0))
+    db.insert_health_records(1, rows, db_path=db_path)
+
+
+def columnar_ingest(df: pd.DataFrame, db_path: str) -> None:
+    db.insert_health_tuples(preprocessing.to_db_tuples(df, 1), db_path=db_path)
+
+
+def _time(fn, df: pd.DataFrame) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        db.init_db(path)
+        t0 = time.perf_counter()
+        fn(df, path)
+        secs = time.perf_counter() - t0
+        db.close_conn(path)
+        return secs
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--legacy-max", type=int, default=100_000,
+                    help="skip the legacy path above this many rows (it is very slow)")
+    args = ap.parse_args()
+
+    print(f"{'rows':>10} {'path':>9} {'seconds':>9} {'rows/sec':>12}")
+    for n in args.sizes:
+        df = make_scored_frame(n)
+        paths = [("columnar", columnar_ingest)]
+        if n <= args.legacy_max:
+            paths.insert(0, ("legacy", legacy_ingest))
+        for name, fn in paths:
+            secs = _time(fn, df)
+            print(f"{n:>10} {name:>9} {secs:>9.3f} {n / secs:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Record loader benchmark: health_records -> time-ordered DataFrame.
+
+Compares the legacy path (get_health_records + rows_to_df: dict per sqlite3.Row,
+list-of-dicts DataFrame, ISO string parsing) with db.load_health_frame
+(preallocated typed arrays filled from tuple batches, epoch `ts` column).
+
+    python -m benchmarks.bench_loader --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from modules import db, preprocessing
+
+from .bench_ingest import make_scored_frame
+
+
+def legacy_load(db_path: str):
+    return preprocessing.rows_to_df(db.get_health_records(1, db_path=db_path))
+
+
+def typed_load(db_path: str):
+    return db.load_health_frame(1, db_path=db_path)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--repeat", type=int, default=3, help="best of N runs per path")
+    args = ap.parse_args()
+
+    print(f"{'rows':>10} {'path':>7} {'seconds':>9} {'rows/sec':>12}")
+    for n in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            db.init_db(path)
+            db.insert_health_tuples(preprocessing.to_db_tuples(make_scored_frame(n), 1), db_path=path)
+            for name, fn in (("legacy", legacy_load), ("typed", typed_load)):
+                best = float("inf")
+                for _ in range(args.repeat):
+                    t0 = time.perf_counter()
+                    df = fn(path)
+                    best = min(best, time.perf_counter() - t0)
+                assert len(df) == n
+                print(f"{n:>10} {name:>7} {best:>9.3f} {n / best:>12,.0f}")
+            db.close_conn(path)
+
+
+if __name__ == "__main__":
+    main()
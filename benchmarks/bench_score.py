@@ -0,0 +1,108 @@
+"""
+Scoring benchmark: a fitted baseline forest over a large batch, plus the forest-shape trade-off.
+
+Scoring compares the legacy path (a float64 feature matrix, then decision_function and
+predict: every tree walked twice) with model.forest_decision (one traversal, float32 chunks
+of SCORE_CHUNK_ROWS), serially and with trees split over --n-jobs threads. Peak memory is
+traced with tracemalloc in a separate run.
+
+The trade-off table fits baselines for each --trees x --max-samples pair and reports fit and
+score time, ROC AUC and average precision of the anomaly score against the injected
+anomalies (benchmarks.synthetic `is_anomaly`), and how many flags agree with the default
+forest (N_ESTIMATORS trees, MAX_SAMPLES).
+
+    python -m benchmarks.bench_score --rows 1000000 --n-jobs 1 4
+    python -m benchmarks.bench_score --rows 500000 --trees 50 100 200 --max-samples 256 1024 4096
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import average_precision_score, roc_auc_score
+
+from modules import model, preprocessing
+
+from .synthetic import generate_user
+
+
+def make_frame(n: int, seed: int = 0) -> pd.DataFrame:
+    # Minute-level readings of one user, cleaned as an upload would be
+    days = -(-n // 1440)
+    df = generate_user(1, days=days, freq="1min", seed=seed).head(n)
+    labels = df["is_anomaly"].to_numpy()
+    out = preprocessing.clean_health_df(df.drop(columns=["is_anomaly"]))
+    out["is_anomaly"] = labels[out.index]
+    return out.reset_index(drop=True)
+
+
+def legacy_decision(entry, df: pd.DataFrame) -> np.ndarray:
+    X = df[entry.feature_cols].astype(float).values
+    decision = entry.model.decision_function(X)
+    entry.model.predict(X)
+    return decision
+
+
+def _run(fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    del out
+    tracemalloc.start()
+    out = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=1_000_000, help="rows scored")
+    ap.add_argument("--fit-rows", type=int, default=model.MAX_FIT_ROWS, help="oldest rows used for fitting")
+    ap.add_argument("--n-jobs", type=int, nargs="+", default=[1, 4], help="tree threads for forest_decision")
+    ap.add_argument("--trees", type=int, nargs="+", default=[50, 100, 200, 400])
+    ap.add_argument("--max-samples", nargs="+", default=["256", "1024", "4096"],
+                    help='"auto", row counts or fractions')
+    ap.add_argument("--repeat", type=int, default=3, help="best of N timed runs per path")
+    args = ap.parse_args()
+
+    df = make_frame(args.rows)
+    cols = model.usable_feature_cols(df)
+    train = df.head(args.fit_rows)
+    labels = df["is_anomaly"].to_numpy()
+    entry = model.fit_baseline(train, feature_cols=cols)
+    print(f"{len(df)} rows, {len(cols)} features, fit on {len(train)}; "
+          f"forest {model.N_ESTIMATORS} trees, max_samples={model.MAX_SAMPLES}")
+
+    print(f"\n{'path':>16} {'seconds':>9} {'rows/sec':>12} {'peak MiB':>9}")
+    secs, peak, ref = _run(lambda: legacy_decision(entry, df), args.repeat)
+    print(f"{'legacy':>16} {secs:>9.3f} {len(df) / secs:>12,.0f} {peak / 2**20:>9.1f}")
+    for n_jobs in args.n_jobs:
+        secs, peak, d = _run(lambda: model.forest_decision(entry.model, df, cols, n_jobs=n_jobs), args.repeat)
+        assert np.array_equal(d < 0, ref < 0), "flags differ from decision_function/predict"
+        print(f"{f'single n_jobs={n_jobs}':>16} {secs:>9.3f} {len(df) / secs:>12,.0f} {peak / 2**20:>9.1f}")
+
+    base_flags = ref < 0
+    print(f"\n{'trees':>6} {'max_samples':>11} {'fit s':>7} {'score s':>8} {'ROC AUC':>8} {'avg prec':>9} "
+          f"{'flag agree':>11}")
+    jobs = max(args.n_jobs)
+    for trees in args.trees:
+        for ms in args.max_samples:
+            t0 = time.perf_counter()
+            e = model.fit_baseline(train, feature_cols=cols, n_jobs=jobs, n_estimators=trees,
+                                   max_samples=model.parse_max_samples(ms))
+            fit_s = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            d = model.forest_decision(e.model, df, cols, n_jobs=jobs)
+            score_s = time.perf_counter() - t0
+            auc = roc_auc_score(labels, -d)
+            ap_score = average_precision_score(labels, -d)
+            agree = float(np.mean((d < 0) == base_flags))
+            print(f"{trees:>6} {ms:>11} {fit_s:>7.2f} {score_s:>8.2f} {auc:>8.3f} {ap_score:>9.3f} {agree:>11.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+HTTP load test against a running server, or one it starts with gunicorn (--spawn).
+
+Each client thread logs in as the default "user" account and loops over a route mix: light
+routes (/, /login, /data) and heavy ones (/dashboard and /report with varying parameters, so
+most requests miss the caches and reach the compute executor). Reports throughput, latency
+percentiles and 503 back-pressure responses per route class.
+
+    python -m benchmarks.loadtest --spawn --clients 32 --duration 20
+    python -m benchmarks.loadtest --url http://127.0.0.1:8000 --heavy-share 0.5
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import synthetic
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LIGHT = ["/", "/login", "/data"]
+
+
+def _heavy_path(rng: random.Random) -> str:
+    # Random points/day counts: distinct cache keys, so the work is redone
+    if rng.random() < 0.5:
+        return f"/dashboard?points={rng.randint(200, 20000)}"
+    return f"/report?days={rng.randint(1, 366)}"
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def _client(base: str) -> urllib.request.OpenerDirector:
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+                                         _NoRedirect())
+    body = urllib.parse.urlencode({"username": "user", "password": "user123"}).encode()
+    try:
+        opener.open(base + "/login", data=body, timeout=30)
+    except urllib.error.HTTPError as e:
+        if e.code == 429:
+            raise RuntimeError("login rate-limited; raise LOGIN_LIMIT_PER_USER/LOGIN_LIMIT_PER_IP on the server")
+        if e.code != 302:
+            raise
+    return opener
+
+
+def _get(opener, url: str, timeout: float = 60) -> Tuple[int, float]:
+    t0 = time.perf_counter()
+    try:
+        with opener.open(url, timeout=timeout) as r:
+            r.read()
+            status = r.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    return status, time.perf_counter() - t0
+
+
+def seed(base: str, size: str = "small") -> int:
+    # Uploads the largest synthetic user of `size` as "user" and waits for the job
+    opener = _client(base)
+    df = max(synthetic.generate_size(size).values(), key=len)
+    boundary = "loadtest"
+    head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"seed.csv\"\r\n"
+            f"Content-Type: text/csv\r\n\r\n")
+    payload = head.encode() + synthetic.to_csv_bytes(df) + f"\r\n--{boundary}--\r\n".encode()
+    _get(opener, base + "/data/clear")
+    req = urllib.request.Request(base + "/data/upload", data=payload, headers={
+        "Content-Type": f"multipart/form-data; boundary={boundary}", "Accept": "application/json"})
+    job = json.loads(opener.open(req, timeout=60).read())
+    while True:
+        status = json.loads(opener.open(base + job["status_url"], timeout=30).read())
+        if status["status"] not in ("queued", "running"):
+            break
+        time.sleep(0.2)
+    if status["status"] != "done":
+        raise RuntimeError(f"seed upload failed: {status['error']}")
+    return len(df)
+
+
+def run(base: str, clients: int, duration: float, heavy_share: float, seed_value: int = 0) -> Dict[str, Any]:
+    samples: Dict[str, List[Tuple[int, float]]] = {"light": [], "heavy": []}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(i: int) -> None:
+        rng = random.Random(seed_value + i)
+        opener = _client(base)
+        local: Dict[str, List[Tuple[int, float]]] = {"light": [], "heavy": []}
+        while time.monotonic() < deadline:
+            kind = "heavy" if rng.random() < heavy_share else "light"
+            path = _heavy_path(rng) if kind == "heavy" else rng.choice(LIGHT)
+            try:
+                local[kind].append(_get(opener, base + path))
+            except (OSError, urllib.error.URLError):
+                local[kind].append((0, 0.0))
+        with lock:
+            for k, v in local.items():
+                samples[k].extend(v)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    return {kind: _summary(rows, elapsed) for kind, rows in samples.items()}
+
+
+def _summary(rows: List[Tuple[int, float]], elapsed: float) -> Dict[str, Any]:
+    ok = sorted(s for code, s in rows if code == 200)
+    pct = lambda q: ok[min(len(ok) - 1, int(q * len(ok)))] * 1000 if ok else None
+    return {
+        "requests": len(rows),
+        "ok": len(ok),
+        "busy_503": sum(1 for code, _ in rows if code == 503),
+        "errors": sum(1 for code, _ in rows if code not in (200, 503)),
+        "ok_per_s": len(ok) / elapsed if elapsed else None,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "mean_ms": statistics.fmean(ok) * 1000 if ok else None,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn(workers: int, threads: int, env: Optional[Dict[str, str]] = None) -> Tuple[subprocess.Popen, str, str]:
+    """
+    Starts gunicorn with gunicorn.conf.py in a throwaway working directory (fresh instance/).
+    Returns (process, base_url, tmpdir).
+    """
+    tmp = tempfile.mkdtemp(prefix="loadtest-")
+    port = _free_port()
+    cmd = [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"),
+           "--chdir", tmp, "--pythonpath", ROOT, "-b", f"127.0.0.1:{port}",
+           "-w", str(workers), "--threads", str(threads), "wsgi:app"]
+    proc = subprocess.Popen(cmd, env={**os.environ, **(env or {})}, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            urllib.request.urlopen(base + "/", timeout=1).read()
+            return proc, base, tmp
+        except OSError:
+            if proc.poll() is not None:
+                raise RuntimeError("gunicorn exited; is it installed (pip install gunicorn)?")
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("server did not come up")
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default=None, help="base URL of a running server")
+    ap.add_argument("--spawn", action="store_true", help="start gunicorn on a fresh instance/ directory")
+    ap.add_argument("--workers", type=int, default=2, help="gunicorn workers with --spawn")
+    ap.add_argument("--threads", type=int, default=16, help="gunicorn threads per worker with --spawn")
+    ap.add_argument("--clients", type=int, default=32, help="concurrent client threads")
+    ap.add_argument("--duration", type=float, default=20.0, help="seconds per run")
+    ap.add_argument("--heavy-share", type=float, default=0.3, help="fraction of requests to heavy routes")
+    ap.add_argument("--size", choices=sorted(synthetic.SIZES), default="small", help="seed data size")
+    ap.add_argument("--no-seed", action="store_true", help="use the data already stored for 'user'")
+    ap.add_argument("--out", default=None, help="write results as JSON")
+    args = ap.parse_args(argv)
+    if bool(args.url) == args.spawn:
+        ap.error("give exactly one of --url or --spawn")
+
+    proc = tmp = None
+    base = args.url.rstrip("/") if args.url else None
+    if args.spawn:
+        # Every client logs in as "user" from one address: lift the login rate limits
+        proc, base, tmp = spawn(args.workers, args.threads,
+                                env={"LOGIN_LIMIT_PER_IP": "100000", "LOGIN_LIMIT_PER_USER": "100000"})
+    try:
+        if not args.no_seed:
+            print(f"seeded {seed(base, args.size)} rows")
+        results = run(base, args.clients, args.duration, args.heavy_share)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    print(f"{args.clients} clients, {args.duration:.0f}s, heavy share {args.heavy_share:.0%}")
+    print(f"{'class':<6} {'requests':>9} {'ok/s':>8} {'503':>6} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    fmt = lambda v: f"{v:.1f}" if v is not None else "-"
+    for kind, r in results.items():
+        print(f"{kind:<6} {r['requests']:>9} {fmt(r['ok_per_s']):>8} {r['busy_503']:>6} {r['errors']:>7} "
+              f"{fmt(r['p50_ms']):>8} {fmt(r['p95_ms']):>8} {fmt(r['p99_ms']):>8}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fp:
+            json.dump({"args": vars(args), "results": results}, fp, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Benchmark suite over synthetic multi-user data (see benchmarks.synthetic).
+
+Times the hot library calls (cleaning, scoring, record insert/read, dashboard figures, weekly
+report) and end-to-end Flask test-client requests (/data/upload, /dashboard, /report), writes
+the results as JSON and optionally checks them against a baseline run.
+
+    python -m benchmarks.suite --size medium --out benchmarks/results/baseline.json
+    python -m benchmarks.suite --size medium --baseline benchmarks/results/baseline.json --threshold 0.25
+    python -m benchmarks.suite --compare benchmarks/results/baseline.json benchmarks/results/new.json
+
+Exits with status 1 when any case is more than `threshold` slower than the baseline.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from modules import dashboard, db, model, preprocessing, report
+
+from . import synthetic
+
+RESULTS_DIR = os.path.join("benchmarks", "results")
+
+# Cases faster than this are dominated by timer noise and never count as regressions
+MIN_SECONDS = 0.005
+
+JOB_TIMEOUT_S = 600
+
+
+def _measure(fn: Callable[[], Any], repeat: int, setup: Optional[Callable[[], None]] = None) -> List[float]:
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def _result(times: List[float], rows: int) -> Dict[str, Any]:
+    best = min(times)
+    return {
+        "seconds": best,
+        "median_s": statistics.median(times),
+        "runs": len(times),
+        "rows": rows,
+        "rows_per_s": rows / best if best > 0 else None,
+    }
+
+
+def library_cases(frames: Dict[int, pd.DataFrame], repeat: int, tmp: str) -> Dict[str, Dict[str, Any]]:
+    raw = {uid: df.drop(columns=["is_anomaly"]) for uid, df in frames.items()}
+    n = sum(len(df) for df in raw.values())
+    out = {}
+
+    clean = {}
+    def _clean():
+        for uid, df in raw.items():
+            clean[uid] = preprocessing.clean_health_df(df)
+    out["preprocessing.clean_health_df"] = _result(_measure(_clean, repeat), n)
+    n_clean = sum(len(df) for df in clean.values())
+
+    scored = {}
+    def _score():
+        for uid, df in clean.items():
+            scored[uid] = model.score_anomalies(df)
+    out["model.score_anomalies"] = _result(_measure(_score, repeat), n_clean)
+
+    rows = {uid: preprocessing.to_db_rows(df) for uid, df in scored.items()}
+    for uid, df in scored.items():
+        for r, flag, score, drivers in zip(rows[uid], df["anomaly_flag"], df["anomaly_score"], df["anomaly_drivers"]):
+            r.update(anomaly_flag=int(flag), anomaly_score=float(score), anomaly_drivers=drivers or None)
+    path = os.path.join(tmp, "library.db")
+
+    def _fresh_db():
+        db.close_conn(path)
+        if os.path.exists(path):
+            os.remove(path)
+        db.init_db(path)
+    def _insert():
+        for uid, r in rows.items():
+            db.insert_health_records(uid, r, db_path=path)
+    out["db.insert_health_records"] = _result(_measure(_insert, repeat, setup=_fresh_db), n_clean)
+
+    def _get():
+        for uid in rows:
+            db.get_health_records(uid, db_path=path)
+    out["db.get_health_records"] = _result(_measure(_get, repeat), n_clean)
+
+    loaded = {uid: db.load_health_frame(uid, db_path=path) for uid in rows}
+    db.close_conn(path)
+
+    def _figures():
+        for df in loaded.values():
+            dashboard.build_timeseries_figures(df)
+    out["dashboard.build_timeseries_figures"] = _result(_measure(_figures, repeat), n_clean)
+
+    def _report():
+        for df in loaded.values():
+            report.generate_weekly_summary(df)
+    out["report.generate_weekly_summary"] = _result(_measure(_report, repeat), n_clean)
+    return out
+
+
+def _wait_for_job(client, job_id: str) -> Dict[str, Any]:
+    deadline = time.monotonic() + JOB_TIMEOUT_S
+    while time.monotonic() < deadline:
+        status = client.get(f"/data/jobs/{job_id}").get_json()
+        if status["status"] not in ("queued", "running"):
+            return status
+        time.sleep(0.02)
+    raise TimeoutError(f"upload job {job_id} did not finish in {JOB_TIMEOUT_S}s")
+
+
+def e2e_cases(frames: Dict[int, pd.DataFrame], repeat: int, tmp: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Runs the app against a throwaway instance/ directory; the largest user's data is uploaded
+    as the default "user" account. Dashboard and report are timed cold (caches cleared) and warm.
+    """
+    cwd = os.getcwd()
+    os.makedirs(os.path.join(tmp, "e2e"), exist_ok=True)
+    os.chdir(os.path.join(tmp, "e2e"))
+    try:
+        # The app opens instance/app.db relative to the working directory on import
+        import app as appmod
+        appmod.app.testing = True
+        client = appmod.app.test_client()
+        r = client.post("/login", data={"username": "user", "password": "user123"})
+        if r.status_code != 302:
+            raise RuntimeError("benchmark login failed")
+
+        df = max(frames.values(), key=len)
+        body = synthetic.to_csv_bytes(df)
+        out = {}
+
+        def _upload():
+            r = client.post("/data/upload", data={"file": (io.BytesIO(body), "synthetic.csv")},
+                            content_type="multipart/form-data", headers={"Accept": "application/json"})
+            status = _wait_for_job(client, r.get_json()["job_id"])
+            if status["status"] != "done":
+                raise RuntimeError(f"upload failed: {status['error']}")
+        out["e2e.upload"] = _result(_measure(_upload, repeat, setup=lambda: client.get("/data/clear")), len(df))
+        rows = db.count_health_records(db.get_user_by_username("user")["user_id"])
+
+        def _get(url: str) -> Callable[[], None]:
+            def fn():
+                if client.get(url).status_code != 200:
+                    raise RuntimeError(f"GET {url} failed")
+            return fn
+        out["e2e.dashboard_cold"] = _result(_measure(_get("/dashboard"), repeat,
+                                                     setup=dashboard.payload_cache.clear), rows)
+        out["e2e.dashboard_warm"] = _result(_measure(_get("/dashboard"), repeat), rows)
+        out["e2e.report_cold"] = _result(_measure(_get("/report"), repeat, setup=appmod.report_store.clear), rows)
+        out["e2e.report_warm"] = _result(_measure(_get("/report"), repeat), rows)
+        return out
+    finally:
+        db.close_conn()
+        os.chdir(cwd)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(size: str = "medium", repeat: int = 3, seed: int = 0, e2e: bool = True) -> Dict[str, Any]:
+    frames = synthetic.generate_size(size, seed=seed)
+    users, days, freq = synthetic.SIZES[size]
+    with tempfile.TemporaryDirectory() as tmp:
+        results = library_cases(frames, repeat, tmp)
+        if e2e:
+            results.update(e2e_cases(frames, repeat, tmp))
+    return {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "size": size, "users": users, "days": days, "freq": freq, "seed": seed,
+            "rows": sum(len(df) for df in frames.values()),
+            "repeat": repeat,
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.25,
+            min_seconds: float = MIN_SECONDS) -> List[Tuple[str, Optional[float], Optional[float], Optional[float], bool]]:
+    """
+    (case, baseline_s, current_s, ratio, regressed) per case in either run. A case regresses
+    when it is more than `threshold` (a fraction) slower than the baseline, ignoring cases
+    under `min_seconds` in both runs. Runs of different sizes are not comparable.
+    """
+    if baseline["meta"]["size"] != current["meta"]["size"]:
+        raise ValueError(f"size mismatch: baseline {baseline['meta']['size']}, current {current['meta']['size']}")
+    base, cur = baseline["results"], current["results"]
+    out = []
+    for name in sorted(set(base) | set(cur)):
+        b = base.get(name, {}).get("seconds")
+        c = cur.get(name, {}).get("seconds")
+        ratio = c / b if b and c is not None else None
+        regressed = ratio is not None and ratio > 1 + threshold and max(b, c) >= min_seconds
+        out.append((name, b, c, ratio, regressed))
+    return out
+
+
+def _print_results(doc: Dict[str, Any]) -> None:
+    m = doc["meta"]
+    print(f"size={m['size']} users={m['users']} days={m['days']} freq={m['freq']} rows={m['rows']} "
+          f"commit={m['commit']}")
+    print(f"{'case':<36} {'best s':>9} {'median s':>9} {'rows/sec':>12}")
+    for name, r in doc["results"].items():
+        rps = f"{r['rows_per_s']:,.0f}" if r["rows_per_s"] else "-"
+        print(f"{name:<36} {r['seconds']:>9.4f} {r['median_s']:>9.4f} {rps:>12}")
+
+
+def _print_comparison(rows, threshold: float) -> bool:
+    print(f"\n{'case':<36} {'base s':>9} {'now s':>9} {'ratio':>7}")
+    failed = False
+    for name, b, c, ratio, regressed in rows:
+        fmt = lambda v, spec: format(v, spec) if v is not None else "-"
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<36} {fmt(b, '9.4f'):>9} {fmt(c, '9.4f'):>9} {fmt(ratio, '7.2f'):>7}{flag}")
+        failed = failed or regressed
+    print(f"\n{'FAIL' if failed else 'OK'}: threshold +{threshold:.0%}")
+    return failed
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--size", choices=sorted(synthetic.SIZES), default="medium")
+    ap.add_argument("--repeat", type=int, default=3, help="runs per case; the best is compared")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--no-e2e", action="store_true", help="skip the Flask test-client cases")
+    ap.add_argument("--out", default=None, help=f"results file (default: {RESULTS_DIR}/<size>-<time>.json)")
+    ap.add_argument("--baseline", default=None, help="results file to check this run against")
+    ap.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="compare two results files and exit")
+    ap.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown as a fraction (0.25 = 25%%)")
+    args = ap.parse_args(argv)
+
+    if args.compare:
+        failed = _print_comparison(compare(_load(args.compare[0]), _load(args.compare[1]), args.threshold),
+                                   args.threshold)
+        sys.exit(1 if failed else 0)
+
+    doc = run(args.size, args.repeat, args.seed, e2e=not args.no_e2e)
+    _print_results(doc)
+    out = args.out or os.path.join(RESULTS_DIR, f"{args.size}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as fp:
+        json.dump(doc, fp, indent=2)
+    print(f"\nwrote {out}")
+    if args.baseline:
+        failed = _print_comparison(compare(_load(args.baseline), doc, args.threshold), args.threshold)
+        sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Synthetic wearable data: multi-user hourly or minute-level health series with injected anomalies.
+
+Each user gets their own resting baselines, a circadian heart-rate cycle, daytime activity
+(steps and calories move together), overnight sleep, meal-time glucose peaks, sensor gaps and
+a few duplicated readings. Anomalies are short episodes where one to three metrics jump well
+outside the user's normal range; `is_anomaly` marks them (it is not a CSV column the app reads).
+
+    python -m benchmarks.synthetic --users 20 --days 30 --freq 1min --out /tmp/synthetic
+"""
+import argparse
+import os
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from modules.preprocessing import NUMERIC_COLS
+
+# Per-episode shifts in units of each metric's normal spread
+ANOMALY_SHIFTS = {
+    "heart_rate": 4.0,
+    "blood_pressure_systolic": 4.0,
+    "blood_pressure_diastolic": 4.0,
+    "glucose": 5.0,
+    "steps": 6.0,
+    "calories": 5.0,
+}
+
+SIZES = {
+    # name: (users, days, freq)
+    "small": (3, 14, "1h"),
+    "medium": (10, 30, "1h"),
+    "large": (20, 30, "1min"),
+}
+
+
+def generate_user(user_id: int, days: int = 30, freq: str = "1h", anomaly_rate: float = 0.01,
+                  missing_rate: float = 0.005, duplicate_rate: float = 0.001,
+                  start: str = "2026-01-01", seed: Optional[int] = None) -> pd.DataFrame:
+    """
+    One user's readings as a DataFrame with `timestamp`, NUMERIC_COLS and `is_anomaly`.
+    `anomaly_rate` is the fraction of readings inside anomaly episodes.
+    """
+    rng = np.random.default_rng(seed if seed is not None else user_id)
+    ts = pd.date_range(start, periods=int(pd.Timedelta(days=days) / pd.Timedelta(freq)), freq=freq)
+    n = len(ts)
+    # Per-reading quantities (steps, calories, sleep) scale with the sampling interval
+    scale = pd.Timedelta(freq) / pd.Timedelta(hours=1)
+    hour = (ts.hour + ts.minute / 60.0).to_numpy()
+    awake = (hour >= 7) & (hour < 23)
+    active = np.clip(np.sin(np.pi * (hour - 7) / 16), 0, None) * awake
+
+    rest_hr = rng.normal(64, 5)
+    hr = rest_hr + 8 * np.sin(2 * np.pi * (hour - 10) / 24) + 25 * active * rng.uniform(0, 1, n)
+    hr += rng.normal(0, 3, n)
+    steps = rng.poisson(900 * scale * active * rng.uniform(0.2, 1.5)).astype(float)
+    calories = 70 * scale + 0.045 * steps + rng.normal(0, 4 * scale, n)
+    sleep = np.where(awake, 0.0, np.clip(rng.normal(0.9, 0.1, n), 0, 1)) * scale
+    sys_bp = rng.normal(118, 6) + 6 * active + rng.normal(0, 4, n)
+    dia_bp = rng.normal(76, 4) + 3 * active + rng.normal(0, 3, n)
+    # Glucose peaks roughly an hour after each meal
+    glucose = rng.normal(92, 5) + rng.normal(0, 4, n)
+    for meal in (8.0, 13.0, 19.0):
+        glucose += 35 * np.exp(-0.5 * ((hour - meal - 1.0) / 0.7) ** 2)
+
+    df = pd.DataFrame({
+        "timestamp": ts,
+        "heart_rate": hr,
+        "steps": steps,
+        "sleep_hours": sleep,
+        "calories": calories,
+        "blood_pressure_systolic": sys_bp,
+        "blood_pressure_diastolic": dia_bp,
+        "glucose": glucose,
+    })
+    df["is_anomaly"] = False
+
+    # Anomaly episodes of 1-6 readings, each shifting a random subset of metrics
+    spread = {c: df[c].std() or 1.0 for c in ANOMALY_SHIFTS}
+    remaining = int(anomaly_rate * n)
+    while remaining > 0:
+        length = min(int(rng.integers(1, 7)), remaining)
+        at = int(rng.integers(0, max(n - length, 1)))
+        rows = slice(at, at + length - 1)  # .loc slices are inclusive
+        for c in rng.choice(list(ANOMALY_SHIFTS), size=int(rng.integers(1, 4)), replace=False):
+            # Heart rate and glucose can also drop (bradycardia, hypoglycaemia)
+            sign = rng.choice([-1, 1]) if c in ("heart_rate", "glucose") else 1
+            df.loc[rows, c] += sign * ANOMALY_SHIFTS[c] * spread[c]
+        df.loc[rows, "is_anomaly"] = True
+        remaining -= length
+
+    df[["steps", "calories", "sleep_hours", "glucose"]] = df[["steps", "calories", "sleep_hours", "glucose"]].clip(lower=0)
+
+    # Sensor gaps: individual metric readings dropped
+    if missing_rate > 0:
+        for c in NUMERIC_COLS:
+            df.loc[rng.uniform(size=n) < missing_rate, c] = np.nan
+    # Devices occasionally resend a reading
+    if duplicate_rate > 0:
+        dups = df[rng.uniform(size=n) < duplicate_rate]
+        df = pd.concat([df, dups]).sort_values("timestamp", kind="stable").reset_index(drop=True)
+    return df
+
+
+def generate(users: int = 10, days: int = 30, freq: str = "1h", anomaly_rate: float = 0.01,
+             seed: int = 0, **kwargs) -> Dict[int, pd.DataFrame]:
+    # user_id -> frame; user ids start at 1 and seeds are derived so runs are reproducible
+    return {
+        uid: generate_user(uid, days=days, freq=freq, anomaly_rate=anomaly_rate, seed=seed * 100_003 + uid, **kwargs)
+        for uid in range(1, users + 1)
+    }
+
+
+def generate_size(name: str, seed: int = 0) -> Dict[int, pd.DataFrame]:
+    users, days, freq = SIZES[name]
+    return generate(users, days, freq, seed=seed)
+
+
+def to_csv_bytes(df: pd.DataFrame) -> bytes:
+    # Upload format: the columns /data/upload accepts, without the ground-truth label
+    return df.drop(columns=["is_anomaly"]).to_csv(index=False).encode("utf-8")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=10)
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--freq", default="1h", help="pandas frequency, e.g. 1h or 1min")
+    ap.add_argument("--anomaly-rate", type=float, default=0.01)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--labels", action="store_true", help="keep the is_anomaly ground-truth column")
+    ap.add_argument("--out", required=True, help="directory for user<N>.csv files")
+    args = ap.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    frames = generate(args.users, args.days, args.freq, args.anomaly_rate, args.seed)
+    for uid, df in frames.items():
+        path = os.path.join(args.out, f"user{uid}.csv")
+        (df if args.labels else df.drop(columns=["is_anomaly"])).to_csv(path, index=False)
+        print(f"{path}: {len(df)} rows, {int(df['is_anomaly'].sum())} anomalous")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+# gunicorn -c gunicorn.conf.py wsgi:app
+import os
+
+bind = os.environ.get("BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("WEB_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Threads mostly wait on SQLite or the compute executor (modules.compute). Keep them above the
+# executor's capacity (COMPUTE_WORKERS + COMPUTE_QUEUE) so light routes always find a free thread.
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", "16"))
+
+# Import once in the master: migrations and orphaned-job cleanup run a single time
+preload_app = True
+
+# Large synchronous API batches can take a while; uploads run as background jobs
+timeout = 120
+graceful_timeout = 30
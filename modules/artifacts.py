@@ -0,0 +1,99 @@
+import hashlib
+import io
+import os
+import threading
+from typing import IO, Hashable, Optional
+
+from .cache import LRUCache
+
+ARTIFACT_DIR_DEFAULT = os.path.join("instance", "reports")
+
+
+class ArtifactStore:
+    """
+    Two-tier store for generated report artifacts (bytes).
+    Hot entries live in a size-bounded in-memory LRU; every entry is also written to
+    `directory`, which is shared by worker processes and survives restarts. The disk
+    tier is pruned oldest-first once it exceeds `max_disk_bytes`.
+    Keys should include the user id first and the user's data version, so stale
+    artifacts are never hit after new data arrives.
+    """
+
+    def __init__(self, directory: str = ARTIFACT_DIR_DEFAULT, max_memory_bytes: int = 16 * 1024 * 1024,
+                 max_disk_bytes: int = 256 * 1024 * 1024):
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = LRUCache(max_entries=512, max_bytes=max_memory_bytes)
+        self._lock = threading.Lock()
+
+    def _path(self, key: Hashable) -> str:
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        user = key[0] if isinstance(key, tuple) and key else "x"
+        return os.path.join(self.directory, f"u{user}_{digest}.bin")
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        data = self._memory.get(key)
+        if data is not None:
+            return data
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fp:
+                data = fp.read()
+        except FileNotFoundError:
+            return None
+        os.utime(path)  # keep recently read artifacts out of the prune set
+        self._memory.put(key, data)
+        return data
+
+    def open(self, key: Hashable) -> Optional[IO[bytes]]:
+        """Readable stream for an artifact: disk file when present, else the in-memory copy."""
+        path = self._path(key)
+        if os.path.exists(path):
+            return open(path, "rb")
+        data = self._memory.get(key)
+        return io.BytesIO(data) if data is not None else None
+
+    def put(self, key: Hashable, data: bytes) -> None:
+        self._memory.put(key, data)
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as fp:
+            fp.write(data)
+        os.replace(tmp, path)
+        self._prune()
+
+    def _prune(self) -> None:
+        with self._lock:
+            entries = []
+            total = 0
+            for e in os.scandir(self.directory):
+                if e.is_file() and e.name.endswith(".bin"):
+                    st = e.stat()
+                    entries.append((st.st_mtime, st.st_size, e.path))
+                    total += st.st_size
+            for _, size, path in sorted(entries):
+                if total <= self.max_disk_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def delete_user(self, user_id: int) -> None:
+        for key in self._memory.keys():
+            if isinstance(key, tuple) and key and key[0] == user_id:
+                self._memory.pop(key)
+        if not os.path.isdir(self.directory):
+            return
+        prefix = f"u{user_id}_"
+        for e in os.scandir(self.directory):
+            if e.name.startswith(prefix):
+                os.remove(e.path)
+
+    def clear(self) -> None:
+        self._memory.clear()
+        if os.path.isdir(self.directory):
+            for e in os.scandir(self.directory):
+                os.remove(e.path)
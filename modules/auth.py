@@ -1,9 +1,140 @@
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import deque
 from functools import wraps
-from typing import Callable, Optional, Tuple
-from flask import session, redirect, url_for, request
+from typing import Callable, Dict, List, Optional, Tuple
+from flask import g, jsonify, session, redirect, url_for, request
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from . import db
+from . import sessions
+from .cache import LRUCache
+from .compute import BoundedExecutor
+
+# User/role lookups are cached per process; other workers see a change within this time
+USER_CACHE_TTL_S = 30
+
+# Password checks (deliberately slow hashes) run on their own small pool so a burst of
+# logins can't take every request thread; past its queue, logins get 503 + Retry-After
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", "2"))
+HASH_QUEUE = int(os.environ.get("HASH_QUEUE", "8"))
+
+# Login attempts per sliding window, per client IP and per (existing) username
+LOGIN_WINDOW_S = 60
+LOGIN_LIMIT_PER_IP = int(os.environ.get("LOGIN_LIMIT_PER_IP", "20"))
+LOGIN_LIMIT_PER_USER = int(os.environ.get("LOGIN_LIMIT_PER_USER", "5"))
+
+_hash_pool = BoundedExecutor("auth", HASH_WORKERS, HASH_QUEUE)
+
+ROLES = ("user", "admin")
+
+# user_id -> (row dict or None, cached_at); "all" -> (list_users rows, cached_at);
+# ("login", username) -> (row dict with password_hash or None, cached_at)
+_users = LRUCache(max_entries=10_000, max_bytes=8 * 1024 * 1024)
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Too many login attempts; please wait and try again.")
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Sliding-window attempt counter per key, in process memory (per worker)."""
+
+    def __init__(self, limit: int, window_s: float):
+        self.limit = limit
+        self.window_s = window_s
+        self._hits = LRUCache(max_entries=50_000, max_bytes=64 * 1024 * 1024)
+        self._lock = threading.Lock()
+
+    def hit(self, key: str) -> Optional[int]:
+        # Records an attempt; returns None if allowed, else seconds until the next one is
+        now = time.monotonic()
+        with self._lock:
+            q = self._hits.get(key)
+            if q is None:
+                q = deque()
+                self._hits.put(key, q, size=64)
+            while q and now - q[0] >= self.window_s:
+                q.popleft()
+            if len(q) >= self.limit:
+                return max(1, int(self.window_s - (now - q[0])) + 1)
+            q.append(now)
+            return None
+
+    def reset(self) -> None:
+        self._hits.clear()
+
+
+_ip_limiter = RateLimiter(LOGIN_LIMIT_PER_IP, LOGIN_WINDOW_S)
+_user_limiter = RateLimiter(LOGIN_LIMIT_PER_USER, LOGIN_WINDOW_S)
+
+
+def get_user(user_id: int) -> Optional[Dict]:
+    # user_id, username, role, email of an existing user (cached), else None
+    entry = _users.get(user_id)
+    if entry is not None and time.monotonic() - entry[1] < USER_CACHE_TTL_S:
+        return entry[0]
+    row = db.get_user_by_id(user_id)
+    u = dict(row) if row is not None else None
+    _users.put(user_id, (u, time.monotonic()), size=256)
+    return u
+
+def _login_row(username: str) -> Optional[Dict]:
+    # user_id, username, role and password_hash for a login attempt (cached), else None
+    key = ("login", username)
+    entry = _users.get(key)
+    if entry is not None and time.monotonic() - entry[1] < USER_CACHE_TTL_S:
+        return entry[0]
+    row = db.get_user_by_username(username)
+    u = {k: row[k] for k in ("user_id", "username", "role", "password_hash")} if row is not None else None
+    _users.put(key, (u, time.monotonic()), size=512)
+    return u
+
+def list_users() -> List[Dict]:
+    entry = _users.get("all")
+    if entry is not None and time.monotonic() - entry[1] < USER_CACHE_TTL_S:
+        return entry[0]
+    rows = [dict(r) for r in db.list_users()]
+    _users.put("all", (rows, time.monotonic()), size=256 * len(rows))
+    return rows
+
+def user_changed(user_id: Optional[int] = None, revoke_sessions: bool = False) -> None:
+    # Drops cached lookups for the user (or everyone) and optionally ends their sessions
+    if user_id is None:
+        _users.clear()
+        sessions.clear_cache()
+        return
+    _users.pop(user_id)
+    _users.pop("all")
+    for key in _users.keys():
+        entry = _users.get(key) if isinstance(key, tuple) else None
+        if entry is not None and entry[0] is not None and entry[0]["user_id"] == user_id:
+            _users.pop(key)
+    if revoke_sessions:
+        sessions.revoke_user(user_id)
+
+def set_role(user_id: int, role: str) -> None:
+    if role not in ROLES:
+        raise ValueError(f"Unknown role: {role}")
+    db.set_user_role(user_id, role)
+    user_changed(user_id, revoke_sessions=True)
+
+def set_password(user_id: int, password: str) -> None:
+    # Hashed on the login pool, so resets share the hash-check budget
+    if not password:
+        raise ValueError("Password must not be empty.")
+    db.set_user_password(user_id, _hash_pool.run("password", generate_password_hash, password))
+    user_changed(user_id, revoke_sessions=True)
+
+def delete_user(user_id: int) -> None:
+    # The account only; callers remove the user's data first
+    db.delete_user(user_id)
+    user_changed(user_id, revoke_sessions=True)
 
 def ensure_default_users() -> None:
     # Create default accounts on first run
@@ -11,13 +142,24 @@ def ensure_default_users() -> None:
         db.create_user("admin", generate_password_hash("admin123"), role="admin", email="admin@example.com")
     if db.get_user_by_username("user") is None:
         db.create_user("user", generate_password_hash("user123"), role="user", email="user@example.com")
+    user_changed()
+
+def _rate_limit(limiter: RateLimiter, key: str) -> None:
+    wait = limiter.hit(key)
+    if wait is not None:
+        raise RateLimited(wait)
 
 def login_user(username: str, password: str) -> Tuple[bool, Optional[str]]:
-    u = db.get_user_by_username(username)
+    # Raises RateLimited, or compute.Saturated when the hash pool is full
+    _rate_limit(_ip_limiter, request.remote_addr or "-")
+    u = _login_row(username)
     if u is None:
         return False, "Unknown username."
-    if not check_password_hash(u["password_hash"], password):
+    _rate_limit(_user_limiter, u["username"])
+    if not _hash_pool.run("login", check_password_hash, u["password_hash"], password):
         return False, "Incorrect password."
+    sessions.regenerate(session)
+    session.clear()
     session["user_id"] = int(u["user_id"])
     session["username"] = u["username"]
     session["role"] = u["role"]
@@ -26,24 +168,62 @@ def login_user(username: str, password: str) -> Tuple[bool, Optional[str]]:
 def logout_user() -> None:
     session.clear()
 
+def _session_user() -> Optional[Dict]:
+    # The logged-in user, if the session names one that still exists; stale sessions are cleared
+    uid = session.get("user_id")
+    if not uid:
+        return None
+    u = get_user(int(uid))
+    if u is None:
+        session.clear()
+    return u
+
 def require_login() -> Callable:
     def decorator(fn: Callable) -> Callable:
         @wraps(fn)
         def wrapper(*args, **kwargs):
-            if not session.get("user_id"):
+            if _session_user() is None:
                 return redirect(url_for("login", next=request.path))
             return fn(*args, **kwargs)
         return wrapper
     return decorator
 
 def require_role(role: str) -> Callable:
+    # Checks the user's current role (cached), not the one copied into the session at login
     def decorator(fn: Callable) -> Callable:
         @wraps(fn)
         def wrapper(*args, **kwargs):
-            if not session.get("user_id"):
+            u = _session_user()
+            if u is None:
                 return redirect(url_for("login", next=request.path))
-            if session.get("role") != role:
+            if u["role"] != role:
                 return redirect(url_for("dashboard"))
             return fn(*args, **kwargs)
         return wrapper
     return decorator
+
+def _token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def issue_api_token(user_id: int) -> str:
+    # The plain token is returned once; only its hash is stored
+    token = secrets.token_urlsafe(32)
+    db.create_api_token(user_id, _token_hash(token))
+    return token
+
+def require_api_auth() -> Callable:
+    # Bearer token (device gateways) only; sets g.user_id. Answers 401 JSON, never redirects.
+    # The session cookie is not accepted: a cross-site form post would carry it.
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            header = request.headers.get("Authorization", "")
+            if not header.startswith("Bearer "):
+                return jsonify({"error": "Bearer token required."}), 401
+            u = db.get_api_token_user(_token_hash(header[len("Bearer "):].strip()))
+            if u is None:
+                return jsonify({"error": "Invalid API token."}), 401
+            g.user_id = int(u["user_id"])
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
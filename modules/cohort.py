@@ -0,0 +1,137 @@
+"""
+Cohort analytics for admins: anomaly rate per user, distribution of per-user metric means
+across the cohort, and users whose weekly anomaly count is spiking. Each table comes from one
+grouped query over daily_rollups (db.cohort_user_totals / db.cohort_weekly_counts) plus NumPy
+post-processing, never per-user record loads. Results are cached for COHORT_TTL_S and keyed
+by the global data version, so new uploads show up on the next view.
+"""
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from . import db
+from . import metrics
+from .cache import LRUCache
+
+COHORT_TTL_S = 300
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+# Spike detection: the latest week against the mean/std of the weeks before it
+SPIKE_WEEKS = 8
+SPIKE_Z = 3.0
+SPIKE_MIN_ANOMALIES = 5
+
+TABLES = ("rates", "percentiles", "spikes")
+
+_cache = LRUCache(max_entries=64, max_bytes=32 * 1024 * 1024)
+
+
+def anomaly_rates(totals: pd.DataFrame) -> pd.DataFrame:
+    out = totals[["user_id", "records", "anomalies", "days", "first_day", "last_day"]].copy()
+    records = out["records"].to_numpy(dtype=float)
+    out["anomaly_rate_pct"] = np.round(100.0 * out["anomalies"].to_numpy(dtype=float) / np.maximum(records, 1.0), 2)
+    return out.sort_values("anomaly_rate_pct", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def metric_percentiles(totals: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per metric: how many users have readings, percentiles and mean of the per-user means,
+    and the cohort-wide min/max reading.
+    """
+    ms = db.ROLLUP_METRICS
+    counts = totals[[f"{m}_count" for m in ms]].to_numpy(dtype=float)
+    sums = totals[[f"{m}_sum" for m in ms]].to_numpy(dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(counts > 0, sums / counts, np.nan)       # users x metrics
+    has = ~np.isnan(means)
+    users = has.sum(axis=0)
+    pct = np.full((len(PERCENTILES), len(ms)), np.nan)
+    mean = np.full(len(ms), np.nan)
+    if has.any():
+        cols = users > 0
+        pct[:, cols] = np.nanpercentile(means[:, cols], PERCENTILES, axis=0)
+        mean[cols] = np.nanmean(means[:, cols], axis=0)
+    out = pd.DataFrame({"metric": ms, "users": users})
+    for i, p in enumerate(PERCENTILES):
+        out[f"p{p}"] = np.round(pct[i], 2)
+    out["mean"] = np.round(mean, 2)
+    out["min"] = np.round(totals[[f"{m}_min" for m in ms]].min().to_numpy(dtype=float), 2) if len(totals) else np.nan
+    out["max"] = np.round(totals[[f"{m}_max" for m in ms]].max().to_numpy(dtype=float), 2) if len(totals) else np.nan
+    return out
+
+
+def weekly_spikes(end_day: Optional[str] = None, weeks: int = SPIKE_WEEKS, z_threshold: float = SPIKE_Z,
+                  min_anomalies: int = SPIKE_MIN_ANOMALIES, db_path: str = db.DB_PATH_DEFAULT) -> pd.DataFrame:
+    """
+    Users whose anomaly count in the week ending `end_day` (default: newest rollup day) is at
+    least `min_anomalies` and `z_threshold` standard deviations above their previous weeks.
+    The std is floored at 1 so users with flat zero histories need a real jump.
+    """
+    cols = ["user_id", "week_start", "anomalies", "baseline_mean", "baseline_std", "z", "records"]
+    end_day = end_day or db.latest_rollup_day(db_path)
+    if end_day is None or weeks < 2:
+        return pd.DataFrame(columns=cols)
+    end = pd.Timestamp(end_day)
+    start = end - pd.Timedelta(days=7 * weeks - 1)
+    counts = db.cohort_weekly_counts(start.date().isoformat(), end.date().isoformat(), db_path)
+    if counts.empty:
+        return pd.DataFrame(columns=cols)
+    uids, row = np.unique(counts["user_id"].to_numpy(), return_inverse=True)
+    week = counts["week"].to_numpy()
+    anomalies = np.zeros((len(uids), weeks))
+    records = np.zeros((len(uids), weeks))
+    np.add.at(anomalies, (row, week), counts["anomalies"].to_numpy(dtype=float))
+    np.add.at(records, (row, week), counts["records"].to_numpy(dtype=float))
+    base, last = anomalies[:, :-1], anomalies[:, -1]
+    mu, sd = base.mean(axis=1), base.std(axis=1)
+    z = (last - mu) / np.maximum(sd, 1.0)
+    hit = (last >= min_anomalies) & (z >= z_threshold)
+    order = np.argsort(-z[hit], kind="stable")
+    return pd.DataFrame({
+        "user_id": uids[hit][order],
+        "week_start": (end - pd.Timedelta(days=6)).date().isoformat(),
+        "anomalies": last[hit][order].astype(int),
+        "baseline_mean": np.round(mu[hit][order], 2),
+        "baseline_std": np.round(sd[hit][order], 2),
+        "z": np.round(z[hit][order], 2),
+        "records": records[hit, -1][order].astype(int),
+    }, columns=cols)
+
+
+@metrics.timed("cohort.summary")
+def _compute(start_day: Optional[str], end_day: Optional[str], weeks: int, db_path: str) -> Dict[str, pd.DataFrame]:
+    totals = db.cohort_user_totals(start_day, end_day, db_path)
+    names = {u["user_id"]: u["username"] for u in db.list_users(db_path)}
+    tables = {
+        "rates": anomaly_rates(totals),
+        "percentiles": metric_percentiles(totals),
+        "spikes": weekly_spikes(end_day, weeks, db_path=db_path),
+    }
+    for name in ("rates", "spikes"):
+        t = tables[name]
+        t.insert(1, "username", t["user_id"].map(names))
+    return tables
+
+
+def summary(start_day: Optional[str] = None, end_day: Optional[str] = None, weeks: int = SPIKE_WEEKS,
+            db_path: str = db.DB_PATH_DEFAULT) -> Dict[str, Any]:
+    """
+    {"rates", "percentiles", "spikes"} DataFrames for [start_day, end_day] (inclusive, None =
+    open), cached for COHORT_TTL_S per range and data version. The frames are shared: don't
+    modify them.
+    """
+    key = (start_day, end_day, weeks, db.get_global_data_version(db_path), db_path)
+    entry = _cache.get(key)
+    if entry is not None and time.monotonic() - entry[1] < COHORT_TTL_S:
+        return entry[0]
+    tables = _compute(start_day, end_day, weeks, db_path)
+    size = sum(int(t.memory_usage(deep=True).sum()) for t in tables.values())
+    _cache.put(key, (tables, time.monotonic()), size=size)
+    return tables
+
+
+def clear_cache() -> None:
+    _cache.clear()
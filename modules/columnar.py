@@ -0,0 +1,169 @@
+import io
+from typing import IO, Iterator, List
+
+import pandas as pd
+
+from . import db
+from .db import HEALTH_COLUMNS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional; Parquet/Arrow import and export are unavailable without it
+    pa = None
+    pq = None
+
+# Rows per Parquet row group / Arrow record batch on export
+EXPORT_BATCH_ROWS = 50_000
+
+FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", ".arrows"),
+}
+
+PARQUET_MAGIC = b"PAR1"
+ARROW_FILE_MAGIC = b"ARROW1"
+ARROW_STREAM_PREFIX = b"\xff\xff\xff\xff"  # IPC continuation marker
+
+# Columns read on import; stored anomaly results are recomputed, never trusted from a file
+IMPORT_COLUMNS = [c for c in HEALTH_COLUMNS if not c.startswith("anomaly_")]
+
+
+def available() -> bool:
+    return pa is not None
+
+
+def _require() -> None:
+    if pa is None:
+        raise RuntimeError("Parquet/Arrow support needs the optional 'pyarrow' package.")
+
+
+def health_schema():
+    _require()
+    fields = [pa.field("timestamp", pa.timestamp("s"))]
+    for c in HEALTH_COLUMNS[1:]:
+        if c == "anomaly_flag":
+            fields.append(pa.field(c, pa.int8()))
+        elif c == "anomaly_drivers":
+            fields.append(pa.field(c, pa.string()))
+        else:
+            fields.append(pa.field(c, pa.float64()))
+    return pa.schema(fields)
+
+
+def _rows_to_batch(rows, schema):
+    # Column-wise from the cursor rows. Timestamps are stored as ISO text; rows written by older
+    # versions may carry fractional seconds or UTC offsets, so they are parsed leniently (as UTC,
+    # floored to seconds) rather than cast in Arrow, which rejects those forms mid-stream.
+    cols = list(zip(*rows))
+    ts = pd.to_datetime(pd.Series(cols[0], dtype=object), format="ISO8601", utc=True, errors="coerce")
+    ts = ts.dt.tz_localize(None).dt.floor("s").to_numpy(dtype="datetime64[s]")
+    arrays = [pa.array(ts, schema.field(0).type, mask=pd.isna(ts))]
+    arrays += [pa.array(values, f.type) for values, f in zip(cols[1:], list(schema)[1:])]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _ChunkSink(io.RawIOBase):
+    # Write-only sink whose buffered bytes are drained by the caller; tell() keeps the
+    # absolute offset, which the Parquet writer needs for its footer
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        data = bytes(b)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def iter_export(user_id: int, fmt: str = "parquet", batch_rows: int = EXPORT_BATCH_ROWS,
+                db_path: str = db.DB_PATH_DEFAULT) -> Iterator[bytes]:
+    """
+    Streams a user's full history as Parquet (one row group per batch) or an Arrow IPC stream.
+    Rows go from the SQLite cursor into Arrow arrays batch by batch, so memory is bounded by
+    `batch_rows` regardless of history size.
+    """
+    _require()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    schema = health_schema()
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    for rows in db.iter_health_batches(user_id, HEALTH_COLUMNS, batch_rows, db_path=db_path):
+        writer.write_batch(_rows_to_batch(rows, schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def frame_bytes(df: pd.DataFrame, fmt: str = "parquet") -> bytes:
+    # A small in-memory frame (e.g. an analytics table) as one Parquet file or Arrow IPC stream
+    _require()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    if fmt == "parquet":
+        pq.write_table(table, sink, compression="zstd")
+    else:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def sniff_format(binary: IO[bytes]) -> str:
+    # "parquet", "arrow" or "text"; leaves the stream at its start
+    head = binary.read(8)
+    binary.seek(0)
+    if head[:4] == PARQUET_MAGIC:
+        return "parquet"
+    if head[:6] == ARROW_FILE_MAGIC or head[:4] == ARROW_STREAM_PREFIX:
+        return "arrow"
+    return "text"
+
+
+def _batch_to_df(batch) -> pd.DataFrame:
+    df = batch.to_pandas()
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    df = df.drop(columns=[c for c in df.columns if c.startswith("anomaly_")])
+    if "timestamp" in df.columns and isinstance(df["timestamp"].dtype, pd.DatetimeTZDtype):
+        df["timestamp"] = df["timestamp"].dt.tz_convert("UTC").dt.tz_localize(None)
+    return df
+
+
+def iter_columnar_chunks(binary: IO[bytes], fmt: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """
+    Raw (uncleaned) frames of at most `chunk_rows` rows from a Parquet file or Arrow IPC
+    file/stream; no text parsing is involved. Parquet reads only IMPORT_COLUMNS from disk.
+    """
+    _require()
+    if fmt == "parquet":
+        pf = pq.ParquetFile(binary)
+        wanted = [n for n in pf.schema_arrow.names if n.strip().lower() in IMPORT_COLUMNS]
+        batches = pf.iter_batches(batch_size=chunk_rows, columns=wanted or None)
+    elif binary.read(6) == ARROW_FILE_MAGIC:
+        binary.seek(0)
+        reader = pa.ipc.open_file(binary)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    else:
+        binary.seek(0)
+        batches = iter(pa.ipc.open_stream(binary))
+    for batch in batches:
+        for start in range(0, batch.num_rows, chunk_rows):
+            yield _batch_to_df(batch.slice(start, chunk_rows))
+
@@ -0,0 +1,97 @@
+"""
+Bounded executor for CPU-heavy request work (dashboard figures, on-the-fly scoring, report
+building, synchronous ingest). Request threads hand the work over and wait for it: at most
+COMPUTE_WORKERS tasks run at once per process and COMPUTE_QUEUE more may wait. Past that,
+run() raises Saturated immediately and the app answers 503 with Retry-After, so light routes
+(/, /login, /data) keep their request threads and their share of the GIL under load.
+BoundedExecutor is reusable for other budgets (password hashing in modules.auth).
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from . import metrics
+
+# Per process; with several web workers keep workers x COMPUTE_WORKERS near the core count
+COMPUTE_WORKERS = int(os.environ.get("COMPUTE_WORKERS", "2"))
+COMPUTE_QUEUE = int(os.environ.get("COMPUTE_QUEUE", str(2 * COMPUTE_WORKERS)))
+
+# Seconds a rejected client is asked to wait before retrying
+RETRY_AFTER_S = int(os.environ.get("COMPUTE_RETRY_AFTER", "2"))
+
+
+class Saturated(Exception):
+    """Raised when an executor and its queue are full."""
+
+    def __init__(self, retry_after: int = RETRY_AFTER_S):
+        super().__init__("Server busy, please retry shortly.")
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """
+    Thread pool with a fixed number of running plus queued tasks. run() blocks the caller
+    until the task finishes, or raises Saturated at once when every slot is taken.
+    Queue waits are recorded as the "<name>.wait.<stage>" metrics stage, rejections as
+    "<name>.rejected.<stage>".
+    """
+
+    def __init__(self, name: str, workers: int, queue: int, retry_after: int = RETRY_AFTER_S):
+        self.name = name
+        self.workers = workers
+        self.capacity = workers + queue
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._inflight = 0
+        self._lock = threading.Lock()
+
+    def _count(self, delta: int) -> None:
+        with self._lock:
+            self._inflight += delta
+
+    def run(self, stage: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Runs fn(*args, **kwargs) on the pool and returns its result (or raises its error).
+        fn runs outside the Flask request context: pass it plain values, not request/session
+        objects. Don't call run() from inside fn; a nested task could wait on a slot its
+        parent holds.
+        """
+        if not self._slots.acquire(blocking=False):
+            metrics.observe(f"{self.name}.rejected.{stage}", 0.0, error=True)
+            raise Saturated(self.retry_after)
+        t0 = time.perf_counter()
+        self._count(1)
+        sampler = metrics.active_sampler()
+
+        def _task():
+            metrics.observe(f"{self.name}.wait.{stage}", time.perf_counter() - t0)
+            if sampler is None:
+                return fn(*args, **kwargs)
+            # A profiled request is only waiting here; sample the worker doing its work
+            with sampler.delegate():
+                return fn(*args, **kwargs)
+
+        try:
+            return self._pool.submit(_task).result()
+        finally:
+            self._count(-1)
+            self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        # Tasks running or queued in this process, and the capacity before requests are rejected
+        return {"inflight": self._inflight, "workers": self.workers, "capacity": self.capacity}
+
+
+_default = BoundedExecutor("compute", COMPUTE_WORKERS, COMPUTE_QUEUE)
+
+
+def run(stage: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    # Request work on the shared compute executor; see BoundedExecutor.run
+    return _default.run(stage, fn, *args, **kwargs)
+
+
+def stats() -> Dict[str, int]:
+    return _default.stats()
@@ -1,8 +1,18 @@
 import pandas as pd
-from typing import Any, Dict, List
-import plotly.graph_objects as go
+import numpy as np
+from typing import Any, Dict, List, Optional
+import plotly.io as pio
 import json
-from plotly.utils import PlotlyJSONEncoder
+
+from .cache import LRUCache
+from . import db
+from . import grid as grids
+from . import metrics
+
+try:
+    import orjson
+except ImportError:  # optional speedup; falls back to the NumPy-aware json path
+    orjson = None
 
 # Metrics shown on dashboard
 METRICS = [
@@ -13,65 +23,222 @@ METRICS = [
     ("glucose", "Glucose (mg/dL)"),
 ]
 
-def build_timeseries_figures(df: pd.DataFrame) -> List[Dict[str, Any]]:
+# Point budget per metric for the normal-data trace; anomaly points are never dropped
+MAX_POINTS_DEFAULT = 2000
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+
+# Legend wording for db.SERIES_TIERS bucket widths
+TIER_LABELS = {60: "minute", 300: "5 min", 3600: "hour", 86400: "day"}
+
+# Encoded dashboard payloads, keyed by (user, data version, view params) by the caller
+payload_cache = LRUCache(max_entries=128, max_bytes=64 * 1024 * 1024)
+
+_template_json: Optional[str] = None
+
+def _json_default(o: Any) -> Any:
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    if isinstance(o, np.generic):
+        return o.item()
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+def encode_json(obj: Any) -> str:
+    """
+    Encodes plain dicts/lists holding NumPy arrays. Safe to embed in a <script> block.
+    """
+    if orjson is not None:
+        text = orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
+    else:
+        text = json.dumps(obj, default=_json_default, separators=(",", ":"))
+    return text.replace("</", "<\\/")
+
+def template_json() -> str:
+    # Plotly's default look, sent once per page instead of inside every figure layout
+    global _template_json
+    if _template_json is None:
+        _template_json = encode_json(pio.templates["plotly"].to_plotly_json())
+    return _template_json
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of `n_out` points that preserve the visual shape of (x, y).
+    x must be sorted ascending. The first and last points are always kept.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo = edges[i + 1]
+        nhi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nlo:nhi].mean()
+        avg_y = y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+def minmax_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
     """
-    Builds Plotly figures for dashboard time-series visualization.
-    Returns figures in JSON-safe dict form for Jinja templates.
+    Min/max bucketing: splits the time span into ~n_out/2 equal windows and keeps the
+    lowest and highest point of each. Fully vectorized.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.int64)
+    y = np.asarray(y, dtype=float)
+    n_buckets = max((n_out - 2) // 2, 1)  # leave room for the two endpoints
+    span = int(x[-1] - x[0]) + 1
+    bucket = ((x - x[0]) * n_buckets // span).astype(np.int64)
+    order = np.lexsort((y, bucket))
+    b_sorted = bucket[order]
+    starts = np.flatnonzero(np.r_[True, b_sorted[1:] != b_sorted[:-1]])
+    ends = np.r_[starts[1:], n] - 1
+    keep = np.union1d(order[starts], order[ends])
+    return np.union1d(keep, [0, n - 1])
+
+def downsample_indices(x: np.ndarray, y: np.ndarray, max_points: int, method: str = "lttb") -> np.ndarray:
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"Unknown downsampling method: {method}")
+    if method == "minmax":
+        return minmax_indices(x, y, max_points)
+    return lttb_indices(x, y, max_points)
+
+def load_view_frame(user_id: int, start: Any = None, end: Any = None, max_points: int = MAX_POINTS_DEFAULT,
+                    metrics: Optional[List[str]] = None, grid: Optional[str] = None,
+                    db_path: str = db.DB_PATH_DEFAULT) -> pd.DataFrame:
+    """
+    Data for a dashboard view of [start, end): raw records when the range is small enough to
+    show in full, otherwise the coarsest pre-aggregated tier that still yields `max_points`
+    buckets (db.pick_series_tier), so long ranges read thousands of rows instead of millions.
+    Ranges reaching into archived history (modules.retention) use the finest tier instead of raw rows.
+    With `grid` (a preprocessing.GRID_STEPS name) the view is the user's shared resampled grid
+    (modules.grid) instead; the frame is then shared and must not be modified.
+    """
+    if grid is not None:
+        return grids.load(user_id, grid, start, end, db_path=db_path)
+    tier = db.pick_series_tier(user_id, start, end, max_points, db_path)
+    if tier is None:
+        mark = db.get_archive_watermark(user_id, db_path)
+        if mark is not None and (start is None or pd.Timestamp(start).timestamp() < mark):
+            tier = db.SERIES_TIERS[0]
+    if tier is not None:
+        return db.load_series_frame(user_id, tier, columns=metrics, start=start, end=end, db_path=db_path)
+    columns = None if metrics is None else list(metrics) + ["anomaly_flag", "anomaly_drivers"]
+    return db.load_health_frame(user_id, columns=columns, start=start, end=end, db_path=db_path)
+
+def view_summary(df: pd.DataFrame) -> Dict[str, Any]:
+    # Record and anomaly counts for raw or tier frames
+    if df.attrs.get("tier"):
+        total, flagged = int(df["record_count"].sum()), int(df["anomaly_count"].sum())
+    else:
+        total = int(len(df))
+        flagged = int(df["anomaly_flag"].sum()) if "anomaly_flag" in df.columns else 0
+    return {"total_records": total, "anomaly_count": flagged,
+            "anomaly_rate": round(100.0 * flagged / max(total, 1), 2)}
+
+def _iso(ts_ns: np.ndarray) -> List[str]:
+    return ts_ns.astype("datetime64[ns]").astype("datetime64[s]").astype(str).tolist()
+
+@metrics.timed("dashboard.build_timeseries_figures", rows=metrics.first_arg_len,
+               bytes_out=lambda figs, *a, **k: sum(len(f["data_json"]) + len(f["layout_json"]) for f in figs))
+def build_timeseries_figures(df: pd.DataFrame, max_points: Optional[int] = MAX_POINTS_DEFAULT,
+                             method: str = "lttb", metrics: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Builds Plotly trace/layout payloads for dashboard time-series visualization.
+    Returns figures with pre-encoded `data_json`/`layout_json` strings for Jinja templates.
+    Normal points are reduced to `max_points` per metric; anomaly points are always kept.
+    Tier frames from db.load_series_frame plot bucket means with a min/max band, and mark
+    buckets that hold flagged readings; resampled grids (modules.grid) plot the same way.
     """
 
     figs = []
+    tier = df.attrs.get("tier")
+    rules = df.attrs.get("rules", {})  # resampled grids: "sum" columns plot totals per step
 
     # Ensure ordering
     df = df.sort_values("timestamp")
 
+    # Shared across metrics: timestamps as int64 ns and the anomaly masks
+    ts = df["timestamp"].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    if "anomaly_flag" in df.columns:
+        flags = df["anomaly_flag"].fillna(0).to_numpy(dtype=float)
+    else:
+        flags = np.zeros(len(df))
+    is_anomaly = flags == 1
+    is_normal = flags == 0
+    drivers = df["anomaly_drivers"].fillna("").to_numpy(dtype=object) if "anomaly_drivers" in df.columns else None
+    if tier:
+        counts = df["anomaly_count"].to_numpy()
+        is_anomaly = counts > 0
+        is_normal = np.ones(len(df), dtype=bool)
+        drivers = np.full(len(df), "", dtype=object)
+        drivers[is_anomaly] = [f"{n} flagged reading{'s' if n > 1 else ''}" for n in counts[is_anomaly]]
+
     for metric, title in METRICS:
         if metric not in df.columns:
             continue
+        if metrics is not None and metric not in metrics:
+            continue
 
-        normal = df[df.get("anomaly_flag", 0) == 0]
-        anomalies = df[df.get("anomaly_flag", 0) == 1]
-
-        fig = go.Figure()
+        y = df[metric].to_numpy(dtype=float)
+        present = ~np.isnan(y)
 
         # Normal data trace
-        fig.add_trace(go.Scatter(
-            x=normal["timestamp"],
-            y=normal[metric],
-            mode="lines+markers",
-            name="Normal",
-        ))
+        normal_idx = np.flatnonzero(is_normal & present)
+        if max_points is not None and len(normal_idx) > max_points:
+            keep = downsample_indices(ts[normal_idx], y[normal_idx], max_points, method)
+            normal_idx = normal_idx[keep]
+        x = _iso(ts[normal_idx])
+        data = []
+        if tier and f"{metric}_min" in df.columns:
+            # Band between bucket minima and maxima, drawn under the mean line
+            band = {"type": "scatter", "x": x, "mode": "lines", "line": {"width": 0}, "hoverinfo": "skip"}
+            data.append(dict(band, y=df[f"{metric}_min"].to_numpy(dtype=float)[normal_idx], showlegend=False))
+            data.append(dict(band, y=df[f"{metric}_max"].to_numpy(dtype=float)[normal_idx], fill="tonexty",
+                             name="Range"))
+        data.append({
+            "type": "scatter",
+            "x": x,
+            "y": y[normal_idx],
+            "mode": "lines+markers",
+            "name": f"{'Total' if rules.get(metric) == 'sum' else 'Mean'} per {TIER_LABELS.get(tier, f'{tier}s')}"
+                    if tier else "Normal",
+        })
 
         # Anomaly trace
-        if len(anomalies) > 0:
-            fig.add_trace(go.Scatter(
-                x=anomalies["timestamp"],
-                y=anomalies[metric],
-                mode="markers",
-                name="Anomaly",
-                marker=dict(size=10, symbol="circle-open"),
-                hovertext=anomalies.get("anomaly_drivers", ""),
-            ))
-
-        fig.update_layout(
-            margin=dict(l=20, r=20, t=40, b=20),
-            height=360,
-            xaxis_title="Time",
-            yaxis_title=title,
-        )
-
-        # Convert figure to JSON-safe structure
-        fig_dict = fig.to_plotly_json()
-
-        # Sanitize numpy arrays & timestamps
-        fig_dict = json.loads(
-            json.dumps(fig_dict, cls=PlotlyJSONEncoder)
-        )
+        anomaly_idx = np.flatnonzero(is_anomaly & present)
+        if len(anomaly_idx) > 0:
+            data.append({
+                "type": "scatter",
+                "x": _iso(ts[anomaly_idx]),
+                "y": y[anomaly_idx],
+                "mode": "markers",
+                "name": "Anomaly",
+                "marker": {"size": 10, "symbol": "circle-open"},
+                "hovertext": drivers[anomaly_idx].tolist() if drivers is not None else "",
+            })
+
+        layout = {
+            "margin": {"l": 20, "r": 20, "t": 40, "b": 20},
+            "height": 360,
+            "xaxis": {"title": {"text": "Time"}},
+            "yaxis": {"title": {"text": title}},
+        }
 
         figs.append({
             "title": title,
+            "metric": metric,
             "div_id": f"fig_{metric}",
-            "data": fig_dict["data"],
-            "layout": fig_dict["layout"],
+            "data_json": encode_json(data),
+            "layout_json": encode_json(layout),
         })
 
     return figs
@@ -1,15 +1,92 @@
 import os
 import sqlite3
-from typing import Any, Dict, List, Optional, Tuple
+import threading
+import time
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from . import metrics
 
 DB_PATH_DEFAULT = os.path.join("instance", "app.db")
 
-def get_conn(db_path: str = DB_PATH_DEFAULT) -> sqlite3.Connection:
+# Column order of the tuples accepted by insert_health_tuples (after user_id)
+HEALTH_COLUMNS = [
+    "timestamp", "heart_rate", "steps", "sleep_hours", "calories",
+    "blood_pressure_systolic", "blood_pressure_diastolic", "glucose",
+    "anomaly_flag", "anomaly_score", "anomaly_drivers",
+]
+INSERT_CHUNK_SIZE = 50_000
+
+# ts (integer epoch seconds, UTC) is derived from the timestamp parameter (?2) inside SQLite
+_INSERT_HEALTH_SQL = (
+    "INSERT OR IGNORE INTO health_records (user_id, " + ", ".join(HEALTH_COLUMNS) + ", ts) "
+    "VALUES (" + ", ".join(f"?{i}" for i in range(1, len(HEALTH_COLUMNS) + 2)) + ", "
+    "CAST(strftime('%s', ?2) AS INTEGER))"
+)
+
+# Metrics aggregated per user and day in daily_rollups (count/sum/min/max each)
+ROLLUP_METRICS = [
+    "heart_rate", "steps", "sleep_hours", "calories",
+    "blood_pressure_systolic", "blood_pressure_diastolic", "glucose",
+]
+
+# Pre-aggregated tiers in series_rollups: bucket widths in seconds (5 min, hourly, daily),
+# kept current on insert like daily_rollups; long views read these instead of raw rows
+SERIES_TIERS = (300, 3600, 86400)
+
+# Columns that may be requested through get_health_records(columns=...)
+HEALTH_SELECTABLE = ["record_id", "user_id"] + HEALTH_COLUMNS + ["ts"]
+
+# Text columns returned by load_health_frame as object arrays; every other column is float64
+HEALTH_TEXT_COLUMNS = {"anomaly_drivers"}
+LOAD_BATCH_ROWS = 50_000
+
+# Applied to every new connection. WAL lets readers run alongside the writer.
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+]
+
+# One connection per (thread, db file), reused across calls and requests
+_local = threading.local()
+
+def _open_conn(db_path: str) -> sqlite3.Connection:
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    new = not os.path.exists(db_path) or os.path.getsize(db_path) == 0
     conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row
+    if new:
+        # New files free pages on demand (PRAGMA incremental_vacuum). This must precede the
+        # WAL switch, which writes the header; older files are converted by modules.retention.
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    for p in PRAGMAS:
+        conn.execute(p)
+    return conn
+
+def get_conn(db_path: str = DB_PATH_DEFAULT) -> sqlite3.Connection:
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(db_path)
+    if conn is None:
+        conn = conns[db_path] = _open_conn(db_path)
     return conn
 
+def close_conn(db_path: Optional[str] = None) -> None:
+    # Close this thread's cached connection(s); the next get_conn reopens
+    conns = getattr(_local, "conns", {})
+    for path in ([db_path] if db_path is not None else list(conns)):
+        conn = conns.pop(path, None)
+        if conn is not None:
+            conn.close()
+
 def init_db(db_path: str = DB_PATH_DEFAULT) -> None:
     conn = get_conn(db_path)
     cur = conn.cursor()
@@ -38,29 +115,272 @@ def init_db(db_path: str = DB_PATH_DEFAULT) -> None:
         glucose REAL,
         anomaly_flag INTEGER DEFAULT 0,
         anomaly_score REAL,
+        anomaly_drivers TEXT,
+        ts INTEGER,
         FOREIGN KEY(user_id) REFERENCES users(user_id)
     );
     """)
     conn.commit()
-    conn.close()
+    _migrate(conn)
+
+def _ensure_column(cur: sqlite3.Cursor, table: str, column: str, decl: str) -> None:
+    cols = {r["name"] for r in cur.execute(f"PRAGMA table_info({table})").fetchall()}
+    if column not in cols:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def _m001_anomaly_drivers(cur: sqlite3.Cursor) -> None:
+    _ensure_column(cur, "health_records", "anomaly_drivers", "TEXT")
+
+def _m002_user_timestamp_index(cur: sqlite3.Cursor) -> None:
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_health_user_ts ON health_records(user_id, timestamp)")
+
+def _m003_data_versions(cur: sqlite3.Cursor) -> None:
+    # Per-user token that changes whenever the user's records change; used as a cache key
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS data_versions (
+        user_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL
+    );
+    """)
+
+def _m004_jobs(cur: sqlite3.Cursor) -> None:
+    # Background job state, shared by every worker process
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        job_id TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        status TEXT NOT NULL,
+        stage TEXT,
+        rows_processed INTEGER NOT NULL DEFAULT 0,
+        bytes_total INTEGER,
+        bytes_done INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        worker_pid INTEGER,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        updated_at REAL NOT NULL,
+        finished_at REAL
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_user_created ON jobs(user_id, created_at)")
+
+def _rollup_columns_sql() -> str:
+    return ",\n".join(
+        f"        {m}_count INTEGER NOT NULL DEFAULT 0, {m}_sum REAL NOT NULL DEFAULT 0, {m}_min REAL, {m}_max REAL"
+        for m in ROLLUP_METRICS
+    )
+
+def _m005_daily_rollups(cur: sqlite3.Cursor) -> None:
+    # Materialized per-user, per-day aggregates; kept current by insert_health_tuples
+    cur.execute(f"""
+    CREATE TABLE IF NOT EXISTS daily_rollups (
+        user_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        record_count INTEGER NOT NULL DEFAULT 0,
+        anomaly_count INTEGER NOT NULL DEFAULT 0,
+{_rollup_columns_sql()},
+        PRIMARY KEY (user_id, day)
+    );
+    """)
+    _apply_rollups(cur, "1 = 1", ())
+
+def _m006_settings_and_rescore(cur: sqlite3.Cursor) -> None:
+    # App-wide key/value settings (e.g. model contamination) and batch rescore bookkeeping
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS settings (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS rescore_runs (
+        run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        contamination REAL NOT NULL,
+        feature_cols TEXT NOT NULL,
+        status TEXT NOT NULL,
+        workers INTEGER NOT NULL,
+        rows_scored INTEGER NOT NULL DEFAULT 0,
+        seconds REAL NOT NULL DEFAULT 0,
+        error TEXT,
+        created_at REAL NOT NULL,
+        finished_at REAL
+    );
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS rescore_progress (
+        run_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        rows_scored INTEGER NOT NULL,
+        seconds REAL NOT NULL,
+        PRIMARY KEY (run_id, user_id)
+    );
+    """)
+
+def _m007_user_detector_engine(cur: sqlite3.Cursor) -> None:
+    _ensure_column(cur, "users", "detector_engine", "TEXT NOT NULL DEFAULT 'isolation_forest'")
+
+def _m008_unique_user_timestamp(cur: sqlite3.Cursor) -> None:
+    # One reading per user and timestamp: keep the earliest copy of existing duplicates,
+    # then let the unique index (which replaces idx_health_user_ts) reject repeats
+    cur.execute("""
+    SELECT DISTINCT user_id FROM health_records
+    WHERE record_id NOT IN (SELECT MIN(record_id) FROM health_records GROUP BY user_id, timestamp)
+    """)
+    affected = [r["user_id"] for r in cur.fetchall()]
+    if affected:
+        cur.execute("""
+        DELETE FROM health_records
+        WHERE record_id NOT IN (SELECT MIN(record_id) FROM health_records GROUP BY user_id, timestamp)
+        """)
+        for uid in affected:
+            _rebuild_daily_rollups(cur, uid)
+        _bump_data_versions(cur, affected)
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_health_user_ts ON health_records(user_id, timestamp)")
+    cur.execute("DROP INDEX IF EXISTS idx_health_user_ts")
+
+def _m009_api_tokens(cur: sqlite3.Cursor) -> None:
+    # Bearer tokens for device gateways; only a SHA-256 of each token is stored
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS api_tokens (
+        token_hash TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        last_used_at REAL,
+        FOREIGN KEY(user_id) REFERENCES users(user_id)
+    );
+    """)
+
+def _m010_epoch_ts(cur: sqlite3.Cursor) -> None:
+    # Integer epoch copy of the ISO timestamp so loaders never parse strings
+    _ensure_column(cur, "health_records", "ts", "INTEGER")
+    cur.execute("UPDATE health_records SET ts = CAST(strftime('%s', timestamp) AS INTEGER) WHERE ts IS NULL")
+
+def _m011_series_rollups(cur: sqlite3.Cursor) -> None:
+    # Per-user aggregates at every SERIES_TIERS width, keyed by bucket start (epoch seconds)
+    cur.execute(f"""
+    CREATE TABLE IF NOT EXISTS series_rollups (
+        user_id INTEGER NOT NULL,
+        tier INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        record_count INTEGER NOT NULL DEFAULT 0,
+        anomaly_count INTEGER NOT NULL DEFAULT 0,
+{_rollup_columns_sql()},
+        PRIMARY KEY (user_id, tier, bucket)
+    ) WITHOUT ROWID;
+    """)
+    # daily_rollups are rebuilt from the same pass so both tables cover exactly the rows with a ts
+    cur.execute("DELETE FROM daily_rollups")
+    _fold_rollups(cur, "1 = 1", ())
+
+def _m012_retention(cur: sqlite3.Cursor) -> None:
+    # Catalog of archived raw-record ranges (modules.retention) and retention run history.
+    # A user's newest archive end_ts is their watermark: older raw rows live only in archives.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS archives (
+        archive_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        start_ts INTEGER NOT NULL,
+        end_ts INTEGER NOT NULL,
+        rows INTEGER NOT NULL,
+        bytes INTEGER NOT NULL,
+        path TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        FOREIGN KEY(user_id) REFERENCES users(user_id)
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_archives_user_end ON archives(user_id, end_ts)")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS retention_runs (
+        run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        status TEXT NOT NULL,
+        users INTEGER NOT NULL DEFAULT 0,
+        rows_archived INTEGER NOT NULL DEFAULT 0,
+        rows_deleted INTEGER NOT NULL DEFAULT 0,
+        archive_bytes INTEGER NOT NULL DEFAULT 0,
+        db_bytes_before INTEGER,
+        db_bytes_after INTEGER,
+        seconds REAL NOT NULL DEFAULT 0,
+        error TEXT,
+        started_at REAL NOT NULL,
+        finished_at REAL
+    );
+    """)
+
+def _m013_sessions_and_counts(cur: sqlite3.Cursor) -> None:
+    # Server-side login sessions (the cookie carries an opaque id; only its SHA-256 is stored)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS sessions (
+        sid_hash TEXT PRIMARY KEY,
+        user_id INTEGER,
+        data TEXT NOT NULL,
+        expires_at REAL NOT NULL,
+        created_at REAL NOT NULL
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions(user_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)")
+    # Raw record count per user, maintained by every writer so counters never scan health_records
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS record_counts (
+        user_id INTEGER PRIMARY KEY,
+        records INTEGER NOT NULL
+    );
+    """)
+    cur.execute("DELETE FROM record_counts")
+    cur.execute("INSERT INTO record_counts(user_id, records) SELECT user_id, COUNT(*) FROM health_records GROUP BY user_id")
+
+def _m014_rescore_worker_pid(cur: sqlite3.Cursor) -> None:
+    # Process running a rescore, so app workers and the CLI can tell a live run from an orphan
+    _ensure_column(cur, "rescore_runs", "worker_pid", "INTEGER")
+
+# Schema migrations, applied in order; PRAGMA user_version records the last one applied
+MIGRATIONS: List[Callable[[sqlite3.Cursor], None]] = [
+    _m001_anomaly_drivers,
+    _m002_user_timestamp_index,
+    _m003_data_versions,
+    _m004_jobs,
+    _m005_daily_rollups,
+    _m006_settings_and_rescore,
+    _m007_user_detector_engine,
+    _m008_unique_user_timestamp,
+    _m009_api_tokens,
+    _m010_epoch_ts,
+    _m011_series_rollups,
+    _m012_retention,
+    _m013_sessions_and_counts,
+    _m014_rescore_worker_pid,
+]
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    version = int(conn.execute("PRAGMA user_version").fetchone()[0])
+    for i, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        with conn:
+            cur = conn.cursor()
+            migration(cur)
+            cur.execute(f"PRAGMA user_version = {i}")
 
 def create_user(username: str, password_hash: str, role: str = "user", email: str = None,
                 db_path: str = DB_PATH_DEFAULT) -> None:
     conn = get_conn(db_path)
+    with conn:
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT OR IGNORE INTO users(username, password_hash, role, email) VALUES(?,?,?,?)",
+            (username, password_hash, role, email)
+        )
+
+def get_user_by_id(user_id: int, db_path: str = DB_PATH_DEFAULT):
+    conn = get_conn(db_path)
     cur = conn.cursor()
-    cur.execute(
-        "INSERT OR IGNORE INTO users(username, password_hash, role, email) VALUES(?,?,?,?)",
-        (username, password_hash, role, email)
-    )
-    conn.commit()
-    conn.close()
+    cur.execute("SELECT user_id, username, role, email FROM users WHERE user_id = ?", (user_id,))
+    return cur.fetchone()
 
 def get_user_by_username(username: str, db_path: str = DB_PATH_DEFAULT):
     conn = get_conn(db_path)
     cur = conn.cursor()
     cur.execute("SELECT * FROM users WHERE username = ?", (username,))
     row = cur.fetchone()
-    conn.close()
     return row
 
 def list_users(db_path: str = DB_PATH_DEFAULT):
@@ -68,21 +388,346 @@ def list_users(db_path: str = DB_PATH_DEFAULT):
     cur = conn.cursor()
     cur.execute("SELECT user_id, username, role, email FROM users ORDER BY user_id ASC")
     rows = cur.fetchall()
-    conn.close()
     return rows
 
-def insert_health_records(user_id: int, rows: List[Dict[str, Any]], db_path: str = DB_PATH_DEFAULT) -> None:
+def set_user_role(user_id: int, role: str, db_path: str = DB_PATH_DEFAULT) -> None:
+    conn = get_conn(db_path)
+    with conn:
+        conn.execute("UPDATE users SET role = ? WHERE user_id = ?", (role, user_id))
+
+def set_user_password(user_id: int, password_hash: str, db_path: str = DB_PATH_DEFAULT) -> None:
+    conn = get_conn(db_path)
+    with conn:
+        conn.execute("UPDATE users SET password_hash = ? WHERE user_id = ?", (password_hash, user_id))
+
+def delete_user(user_id: int, db_path: str = DB_PATH_DEFAULT) -> None:
+    # The account, its API tokens and sessions; health data goes through delete_user_records
+    conn = get_conn(db_path)
+    with conn:
+        conn.execute("DELETE FROM api_tokens WHERE user_id = ?", (user_id,))
+        conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+        conn.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+
+def create_api_token(user_id: int, token_hash: str, db_path: str = DB_PATH_DEFAULT) -> None:
+    conn = get_conn(db_path)
+    with conn:
+        conn.execute(
+            "INSERT INTO api_tokens(token_hash, user_id, created_at) VALUES(?, ?, ?)",
+            (token_hash, user_id, time.time())
+        )
+
+def load_session(sid_hash: str, db_path: str = DB_PATH_DEFAULT):
+    # (user_id, data, expires_at) of an unexpired session, or None
     conn = get_conn(db_path)
     cur = conn.cursor()
+    cur.execute("SELECT user_id, data, expires_at FROM sessions WHERE sid_hash = ? AND expires_at > ?",
+                (sid_hash, time.time()))
+    return cur.fetchone()
+
+def save_session(sid_hash: str, user_id: Optional[int], data: str, expires_at: float,
+                 db_path: str = DB_PATH_DEFAULT) -> None:
+    conn = get_conn(db_path)
+    with conn:
+        conn.execute(
+            "INSERT INTO sessions(sid_hash, user_id, data, expires_at, created_at) VALUES(?,?,?,?,?) "
+            "ON CONFLICT(sid_hash) DO UPDATE SET user_id = excluded.user_id, data = excluded.data, "
+            "expires_at = excluded.expires_at",
+            (sid_hash, user_id, data, expires_at, time.time()))
+
+def delete_sessions(sid_hash: Optional[str] = None, user_id: Optional[int] = None, expired: bool = False,
+                    db_path: str = DB_PATH_DEFAULT) -> int:
+    # One session, all of a user's sessions, or (expired=True) every expired one
+    conn = get_conn(db_path)
+    with conn:
+        if sid_hash is not None:
+            cur = conn.execute("DELETE FROM sessions WHERE sid_hash = ?", (sid_hash,))
+        elif user_id is not None:
+            cur = conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+        elif expired:
+            cur = conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),))
+        else:
+            raise ValueError("Give a session, a user or expired=True.")
+    return cur.rowcount
+
+def get_api_token_user(token_hash: str, db_path: str = DB_PATH_DEFAULT):
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT u.user_id, u.username, u.role FROM api_tokens t JOIN users u ON u.user_id = t.user_id "
+        "WHERE t.token_hash = ?",
+        (token_hash,)
+    )
+    row = cur.fetchone()
+    if row is not None:
+        with conn:
+            conn.execute("UPDATE api_tokens SET last_used_at = ? WHERE token_hash = ?", (time.time(), token_hash))
+    return row
+
+def count_api_tokens(user_id: int, db_path: str = DB_PATH_DEFAULT) -> int:
+    conn = get_conn(db_path)
+    return int(conn.execute("SELECT COUNT(*) FROM api_tokens WHERE user_id = ?", (user_id,)).fetchone()[0])
+
+def delete_api_tokens(user_id: int, db_path: str = DB_PATH_DEFAULT) -> None:
+    conn = get_conn(db_path)
+    with conn:
+        conn.execute("DELETE FROM api_tokens WHERE user_id = ?", (user_id,))
+
+def get_user_engine(user_id: int, db_path: str = DB_PATH_DEFAULT) -> str:
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT detector_engine FROM users WHERE user_id = ?", (user_id,))
+    row = cur.fetchone()
+    return row["detector_engine"] if row else "isolation_forest"
+
+def set_user_engine(user_id: int, engine: str, db_path: str = DB_PATH_DEFAULT) -> None:
+    conn = get_conn(db_path)
+    with conn:
+        conn.execute("UPDATE users SET detector_engine = ? WHERE user_id = ?", (engine, user_id))
+
+@metrics.timed("db.insert_health_tuples", rows=lambda n, *a, **k: n)
+def insert_health_tuples(rows: Iterable[Sequence[Any]], chunk_size: int = INSERT_CHUNK_SIZE,
+                         db_path: str = DB_PATH_DEFAULT) -> int:
+    # rows are (user_id, *HEALTH_COLUMNS) tuples; chunks share one transaction.
+    # Rows whose (user_id, timestamp) already exists are skipped; returns the number inserted.
+    conn = get_conn(db_path)
+    it = iter(rows)
+    n = 0
+    with conn:  # commit, or roll back the whole batch on error
+        cur = conn.cursor()
+        _begin_write(conn)
+        last_id = _max_record_id(cur)
+        while True:
+            chunk = list(islice(it, chunk_size))
+            if not chunk:
+                break
+            cur.executemany(_INSERT_HEALTH_SQL, chunk)
+            n += cur.rowcount
+        # Ranges already archived keep their rollups; re-sent rows there would be counted twice
+        cur.execute(
+            "DELETE FROM health_records WHERE record_id > ? AND ts < "
+            "(SELECT MAX(end_ts) FROM archives WHERE archives.user_id = health_records.user_id)", (last_id,))
+        n -= cur.rowcount
+        _bump_data_versions(cur, _count_new_records(cur, last_id))
+        _fold_rollups(cur, "record_id > ?", (last_id,))
+    return n
+
+def _rollup_sql() -> Tuple[str, str, str]:
+    # (aggregate columns, SELECT expressions, ON CONFLICT merge) shared by both rollup tables
+    select = ", ".join(
+        f"COUNT({m}), TOTAL({m}), MIN({m}), MAX({m})" for m in ROLLUP_METRICS
+    )
+    cols = ", ".join(f"{m}_count, {m}_sum, {m}_min, {m}_max" for m in ROLLUP_METRICS)
+    updates = ",\n".join(
+        f"{m}_count = {m}_count + excluded.{m}_count, {m}_sum = {m}_sum + excluded.{m}_sum, "
+        f"{m}_min = MIN(COALESCE({m}_min, excluded.{m}_min), COALESCE(excluded.{m}_min, {m}_min)), "
+        f"{m}_max = MAX(COALESCE({m}_max, excluded.{m}_max), COALESCE(excluded.{m}_max, {m}_max))"
+        for m in ROLLUP_METRICS
+    )
+    return cols, select, updates
+
+def _apply_rollups(cur: sqlite3.Cursor, where: str, params: Tuple[Any, ...]) -> None:
+    # Fold the health_records rows matching `where` into daily_rollups by text day. Only for
+    # migrations that run before ts and series_rollups exist; later writes use _fold_rollups.
+    cols, select, updates = _rollup_sql()
+    cur.execute(f"""
+        INSERT INTO daily_rollups (user_id, day, record_count, anomaly_count, {cols})
+        SELECT user_id, substr(timestamp, 1, 10), COUNT(*), CAST(TOTAL(anomaly_flag = 1) AS INTEGER), {select}
+        FROM health_records WHERE {where}
+        GROUP BY user_id, substr(timestamp, 1, 10)
+        ON CONFLICT(user_id, day) DO UPDATE SET
+        record_count = record_count + excluded.record_count,
+        anomaly_count = anomaly_count + excluded.anomaly_count,
+        {updates}
+    """, params)
+
+def _fold_rollups(cur: sqlite3.Cursor, where: str, params: Tuple[Any, ...]) -> None:
+    # Fold the health_records rows matching `where` into daily_rollups and every series_rollups
+    # tier. Rows are aggregated once at the finest tier width; days and coarser tiers merge
+    # those partials instead of rescanning raw rows.
+    cols, _, updates = _rollup_sql()
+    merge = ", ".join(
+        f"SUM({m}_count), SUM({m}_sum), MIN({m}_min), MAX({m}_max)" for m in ROLLUP_METRICS
+    )
+    finest = SERIES_TIERS[0]
+    cur.execute("DROP TABLE IF EXISTS temp.rollup_delta")
+    cur.execute(f"""
+        CREATE TEMP TABLE rollup_delta AS
+        SELECT user_id, ts - ts % {finest} AS bucket, COUNT(*) AS record_count,
+               CAST(TOTAL(anomaly_flag = 1) AS INTEGER) AS anomaly_count, {", ".join(
+                   f"COUNT({m}) AS {m}_count, TOTAL({m}) AS {m}_sum, MIN({m}) AS {m}_min, MAX({m}) AS {m}_max"
+                   for m in ROLLUP_METRICS)}
+        FROM health_records WHERE ts IS NOT NULL AND {where}
+        GROUP BY user_id, ts - ts % {finest}
+    """, params)
+    merged = f"SUM(record_count), SUM(anomaly_count), {merge} FROM temp.rollup_delta WHERE 1"
+    counts = ("record_count = record_count + excluded.record_count, "
+              "anomaly_count = anomaly_count + excluded.anomaly_count")
+    cur.execute(f"""
+        INSERT INTO daily_rollups (user_id, day, record_count, anomaly_count, {cols})
+        SELECT user_id, date(bucket, 'unixepoch'), {merged} GROUP BY user_id, date(bucket, 'unixepoch')
+        ON CONFLICT(user_id, day) DO UPDATE SET {counts}, {updates}
+    """)
+    for tier in SERIES_TIERS:
+        if tier == finest:
+            source = f"SELECT user_id, {tier}, bucket, record_count, anomaly_count, {cols} FROM temp.rollup_delta WHERE 1"
+        else:
+            source = f"SELECT user_id, {tier}, bucket - bucket % {tier}, {merged} GROUP BY user_id, bucket - bucket % {tier}"
+        cur.execute(f"""
+            INSERT INTO series_rollups (user_id, tier, bucket, record_count, anomaly_count, {cols})
+            {source}
+            ON CONFLICT(user_id, tier, bucket) DO UPDATE SET {counts}, {updates}
+        """)
+    cur.execute("DROP TABLE temp.rollup_delta")
+
+def _rebuild_daily_rollups(cur: sqlite3.Cursor, user_id: int) -> None:
+    # Pre-m011 migrations only; see _rebuild_rollups
+    cur.execute("DELETE FROM daily_rollups WHERE user_id = ?", (user_id,))
+    _apply_rollups(cur, "user_id = ?", (user_id,))
+
+def _rebuild_rollups(cur: sqlite3.Cursor, user_id: int) -> None:
+    # Both rollup tables, e.g. after anomaly flags were rewritten. Buckets before the archive
+    # watermark (a day boundary) are kept: their raw rows are gone or only rehydrated copies.
+    mark = _archive_watermark(cur, user_id) or 0
+    cur.execute("DELETE FROM daily_rollups WHERE user_id = ? AND day >= date(?, 'unixepoch')", (user_id, mark))
+    cur.execute("DELETE FROM series_rollups WHERE user_id = ? AND bucket >= ?", (user_id, mark))
+    _fold_rollups(cur, "user_id = ? AND ts >= ?", (user_id, mark))
+
+def _archive_watermark(cur: sqlite3.Cursor, user_id: int) -> Optional[int]:
+    return cur.execute("SELECT MAX(end_ts) FROM archives WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+def rebuild_daily_rollups(user_id: int, db_path: str = DB_PATH_DEFAULT) -> None:
+    # Recomputes daily_rollups and the series_rollups tiers for one user
+    conn = get_conn(db_path)
+    with conn:
+        cur = conn.cursor()
+        _rebuild_rollups(cur, user_id)
+        _bump_data_versions(cur, [user_id])
+
+@metrics.timed("db.cohort_user_totals", rows=metrics.result_len)
+def cohort_user_totals(start_day: Optional[str] = None, end_day: Optional[str] = None,
+                       db_path: str = DB_PATH_DEFAULT) -> pd.DataFrame:
+    """
+    One row per user with daily rollups in [start_day, end_day] (inclusive YYYY-MM-DD):
+    user_id, records, anomalies, days, first_day, last_day and, per metric, <m>_count,
+    <m>_sum, <m>_min and <m>_max. A single GROUP BY over daily_rollups, so archived
+    history counts too.
+    """
+    metric_cols = [f"{m}_{k}" for m in ROLLUP_METRICS for k in ("count", "sum", "min", "max")]
+    aggs = ", ".join(
+        f"SUM({m}_count), TOTAL({m}_sum), MIN({m}_min), MAX({m}_max)" for m in ROLLUP_METRICS
+    )
+    where, params = _day_range_where(start_day, end_day)
+    cur = get_conn(db_path).cursor()
+    cur.execute(
+        f"SELECT user_id, SUM(record_count), SUM(anomaly_count), COUNT(*), MIN(day), MAX(day), {aggs} "
+        f"FROM daily_rollups WHERE {where} GROUP BY user_id ORDER BY user_id", params)
+    return pd.DataFrame(cur.fetchall(), columns=["user_id", "records", "anomalies", "days", "first_day",
+                                                 "last_day"] + metric_cols)
+
+def cohort_weekly_counts(start_day: str, end_day: str, db_path: str = DB_PATH_DEFAULT) -> pd.DataFrame:
+    # user_id, week (0 = the 7 days from start_day), records, anomalies over [start_day, end_day]
+    cur = get_conn(db_path).cursor()
+    cur.execute(
+        "SELECT user_id, CAST((julianday(day) - julianday(?)) / 7 AS INTEGER) AS week, "
+        "SUM(record_count), SUM(anomaly_count) FROM daily_rollups WHERE day >= ? AND day <= ? "
+        "GROUP BY user_id, week", (start_day, start_day, end_day))
+    return pd.DataFrame(cur.fetchall(), columns=["user_id", "week", "records", "anomalies"])
+
+def latest_rollup_day(db_path: str = DB_PATH_DEFAULT) -> Optional[str]:
+    return get_conn(db_path).execute("SELECT MAX(day) FROM daily_rollups").fetchone()[0]
+
+def get_global_data_version(db_path: str = DB_PATH_DEFAULT) -> int:
+    # Changes whenever any user's records change
+    return int(get_conn(db_path).execute("SELECT COALESCE(MAX(version), 0) FROM data_versions").fetchone()[0])
+
+def _day_range_where(start_day: Optional[str], end_day: Optional[str]) -> Tuple[str, List[Any]]:
+    where, params = "1 = 1", []
+    if start_day is not None:
+        where += " AND day >= ?"
+        params.append(start_day)
+    if end_day is not None:
+        where += " AND day <= ?"
+        params.append(end_day)
+    return where, params
+
+@metrics.timed("db.get_daily_rollups", rows=metrics.result_len)
+def get_daily_rollups(user_id: int, start_day: Optional[str] = None, end_day: Optional[str] = None,
+                      db_path: str = DB_PATH_DEFAULT):
+    # start_day/end_day are inclusive YYYY-MM-DD strings
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    q = "SELECT * FROM daily_rollups WHERE user_id = ?"
+    params: List[Any] = [user_id]
+    if start_day is not None:
+        q += " AND day >= ?"
+        params.append(start_day)
+    if end_day is not None:
+        q += " AND day <= ?"
+        params.append(end_day)
+    cur.execute(q + " ORDER BY day ASC", tuple(params))
+    return cur.fetchall()
+
+def get_latest_rollup_day(user_id: int, db_path: str = DB_PATH_DEFAULT) -> Optional[str]:
+    # Newest YYYY-MM-DD in the user's daily rollups, which outlive archived raw records
+    row = get_conn(db_path).execute("SELECT MAX(day) FROM daily_rollups WHERE user_id = ?", (user_id,)).fetchone()
+    return row[0]
+
+def get_top_anomaly_drivers(user_id: int, start: Any = None, end: Any = None, limit: int = 3,
+                            db_path: str = DB_PATH_DEFAULT) -> List[str]:
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    q = ("SELECT anomaly_drivers, COUNT(*) AS c FROM health_records "
+         "WHERE user_id = ? AND anomaly_flag = 1 AND anomaly_drivers IS NOT NULL AND anomaly_drivers != ''")
+    params: List[Any] = [user_id]
+    if start is not None:
+        q += " AND timestamp >= ?"
+        params.append(_ts_param(start))
+    if end is not None:
+        q += " AND timestamp < ?"
+        params.append(_ts_param(end))
+    q += " GROUP BY anomaly_drivers ORDER BY c DESC LIMIT ?"
+    params.append(limit)
+    cur.execute(q, tuple(params))
+    return [r["anomaly_drivers"] for r in cur.fetchall()]
+
+def _begin_write(conn: sqlite3.Connection) -> None:
+    # Take the write lock before reading MAX(record_id): with the implicit deferred BEGIN,
+    # concurrent writers see the same last_id and fold each other's rows too
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+
+def _max_record_id(cur: sqlite3.Cursor) -> int:
+    return int(cur.execute("SELECT COALESCE(MAX(record_id), 0) AS m FROM health_records").fetchone()["m"])
+
+def _count_new_records(cur: sqlite3.Cursor, last_id: int) -> List[int]:
+    # Adds rows with record_id > last_id to record_counts; returns the users they belong to
+    cur.execute("SELECT user_id, COUNT(*) AS n FROM health_records WHERE record_id > ? GROUP BY user_id", (last_id,))
+    counts = [(r["user_id"], r["n"]) for r in cur.fetchall()]
+    cur.executemany(
+        "INSERT INTO record_counts(user_id, records) VALUES(?, ?) "
+        "ON CONFLICT(user_id) DO UPDATE SET records = records + excluded.records", counts)
+    return [u for u, _ in counts]
+
+def _bump_data_versions(cur: sqlite3.Cursor, user_ids: Iterable[int]) -> None:
+    # Wall-clock nanoseconds rather than a counter, so versions never repeat after reset_db
+    version = time.time_ns()
     cur.executemany(
-        """
-        INSERT INTO health_records (
-            user_id, timestamp, heart_rate, steps, sleep_hours, calories,
-            blood_pressure_systolic, blood_pressure_diastolic, glucose,
-            anomaly_flag, anomaly_score
-        ) VALUES (?,?,?,?,?,?,?,?,?,?,?)
-        """,
-        [
+        "INSERT INTO data_versions(user_id, version) VALUES(?, ?) "
+        "ON CONFLICT(user_id) DO UPDATE SET version = excluded.version",
+        [(int(u), version) for u in user_ids],
+    )
+
+def get_data_version(user_id: int, db_path: str = DB_PATH_DEFAULT) -> int:
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT version FROM data_versions WHERE user_id = ?", (user_id,))
+    row = cur.fetchone()
+    return int(row["version"]) if row else 0
+
+@metrics.timed("db.insert_health_records", rows=lambda _, user_id, rows, *a, **k: len(rows))
+def insert_health_records(user_id: int, rows: List[Dict[str, Any]], db_path: str = DB_PATH_DEFAULT) -> None:
+    insert_health_tuples(
+        (
             (
                 user_id,
                 r.get("timestamp"),
@@ -95,54 +740,600 @@ def insert_health_records(user_id: int, rows: List[Dict[str, Any]], db_path: str
                 r.get("glucose"),
                 int(r.get("anomaly_flag", 0)),
                 r.get("anomaly_score"),
+                r.get("anomaly_drivers") or None,
             )
             for r in rows
-        ]
+        ),
+        db_path=db_path,
     )
-    conn.commit()
-    conn.close()
 
-def get_health_records(user_id: int, limit: Optional[int] = None, db_path: str = DB_PATH_DEFAULT):
+def _ts_param(value: Any) -> str:
+    # Bounds compare against the stored ISO-8601 text
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+@metrics.timed("db.get_health_records", rows=metrics.result_len)
+def get_health_records(user_id: int, limit: Optional[int] = None, start: Any = None, end: Any = None,
+                       columns: Optional[List[str]] = None, db_path: str = DB_PATH_DEFAULT):
+    # start is inclusive, end exclusive; columns restricts the projection
+    if columns is None:
+        projection = "*"
+    else:
+        unknown = [c for c in columns if c not in HEALTH_SELECTABLE]
+        if unknown:
+            raise ValueError(f"Unknown health_records column(s): {', '.join(unknown)}")
+        projection = ", ".join(dict.fromkeys(["timestamp"] + list(columns)))
     conn = get_conn(db_path)
     cur = conn.cursor()
-    q = "SELECT * FROM health_records WHERE user_id = ? ORDER BY timestamp ASC"
-    params = [user_id]
+    q = f"SELECT {projection} FROM health_records WHERE user_id = ?"
+    params: List[Any] = [user_id]
+    if start is not None:
+        q += " AND timestamp >= ?"
+        params.append(_ts_param(start))
+    if end is not None:
+        q += " AND timestamp < ?"
+        params.append(_ts_param(end))
+    q += " ORDER BY timestamp ASC"
     if limit is not None:
         q += " LIMIT ?"
         params.append(limit)
     cur.execute(q, tuple(params))
     rows = cur.fetchall()
-    conn.close()
     return rows
 
+@metrics.timed("db.load_health_frame", rows=metrics.result_len)
+def load_health_frame(user_id: int, columns: Optional[List[str]] = None, start: Any = None, end: Any = None,
+                      batch_size: int = LOAD_BATCH_ROWS, db_path: str = DB_PATH_DEFAULT) -> pd.DataFrame:
+    """
+    Typed, time-ordered frame of a user's records: a datetime64[s] `timestamp` built from the
+    integer `ts` column, float64 for numeric columns and object for text columns.
+    A 2-D float block is preallocated from a COUNT and filled straight from fetchmany batches
+    of plain tuples; the DataFrame wraps it without copying. Same start/end semantics as
+    get_health_records.
+    """
+    columns = list(HEALTH_COLUMNS[1:]) if columns is None else \
+        [c for c in dict.fromkeys(columns) if c != "timestamp"]
+    unknown = [c for c in columns if c not in HEALTH_SELECTABLE]
+    if unknown:
+        raise ValueError(f"Unknown health_records column(s): {', '.join(unknown)}")
+    num_cols = [c for c in columns if c not in HEALTH_TEXT_COLUMNS]
+    text_cols = [c for c in columns if c in HEALTH_TEXT_COLUMNS]
+    where = "user_id = ? AND ts IS NOT NULL"
+    params: List[Any] = [user_id]
+    if start is not None:
+        where += " AND timestamp >= ?"
+        params.append(_ts_param(start))
+    if end is not None:
+        where += " AND timestamp < ?"
+        params.append(_ts_param(end))
+
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    cur.row_factory = None  # plain tuples; sqlite3.Row objects are not needed here
+    n = int(cur.execute(f"SELECT COUNT(*) FROM health_records WHERE {where}", params).fetchone()[0])
+    m = len(num_cols) + 1
+    block = np.empty((m, n), dtype=np.float64)  # row 0 holds ts; NULL -> NaN on assignment
+    texts = [np.empty(n, dtype=object) for _ in text_cols]
+    cur.execute(f"SELECT {', '.join(['ts'] + num_cols + text_cols)} FROM health_records "
+                f"WHERE {where} ORDER BY timestamp", params)
+    i = 0
+    while i < n:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        k = min(len(rows), n - i)  # rows inserted after the COUNT are left for the next load
+        if text_cols:
+            obj = np.array(rows[:k], dtype=object)
+            block.T[i:i + k] = obj[:, :m]
+            for j, arr in enumerate(texts):
+                arr[i:i + k] = obj[:, m + j]
+        else:
+            block.T[i:i + k] = rows[:k]
+        i += k
+    block, texts = block[:, :i], [arr[:i] for arr in texts]
+    if i > 1 and (np.diff(block[0]) < 0).any():
+        # Only legacy rows mixing "T"/space separators sort differently as text than as time
+        order = np.argsort(block[0], kind="stable")
+        block, texts = block[:, order], [arr[order] for arr in texts]
+
+    df = pd.DataFrame(block[1:].T, columns=num_cols, copy=False)
+    df.insert(0, "timestamp", block[0].astype(np.int64).view("datetime64[s]"))
+    for c, arr in zip(text_cols, texts):
+        df[c] = arr
+    return df
+
+def _epoch_param(value: Any) -> int:
+    # Naive timestamps are UTC, like the stored ts column
+    return int(pd.Timestamp(value).timestamp())
+
+def _series_where(user_id: int, tier: int, start: Any, end: Any) -> Tuple[str, List[Any]]:
+    # Buckets overlapping [start, end)
+    where = "user_id = ? AND tier = ?"
+    params: List[Any] = [user_id, tier]
+    if start is not None:
+        s = _epoch_param(start)
+        where += " AND bucket >= ?"
+        params.append(s - s % tier)
+    if end is not None:
+        where += " AND bucket < ?"
+        params.append(_epoch_param(end))
+    return where, params
+
+def pick_series_tier(user_id: int, start: Any = None, end: Any = None, max_points: int = 2000,
+                     db_path: str = DB_PATH_DEFAULT) -> Optional[int]:
+    """
+    Coarsest SERIES_TIERS width that still splits [start, end) into at least `max_points`
+    buckets, or None when raw rows should be read: the range holds no more than `max_points`
+    readings, or even the finest tier is too coarse. Span and count come from the daily tier.
+    """
+    where, params = _series_where(user_id, SERIES_TIERS[-1], start, end)
+    cur = get_conn(db_path).cursor()
+    cur.execute(f"SELECT MIN(bucket) AS lo, MAX(bucket) AS hi, SUM(record_count) AS n "
+                f"FROM series_rollups WHERE {where}", params)
+    row = cur.fetchone()
+    if not row["n"] or row["n"] <= max_points:
+        return None
+    lo = _epoch_param(start) if start is not None else row["lo"]
+    hi = _epoch_param(end) if end is not None else row["hi"] + SERIES_TIERS[-1]
+    resolution = (hi - lo) / max_points
+    fitting = [t for t in SERIES_TIERS if t <= resolution]
+    return max(fitting) if fitting else None
+
+@metrics.timed("db.load_series_frame", rows=metrics.result_len)
+def load_series_frame(user_id: int, tier: int, columns: Optional[List[str]] = None, start: Any = None,
+                      end: Any = None, db_path: str = DB_PATH_DEFAULT) -> pd.DataFrame:
+    """
+    One row per non-empty bucket of a series_rollups tier overlapping [start, end):
+    `timestamp` (bucket start), record_count, anomaly_count and, per metric, the mean as
+    `<metric>` plus `<metric>_min`, `<metric>_max` and `<metric>_count`. frame.attrs["tier"]
+    holds the bucket width in seconds.
+    """
+    if tier not in SERIES_TIERS:
+        raise ValueError(f"Unknown series tier: {tier}")
+    metric_cols = [c for c in (ROLLUP_METRICS if columns is None else columns) if c in ROLLUP_METRICS]
+    select = ["bucket", "record_count", "anomaly_count"] + [
+        f"{m}_{agg}" for m in metric_cols for agg in ("count", "sum", "min", "max")
+    ]
+    where, params = _series_where(user_id, tier, start, end)
+    cur = get_conn(db_path).cursor()
+    cur.row_factory = None
+    cur.execute(f"SELECT {', '.join(select)} FROM series_rollups WHERE {where} ORDER BY bucket", params)
+    block = np.array(cur.fetchall(), dtype=np.float64).reshape(-1, len(select)).T  # NULL -> NaN
+
+    df = pd.DataFrame({
+        "timestamp": block[0].astype(np.int64).view("datetime64[s]"),
+        "record_count": block[1].astype(np.int64),
+        "anomaly_count": block[2].astype(np.int64),
+    })
+    for i, m in enumerate(metric_cols):
+        count, total, lo, hi = block[3 + 4 * i: 7 + 4 * i]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            df[m] = np.where(count > 0, total / count, np.nan)
+        df[f"{m}_min"], df[f"{m}_max"], df[f"{m}_count"] = lo, hi, count.astype(np.int64)
+    df.attrs["tier"] = tier
+    return df
+
+def iter_health_batches(user_id: int, columns: Optional[List[str]] = None, batch_size: int = INSERT_CHUNK_SIZE,
+                        start: Any = None, end: Any = None,
+                        db_path: str = DB_PATH_DEFAULT) -> Iterable[List[sqlite3.Row]]:
+    # One time-ordered cursor read with fetchmany; for exports that write nothing in between.
+    # Same start/end semantics as get_health_records.
+    columns = list(HEALTH_COLUMNS) if columns is None else columns
+    unknown = [c for c in columns if c not in HEALTH_SELECTABLE]
+    if unknown:
+        raise ValueError(f"Unknown health_records column(s): {', '.join(unknown)}")
+    q = f"SELECT {', '.join(columns)} FROM health_records WHERE user_id = ?"
+    params: List[Any] = [user_id]
+    if start is not None:
+        q += " AND timestamp >= ?"
+        params.append(_ts_param(start))
+    if end is not None:
+        q += " AND timestamp < ?"
+        params.append(_ts_param(end))
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    cur.execute(q + " ORDER BY timestamp", params)
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        yield rows
+
+def get_latest_timestamp(user_id: int, db_path: str = DB_PATH_DEFAULT) -> Optional[str]:
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT MAX(timestamp) AS ts FROM health_records WHERE user_id = ?", (user_id,))
+    return cur.fetchone()["ts"]
+
 def count_health_records(user_id: int, db_path: str = DB_PATH_DEFAULT) -> int:
     conn = get_conn(db_path)
     cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) as c FROM health_records WHERE user_id = ?", (user_id,))
-    c = int(cur.fetchone()["c"])
-    conn.close()
-    return c
+    cur.execute("SELECT records FROM record_counts WHERE user_id = ?", (user_id,))
+    row = cur.fetchone()
+    return int(row["records"]) if row is not None else 0
 
 def count_all_health_records(db_path: str = DB_PATH_DEFAULT) -> int:
     conn = get_conn(db_path)
     cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) as c FROM health_records")
-    c = int(cur.fetchone()["c"])
-    conn.close()
-    return c
+    cur.execute("SELECT TOTAL(records) AS c FROM record_counts")
+    return int(cur.fetchone()["c"])
 
 def delete_user_records(user_id: int, db_path: str = DB_PATH_DEFAULT) -> None:
+    # Everything for the user, archived ranges included (archive files: retention.delete_user_archives)
+    conn = get_conn(db_path)
+    with conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM health_records WHERE user_id = ?", (user_id,))
+        cur.execute("DELETE FROM record_counts WHERE user_id = ?", (user_id,))
+        cur.execute("DELETE FROM archives WHERE user_id = ?", (user_id,))
+        _bump_data_versions(cur, [user_id])
+        _rebuild_rollups(cur, user_id)
+
+def count_health_records_before(user_id: int, before: Any, db_path: str = DB_PATH_DEFAULT) -> int:
     conn = get_conn(db_path)
     cur = conn.cursor()
-    cur.execute("DELETE FROM health_records WHERE user_id = ?", (user_id,))
+    cur.execute("SELECT COUNT(*) AS c FROM health_records WHERE user_id = ? AND timestamp < ?",
+                (user_id, _ts_param(before)))
+    return int(cur.fetchone()["c"])
+
+def get_archive_watermark(user_id: int, db_path: str = DB_PATH_DEFAULT) -> Optional[int]:
+    # Epoch seconds before which the user's raw records were archived; None if nothing was
+    return _archive_watermark(get_conn(db_path).cursor(), user_id)
+
+def delete_records_before(user_id: int, before: Any, limit: int, db_path: str = DB_PATH_DEFAULT) -> int:
+    """
+    Deletes up to `limit` of the user's oldest records with timestamp < `before` in one short
+    transaction, leaving rollups untouched. Returns the number deleted; call until it is 0.
+    """
+    conn = get_conn(db_path)
+    with conn:
+        cur = conn.cursor()
+        cur.execute(
+            "DELETE FROM health_records WHERE record_id IN (SELECT record_id FROM health_records "
+            "WHERE user_id = ? AND timestamp < ? ORDER BY timestamp LIMIT ?)",
+            (user_id, _ts_param(before), limit))
+        n = cur.rowcount
+        if n:
+            _bump_data_versions(cur, [user_id])
+            cur.execute("UPDATE record_counts SET records = records - ? WHERE user_id = ?", (n, user_id))
+    return n
+
+def restore_health_tuples(rows: Iterable[Sequence[Any]], db_path: str = DB_PATH_DEFAULT) -> int:
+    # Rehydrates archived rows ((user_id, *HEALTH_COLUMNS) tuples) without folding them into
+    # rollups, which still count them. Rows already present are skipped; returns rows inserted.
+    conn = get_conn(db_path)
+    with conn:
+        cur = conn.cursor()
+        _begin_write(conn)
+        last_id = _max_record_id(cur)
+        cur.executemany(_INSERT_HEALTH_SQL, rows)
+        n = cur.rowcount
+        _bump_data_versions(cur, _count_new_records(cur, last_id))
+    return n
+
+def record_archive(user_id: int, start_ts: int, end_ts: int, rows: int, nbytes: int, path: str,
+                   db_path: str = DB_PATH_DEFAULT) -> int:
+    conn = get_conn(db_path)
+    with conn:
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO archives(user_id, start_ts, end_ts, rows, bytes, path, created_at) VALUES(?,?,?,?,?,?,?)",
+            (user_id, start_ts, end_ts, rows, nbytes, path, time.time()))
+    return int(cur.lastrowid)
+
+def list_archives(user_id: Optional[int] = None, db_path: str = DB_PATH_DEFAULT):
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    q = ("SELECT a.*, u.username FROM archives a LEFT JOIN users u ON u.user_id = a.user_id"
+         + (" WHERE a.user_id = ?" if user_id is not None else "") + " ORDER BY a.user_id, a.start_ts")
+    cur.execute(q, (user_id,) if user_id is not None else ())
+    return cur.fetchall()
+
+RETENTION_RUN_FIELDS = {
+    "status", "users", "rows_archived", "rows_deleted", "archive_bytes",
+    "db_bytes_before", "db_bytes_after", "seconds", "error", "finished_at",
+}
+
+def create_retention_run(db_path: str = DB_PATH_DEFAULT) -> int:
+    conn = get_conn(db_path)
+    with conn:
+        cur = conn.cursor()
+        cur.execute("INSERT INTO retention_runs(status, started_at) VALUES('running', ?)", (time.time(),))
+    return int(cur.lastrowid)
+
+def update_retention_run(run_id: int, fields: Dict[str, Any], db_path: str = DB_PATH_DEFAULT) -> None:
+    unknown = set(fields) - RETENTION_RUN_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown retention run field(s): {', '.join(sorted(unknown))}")
+    conn = get_conn(db_path)
+    with conn:
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        conn.execute(f"UPDATE retention_runs SET {cols} WHERE run_id = ?", (*fields.values(), run_id))
+
+def get_retention_run(run_id: int, db_path: str = DB_PATH_DEFAULT):
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM retention_runs WHERE run_id = ?", (run_id,))
+    return cur.fetchone()
+
+def list_retention_runs(limit: int = 10, db_path: str = DB_PATH_DEFAULT):
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM retention_runs ORDER BY run_id DESC LIMIT ?", (limit,))
+    return cur.fetchall()
+
+def list_settings(prefix: str, db_path: str = DB_PATH_DEFAULT) -> Dict[str, str]:
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT key, value FROM settings WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+    return {r["key"]: r["value"] for r in cur.fetchall()}
+
+def delete_setting(key: str, db_path: str = DB_PATH_DEFAULT) -> None:
+    conn = get_conn(db_path)
+    with conn:
+        conn.execute("DELETE FROM settings WHERE key = ?", (key,))
+
+def space_stats(db_path: str = DB_PATH_DEFAULT) -> Dict[str, int]:
+    # File size in pages and bytes, and pages on the freelist (reusable or reclaimable)
+    cur = get_conn(db_path).cursor()
+    stats = {k: int(cur.execute(f"PRAGMA {k}").fetchone()[0])
+             for k in ("page_size", "page_count", "freelist_count", "auto_vacuum")}
+    stats["bytes"] = stats["page_size"] * stats["page_count"]
+    stats["free_bytes"] = stats["page_size"] * stats["freelist_count"]
+    return stats
+
+def incremental_vacuum(pages: int, db_path: str = DB_PATH_DEFAULT) -> int:
+    # Returns up to `pages` free pages to the filesystem (auto_vacuum=INCREMENTAL files only);
+    # returns the number still free
+    conn = get_conn(db_path)
+    # executescript steps the pragma to completion; execute() frees a single page
+    conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+    return int(conn.execute("PRAGMA freelist_count").fetchone()[0])
+
+def convert_to_incremental_vacuum(db_path: str = DB_PATH_DEFAULT) -> None:
+    # One-off full VACUUM that switches an existing file to auto_vacuum=INCREMENTAL.
+    # Holds an exclusive lock for its duration.
+    conn = get_conn(db_path)
     conn.commit()
-    conn.close()
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+
+def get_setting(key: str, default: Optional[str] = None, db_path: str = DB_PATH_DEFAULT) -> Optional[str]:
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT value FROM settings WHERE key = ?", (key,))
+    row = cur.fetchone()
+    return row["value"] if row else default
+
+def set_setting(key: str, value: str, db_path: str = DB_PATH_DEFAULT) -> None:
+    conn = get_conn(db_path)
+    with conn:
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO settings(key, value) VALUES(?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+
+def list_user_ids_with_records(db_path: str = DB_PATH_DEFAULT) -> List[int]:
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT DISTINCT user_id FROM health_records ORDER BY user_id")
+    return [int(r["user_id"]) for r in cur.fetchall()]
+
+RESCORE_FIELDS = {"status", "rows_scored", "seconds", "error", "finished_at", "worker_pid"}
+RESCORE_ORPHANED = "Interrupted: the process running it exited."
+
+def _settle_rescore_runs(cur: sqlite3.Cursor, is_alive: Callable[[Optional[int]], bool]) -> bool:
+    # Marks 'running' runs whose process is gone as failed; True if a live one remains
+    live = False
+    for run in cur.execute("SELECT run_id, worker_pid FROM rescore_runs WHERE status = 'running'").fetchall():
+        if is_alive(run["worker_pid"]):
+            live = True
+        else:
+            cur.execute("UPDATE rescore_runs SET status = 'failed', error = ?, finished_at = ? WHERE run_id = ?",
+                        (RESCORE_ORPHANED, time.time(), run["run_id"]))
+    return live
+
+def fail_orphaned_rescore_runs(is_alive: Callable[[Optional[int]], bool], db_path: str = DB_PATH_DEFAULT) -> None:
+    conn = get_conn(db_path)
+    with conn:
+        _settle_rescore_runs(conn.cursor(), is_alive)
+
+def create_rescore_run(contamination: float, feature_cols: str, workers: int, worker_pid: int,
+                       is_alive: Callable[[Optional[int]], bool], db_path: str = DB_PATH_DEFAULT) -> Optional[int]:
+    # Claims a new running run for `worker_pid`, or returns None while another run is live.
+    # Check and insert share one write transaction, so concurrent app workers can't both start one.
+    conn = get_conn(db_path)
+    with conn:
+        _begin_write(conn)
+        cur = conn.cursor()
+        if _settle_rescore_runs(cur, is_alive):
+            return None
+        cur.execute(
+            "INSERT INTO rescore_runs(contamination, feature_cols, status, workers, worker_pid, created_at) "
+            "VALUES(?, ?, 'running', ?, ?, ?)",
+            (contamination, feature_cols, workers, worker_pid, time.time())
+        )
+        return int(cur.lastrowid)
+
+def resume_rescore_run(run_id: int, worker_pid: int, is_alive: Callable[[Optional[int]], bool],
+                       db_path: str = DB_PATH_DEFAULT) -> bool:
+    # Claims an unfinished run for `worker_pid` like create_rescore_run; False while another run is live
+    conn = get_conn(db_path)
+    with conn:
+        _begin_write(conn)
+        cur = conn.cursor()
+        if _settle_rescore_runs(cur, is_alive):
+            return False
+        cur.execute("UPDATE rescore_runs SET status = 'running', error = NULL, worker_pid = ? WHERE run_id = ?",
+                    (worker_pid, run_id))
+        return True
+
+def update_rescore_run(run_id: int, fields: Dict[str, Any], db_path: str = DB_PATH_DEFAULT) -> None:
+    unknown = set(fields) - RESCORE_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown rescore_runs field(s): {', '.join(sorted(unknown))}")
+    conn = get_conn(db_path)
+    with conn:
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        conn.execute(f"UPDATE rescore_runs SET {cols} WHERE run_id = ?", tuple(fields.values()) + (run_id,))
+
+def get_rescore_run(run_id: int, db_path: str = DB_PATH_DEFAULT):
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM rescore_runs WHERE run_id = ?", (run_id,))
+    return cur.fetchone()
+
+def list_running_rescore_runs(db_path: str = DB_PATH_DEFAULT):
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM rescore_runs WHERE status = 'running' ORDER BY run_id DESC")
+    return cur.fetchall()
+
+def get_unfinished_rescore_run(db_path: str = DB_PATH_DEFAULT):
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM rescore_runs WHERE status != 'done' ORDER BY run_id DESC LIMIT 1")
+    return cur.fetchone()
+
+def list_rescore_runs(limit: int = 10, db_path: str = DB_PATH_DEFAULT):
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM rescore_runs ORDER BY run_id DESC LIMIT ?", (limit,))
+    return cur.fetchall()
+
+def record_rescore_progress(run_id: int, user_id: int, rows_scored: int, seconds: float,
+                            db_path: str = DB_PATH_DEFAULT) -> None:
+    conn = get_conn(db_path)
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO rescore_progress(run_id, user_id, rows_scored, seconds) VALUES(?, ?, ?, ?)",
+            (run_id, user_id, rows_scored, seconds)
+        )
+
+def get_rescore_progress(run_id: int, db_path: str = DB_PATH_DEFAULT):
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM rescore_progress WHERE run_id = ? ORDER BY user_id", (run_id,))
+    return cur.fetchall()
+
+def get_latest_health_records(user_id: int, columns: List[str], limit: int,
+                              db_path: str = DB_PATH_DEFAULT):
+    # Newest `limit` rows for a user, returned oldest first
+    unknown = [c for c in columns if c not in HEALTH_SELECTABLE]
+    if unknown:
+        raise ValueError(f"Unknown health_records column(s): {', '.join(unknown)}")
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT {', '.join(columns)} FROM health_records WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?",
+        (user_id, limit)
+    )
+    return cur.fetchall()[::-1]
+
+def iter_feature_batches(user_id: int, columns: List[str], batch_size: int = INSERT_CHUNK_SIZE,
+                         db_path: str = DB_PATH_DEFAULT) -> Iterable[List[sqlite3.Row]]:
+    # Pages (record_id, *columns) for a user by record_id, so callers may update rows between batches
+    unknown = [c for c in columns if c not in HEALTH_SELECTABLE]
+    if unknown:
+        raise ValueError(f"Unknown health_records column(s): {', '.join(unknown)}")
+    conn = get_conn(db_path)
+    q = (f"SELECT record_id, {', '.join(columns)} FROM health_records "
+         "WHERE user_id = ? AND record_id > ? ORDER BY record_id LIMIT ?")
+    last = 0
+    while True:
+        rows = conn.execute(q, (user_id, last, batch_size)).fetchall()
+        if not rows:
+            break
+        yield rows
+        last = rows[-1]["record_id"]
+
+@metrics.timed("db.update_anomaly_results", rows=lambda n, *a, **k: n)
+def update_anomaly_results(rows: Iterable[Sequence[Any]], db_path: str = DB_PATH_DEFAULT) -> int:
+    # rows are (anomaly_flag, anomaly_score, anomaly_drivers, record_id); one transaction per call
+    conn = get_conn(db_path)
+    with conn:
+        cur = conn.cursor()
+        cur.executemany(
+            "UPDATE health_records SET anomaly_flag = ?, anomaly_score = ?, anomaly_drivers = ? WHERE record_id = ?",
+            rows
+        )
+        return cur.rowcount
+
+JOB_FIELDS = {
+    "status", "stage", "rows_processed", "bytes_total", "bytes_done", "error",
+    "worker_pid", "started_at", "finished_at",
+}
+
+def create_job(job_id: str, user_id: int, kind: str, bytes_total: Optional[int] = None,
+               worker_pid: Optional[int] = None, db_path: str = DB_PATH_DEFAULT) -> None:
+    now = time.time()
+    conn = get_conn(db_path)
+    with conn:
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO jobs(job_id, user_id, kind, status, bytes_total, worker_pid, created_at, updated_at) "
+            "VALUES(?,?,?,?,?,?,?,?)",
+            (job_id, user_id, kind, "queued", bytes_total, worker_pid, now, now)
+        )
+
+def update_job(job_id: str, fields: Dict[str, Any], db_path: str = DB_PATH_DEFAULT) -> None:
+    unknown = set(fields) - JOB_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown job field(s): {', '.join(sorted(unknown))}")
+    cols = sorted(fields)
+    conn = get_conn(db_path)
+    with conn:
+        cur = conn.cursor()
+        cur.execute(
+            "UPDATE jobs SET " + ", ".join(f"{c} = ?" for c in cols) + ", updated_at = ? WHERE job_id = ?",
+            tuple(fields[c] for c in cols) + (time.time(), job_id)
+        )
+
+def get_job(job_id: str, db_path: str = DB_PATH_DEFAULT):
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,))
+    return cur.fetchone()
+
+def list_jobs(user_id: int, statuses: Optional[Sequence[str]] = None, limit: int = 10,
+              db_path: str = DB_PATH_DEFAULT):
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    q = "SELECT * FROM jobs WHERE user_id = ?"
+    params: List[Any] = [user_id]
+    if statuses:
+        q += " AND status IN (" + ",".join("?" * len(statuses)) + ")"
+        params.extend(statuses)
+    q += " ORDER BY created_at DESC LIMIT ?"
+    params.append(limit)
+    cur.execute(q, tuple(params))
+    return cur.fetchall()
+
+def list_unfinished_jobs(db_path: str = DB_PATH_DEFAULT):
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM jobs WHERE status IN ('queued', 'running')")
+    return cur.fetchall()
 
 def reset_db(db_path: str = DB_PATH_DEFAULT) -> None:
     conn = get_conn(db_path)
     cur = conn.cursor()
     cur.execute("DROP TABLE IF EXISTS health_records")
+    cur.execute("DROP TABLE IF EXISTS data_versions")
+    cur.execute("DROP TABLE IF EXISTS jobs")
+    cur.execute("DROP TABLE IF EXISTS daily_rollups")
+    cur.execute("DROP TABLE IF EXISTS series_rollups")
+    cur.execute("DROP TABLE IF EXISTS archives")
+    cur.execute("DROP TABLE IF EXISTS retention_runs")
+    cur.execute("DROP TABLE IF EXISTS record_counts")
+    cur.execute("DROP TABLE IF EXISTS sessions")
+    cur.execute("DROP TABLE IF EXISTS api_tokens")
+    cur.execute("DROP TABLE IF EXISTS settings")
+    cur.execute("DROP TABLE IF EXISTS rescore_runs")
+    cur.execute("DROP TABLE IF EXISTS rescore_progress")
     cur.execute("DROP TABLE IF EXISTS users")
+    cur.execute("PRAGMA user_version = 0")
     conn.commit()
-    conn.close()
     init_db(db_path)
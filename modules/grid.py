@@ -0,0 +1,39 @@
+"""
+Per-user resampled grids: a user's stored records snapped onto a fixed step by
+preprocessing.resample_to_grid. Grids are cached per (user, data version, step, max gap,
+range), so views of the same range share one build, and any upload or delete invalidates
+them. Archived history (modules.retention)
+has no raw records and shows up as empty steps.
+"""
+from typing import Any
+
+import pandas as pd
+
+from . import db
+from . import preprocessing
+from .cache import LRUCache
+
+_cache = LRUCache(max_entries=32, max_bytes=128 * 1024 * 1024)
+
+
+def load(user_id: int, step: str = preprocessing.GRID_STEP_DEFAULT, start: Any = None, end: Any = None,
+         max_gap: Any = preprocessing.GRID_MAX_GAP_DEFAULT, db_path: str = db.DB_PATH_DEFAULT) -> pd.DataFrame:
+    """
+    Grid of [start, end) (None = first/last reading) at `step` (a preprocessing.GRID_STEPS name).
+    The frame is shared between callers: don't modify it. Raises ValueError like
+    resample_to_grid for unknown steps and oversized grids.
+    """
+    if step not in preprocessing.GRID_STEPS:
+        raise ValueError(f"Unknown grid step: {step}. Allowed: {', '.join(preprocessing.GRID_STEPS)}")
+    key = (user_id, db.get_data_version(user_id, db_path), step, str(max_gap), start, end, db_path)
+    grid = _cache.get(key)
+    if grid is None:
+        df = db.load_health_frame(user_id, columns=preprocessing.NUMERIC_COLS + ["anomaly_flag"], start=start,
+                                  end=end, db_path=db_path)
+        grid = preprocessing.resample_to_grid(df, step, max_gap, start=start, end=end)
+        _cache.put(key, grid, size=int(grid.memory_usage(deep=True).sum()))
+    return grid
+
+
+def clear_cache() -> None:
+    _cache.clear()
@@ -0,0 +1,80 @@
+from typing import IO, Callable, List, Optional
+
+import pandas as pd
+
+from . import db
+from . import metrics
+from . import model
+from . import preprocessing
+
+# progress(stage, rows_processed) is called as a stream moves through the pipeline
+ProgressFn = Callable[[str, int], None]
+
+
+def load_history(user_id: int) -> pd.DataFrame:
+    return db.load_health_frame(user_id)
+
+
+def _drop_stored(user_id: int, df: pd.DataFrame) -> pd.DataFrame:
+    # Rows whose timestamps the user already has would be ignored on insert; dropping them before
+    # scoring keeps re-uploads from advancing online detector state twice
+    if df.empty:
+        return df
+    stored = db.get_health_records(user_id, start=df["timestamp"].min(),
+                                   end=df["timestamp"].max() + pd.Timedelta(seconds=1), columns=[])
+    if not stored:
+        return df
+    known = pd.to_datetime(pd.Series([r["timestamp"] for r in stored]), errors="coerce")
+    return df[~df["timestamp"].isin(known)]
+
+
+def ingest_stream(user_id: int, binary: IO[bytes], contamination: float = 0.03,
+                  progress: Optional[ProgressFn] = None, feature_cols: Optional[List[str]] = None,
+                  engine: Optional[str] = None) -> int:
+    """
+    Cleans, scores and inserts an uploaded CSV/TSV chunk by chunk with the given detector
+    engine (default: the user's), then lets the engine do any follow-up such as scheduling a
+    background refit. Rows already stored are skipped before scoring. Returns rows inserted.
+    """
+    detector = model.get_detector(engine or db.get_user_engine(user_id))
+    report = progress or (lambda stage, rows: None)
+    n = 0
+    cols = None
+    chunks = preprocessing.iter_clean_chunks(binary, on_stage=lambda stage: report(stage, n))
+    while True:
+        with metrics.track("ingest.parse_clean") as span:
+            df_clean = next(chunks, None)
+            span.rows = 0 if df_clean is None else len(df_clean)
+        if df_clean is None:
+            break
+        cols = model.usable_feature_cols(df_clean, feature_cols)
+        df_new = _drop_stored(user_id, df_clean)
+        if df_new.empty:
+            continue
+        report("score", n)
+        df_scored = detector.score(user_id, df_new, contamination=contamination, feature_cols=feature_cols)
+        report("insert", n)
+        n += db.insert_health_tuples(preprocessing.to_db_tuples(df_scored, user_id))
+    if cols:
+        detector.after_ingest(user_id, cols, contamination, lambda: load_history(user_id))
+    report("done", n)
+    return n
+
+
+def ingest_records(user_id: int, df: pd.DataFrame, contamination: float = 0.03,
+                   feature_cols: Optional[List[str]] = None, engine: Optional[str] = None) -> int:
+    """
+    Scores and inserts one validated API batch (see preprocessing.records_to_df) in a single
+    transaction. Timestamps already stored for the user are dropped before scoring, so retried
+    batches neither duplicate rows nor advance online detector state twice. Returns rows inserted.
+    """
+    df = _drop_stored(user_id, df)
+    if df.empty:
+        return 0
+    detector = model.get_detector(engine or db.get_user_engine(user_id))
+    df_scored = detector.score(user_id, df, contamination=contamination, feature_cols=feature_cols)
+    n = db.insert_health_tuples(preprocessing.to_db_tuples(df_scored, user_id))
+    cols = model.usable_feature_cols(df, feature_cols)
+    if cols:
+        detector.after_ingest(user_id, cols, contamination, lambda: load_history(user_id))
+    return n
@@ -0,0 +1,117 @@
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Any, Dict, List, Optional
+
+from . import db
+from . import ingest
+from . import metrics
+from . import preprocessing
+
+UPLOAD_DIR_DEFAULT = os.path.join("instance", "uploads")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+
+# Progress is written to SQLite at most this often per job (seconds)
+PROGRESS_INTERVAL = 0.5
+
+ACTIVE_STATUSES = ("queued", "running")
+
+_pool = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+
+
+class _ProgressWriter:
+    # Throttled ingest progress callback; bytes_done comes from the raw file position
+    def __init__(self, job_id: str, fp: IO[bytes]):
+        self.job_id = job_id
+        self.fp = fp
+        self._last = 0.0
+        self._stage = None
+
+    def __call__(self, stage: str, rows: int) -> None:
+        now = time.monotonic()
+        if stage == self._stage and now - self._last < PROGRESS_INTERVAL:
+            return
+        self._stage, self._last = stage, now
+        db.update_job(self.job_id, {"stage": stage, "rows_processed": rows, "bytes_done": self.fp.tell()})
+
+
+def _run_upload(job_id: str, user_id: int, path: str, contamination: float,
+                feature_cols: Optional[List[str]], engine: Optional[str]) -> None:
+    db.update_job(job_id, {"status": "running", "stage": "parse", "started_at": time.time()})
+    try:
+        with metrics.track("jobs.upload") as span, open(path, "rb") as fp:
+            span.bytes_in = os.path.getsize(path)
+            n = span.rows = ingest.ingest_stream(user_id, fp, contamination=contamination,
+                                                 progress=_ProgressWriter(job_id, fp), feature_cols=feature_cols,
+                                                 engine=engine)
+        db.update_job(job_id, {
+            "status": "done", "stage": "done", "rows_processed": n,
+            "bytes_done": os.path.getsize(path), "finished_at": time.time(),
+        })
+    except preprocessing.SchemaError as e:
+        db.update_job(job_id, {"status": "failed", "error": str(e), "finished_at": time.time()})
+    except Exception as e:
+        db.update_job(job_id, {"status": "failed", "error": f"Processing error: {e}", "finished_at": time.time()})
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def submit_upload(user_id: int, file_storage, contamination: float = 0.03,
+                  feature_cols: Optional[List[str]] = None, engine: Optional[str] = None,
+                  upload_dir: str = UPLOAD_DIR_DEFAULT) -> str:
+    """
+    Spools an uploaded file to disk and queues it for background ingest.
+    Returns the job id immediately.
+    """
+    job_id = uuid.uuid4().hex
+    os.makedirs(upload_dir, exist_ok=True)
+    path = os.path.join(upload_dir, job_id + ".upload")
+    file_storage.save(path)
+    db.create_job(job_id, user_id, "upload", bytes_total=os.path.getsize(path), worker_pid=os.getpid())
+    _pool.submit(_run_upload, job_id, user_id, path, contamination, feature_cols, engine)
+    return job_id
+
+
+def job_status(job) -> Dict[str, Any]:
+    """JSON-safe view of a jobs row, with progress fraction and a bytes-based ETA."""
+    status = {k: job[k] for k in ("job_id", "kind", "status", "stage", "rows_processed", "error")}
+    total = job["bytes_total"] or 0
+    done = min(job["bytes_done"] or 0, total)
+    status["progress"] = round(done / total, 4) if total else None
+    status["eta_seconds"] = None
+    if job["status"] == "running" and job["started_at"] and 0 < done < total:
+        elapsed = time.time() - job["started_at"]
+        status["eta_seconds"] = round(elapsed * (total - done) / done, 1)
+    return status
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def fail_orphaned_jobs(upload_dir: str = UPLOAD_DIR_DEFAULT) -> int:
+    """
+    Marks queued/running jobs whose worker process is gone as failed. Call at startup.
+    Jobs owned by this (just started) process id are orphans from an earlier run with a reused pid.
+    """
+    n = 0
+    for job in db.list_unfinished_jobs():
+        pid = job["worker_pid"]
+        if pid is None or pid == os.getpid() or not pid_alive(pid):
+            db.update_job(job["job_id"], {
+                "status": "failed", "error": "Interrupted by a server restart; please upload again.",
+                "finished_at": time.time(),
+            })
+            path = os.path.join(upload_dir, job["job_id"] + ".upload")
+            if os.path.exists(path):
+                os.remove(path)
+            n += 1
+    return n
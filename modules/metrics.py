@@ -0,0 +1,293 @@
+"""
+In-process performance instrumentation: per-stage latency histograms with row and byte
+counters, Prometheus text export, and an opt-in sampling profiler for single requests.
+Metrics are per process and reset on restart.
+"""
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Histogram upper bounds in seconds (Prometheus `le` labels); the last bucket is +Inf
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PROFILE_INTERVAL = 0.005   # seconds between stack samples
+PROFILE_KEEP = 20          # most recent request profiles kept in memory
+
+
+class Stage:
+    __slots__ = ("buckets", "count", "total", "rows", "bytes_in", "bytes_out", "errors")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.rows = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.errors = 0
+
+    def quantile(self, q: float) -> Optional[float]:
+        # Linear interpolation inside the bucket holding the q-th observation
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            if n and seen + n >= rank:
+                lo = BUCKETS[i - 1] if i > 0 else 0.0
+                hi = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lo + (hi - lo) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+
+_stages: Dict[str, Stage] = {}
+_lock = threading.Lock()
+
+
+def observe(stage: str, seconds: float, rows: int = 0, bytes_in: int = 0, bytes_out: int = 0,
+            error: bool = False) -> None:
+    with _lock:
+        s = _stages.get(stage)
+        if s is None:
+            s = _stages[stage] = Stage()
+        s.buckets[bisect_left(BUCKETS, seconds)] += 1
+        s.count += 1
+        s.total += seconds
+        s.rows += int(rows)
+        s.bytes_in += int(bytes_in)
+        s.bytes_out += int(bytes_out)
+        s.errors += int(error)
+
+
+class _Span:
+    __slots__ = ("rows", "bytes_in", "bytes_out")
+
+    def __init__(self):
+        self.rows = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+
+class track:
+    """
+    Times a block as `stage`; set span.rows / span.bytes_in / span.bytes_out inside it.
+
+        with metrics.track("ingest.insert") as span:
+            span.rows = db.insert_health_tuples(rows)
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.span = _Span()
+
+    def __enter__(self) -> _Span:
+        self._t0 = time.perf_counter()
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        sp = self.span
+        observe(self.stage, time.perf_counter() - self._t0, sp.rows, sp.bytes_in, sp.bytes_out,
+                error=exc_type is not None)
+
+
+def result_len(result: Any, *args, **kwargs) -> int:
+    return len(result) if result is not None else 0
+
+def first_arg_len(result: Any, first: Any = None, *args, **kwargs) -> int:
+    return len(first) if first is not None else 0
+
+
+def timed(stage: str, rows: Optional[Callable[..., int]] = None,
+          bytes_in: Optional[Callable[..., int]] = None,
+          bytes_out: Optional[Callable[..., int]] = None) -> Callable:
+    """
+    Decorator recording each call's latency under `stage`. The optional counters are called
+    as fn(result, *args, **kwargs) after a successful call, e.g. rows=metrics.result_len.
+    """
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                observe(stage, time.perf_counter() - t0, error=True)
+                raise
+            observe(
+                stage, time.perf_counter() - t0,
+                rows(result, *args, **kwargs) if rows else 0,
+                bytes_in(result, *args, **kwargs) if bytes_in else 0,
+                bytes_out(result, *args, **kwargs) if bytes_out else 0,
+            )
+            return result
+        return wrapper
+    return decorator
+
+
+def snapshot() -> List[Dict[str, Any]]:
+    # One dict per stage, slowest total time first
+    with _lock:
+        items = [(name, s) for name, s in _stages.items()]
+        out = []
+        for name, s in items:
+            out.append({
+                "stage": name,
+                "count": s.count,
+                "errors": s.errors,
+                "total_s": s.total,
+                "mean_ms": 1000 * s.total / s.count if s.count else None,
+                "p50_ms": _ms(s.quantile(0.50)),
+                "p95_ms": _ms(s.quantile(0.95)),
+                "p99_ms": _ms(s.quantile(0.99)),
+                "rows": s.rows,
+                "rows_per_s": s.rows / s.total if s.rows and s.total else None,
+                "bytes_in": s.bytes_in,
+                "bytes_out": s.bytes_out,
+            })
+    return sorted(out, key=lambda r: -r["total_s"])
+
+def _ms(v: Optional[float]) -> Optional[float]:
+    return None if v is None else 1000 * v
+
+
+def reset() -> None:
+    with _lock:
+        _stages.clear()
+    with _profiles_lock:
+        _profiles.clear()
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def prometheus_text(prefix: str = "healthmon") -> str:
+    """Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        items = sorted((name, s.buckets[:], s.count, s.total, s.rows, s.bytes_in, s.bytes_out, s.errors)
+                       for name, s in _stages.items())
+    lines = [
+        f"# HELP {prefix}_stage_seconds Latency of instrumented stages and routes.",
+        f"# TYPE {prefix}_stage_seconds histogram",
+    ]
+    for name, buckets, count, total, *_ in items:
+        lbl = f'stage="{_label(name)}"'
+        cum = 0
+        for bound, n in zip(BUCKETS, buckets):
+            cum += n
+            lines.append(f'{prefix}_stage_seconds_bucket{{{lbl},le="{bound}"}} {cum}')
+        lines.append(f'{prefix}_stage_seconds_bucket{{{lbl},le="+Inf"}} {count}')
+        lines.append(f"{prefix}_stage_seconds_sum{{{lbl}}} {total:.6f}")
+        lines.append(f"{prefix}_stage_seconds_count{{{lbl}}} {count}")
+    for metric, idx, help_text in (
+        ("rows", 4, "Rows processed by each stage."),
+        ("bytes_in", 5, "Bytes received by each stage."),
+        ("bytes_out", 6, "Bytes produced by each stage."),
+        ("errors", 7, "Calls that raised."),
+    ):
+        lines.append(f"# HELP {prefix}_stage_{metric}_total {help_text}")
+        lines.append(f"# TYPE {prefix}_stage_{metric}_total counter")
+        for item in items:
+            lines.append(f'{prefix}_stage_{metric}_total{{stage="{_label(item[0])}"}} {item[idx]}')
+    return "\n".join(lines) + "\n"
+
+
+# --- sampling profiler -------------------------------------------------------
+
+profiling_enabled = False
+_profiles: "deque[Dict[str, Any]]" = deque(maxlen=PROFILE_KEEP)
+_profiles_lock = threading.Lock()
+_sampling = threading.local()  # .sampler: the StackSampler started on this thread, if running
+
+
+def set_profiling(enabled: bool) -> None:
+    global profiling_enabled
+    profiling_enabled = bool(enabled)
+
+
+def active_sampler() -> Optional["StackSampler"]:
+    # The running sampler started on the calling thread (a request with ?_profile=1), if any
+    return getattr(_sampling, "sampler", None)
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack every `interval` seconds from a helper thread.
+    Stacks are aggregated as collapsed "outer;...;inner" strings (flamegraph / speedscope input).
+    While the thread waits on a pool task (compute.BoundedExecutor), the worker running that
+    task is sampled instead; see delegate().
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = PROFILE_INTERVAL):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._targets = [self.thread_id]  # sampled thread last
+        self._targets_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._t0 = time.perf_counter()
+        self._thread.start()
+        if self.thread_id == threading.get_ident():
+            _sampling.sampler = self
+        return self
+
+    @contextmanager
+    def delegate(self) -> Iterator[None]:
+        # Samples the calling thread, a pool worker running a task for the sampled one, until exit
+        tid = threading.get_ident()
+        with self._targets_lock:
+            self._targets.append(tid)
+        try:
+            yield
+        finally:
+            with self._targets_lock:
+                self._targets.remove(tid)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            with self._targets_lock:
+                target = self._targets[-1]
+            frame = sys._current_frames().get(target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> float:
+        if active_sampler() is self:
+            _sampling.sampler = None
+        self._stop.set()
+        self._thread.join()
+        return time.perf_counter() - self._t0
+
+
+def save_profile(label: str, sampler: StackSampler, seconds: float) -> None:
+    leaves = Counter()
+    for stack, n in sampler.stacks.items():
+        leaves[stack.rsplit(";", 1)[-1]] += n
+    with _profiles_lock:
+        _profiles.appendleft({
+            "label": label,
+            "at": time.time(),
+            "seconds": seconds,
+            "samples": sum(sampler.stacks.values()),
+            "top": leaves.most_common(10),
+            "collapsed": "\n".join(f"{s} {n}" for s, n in sampler.stacks.most_common()),
+        })
+
+
+def profiles() -> List[Dict[str, Any]]:
+    with _profiles_lock:
+        return list(_profiles)
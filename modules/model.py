@@ -1,49 +1,443 @@
+import os
 import pandas as pd
 import numpy as np
-from typing import List, Tuple, Dict
+import threading
+import weakref
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from scipy.signal import lfilter
 from sklearn.ensemble import IsolationForest
 
+from . import registry
+from . import metrics
+
 FEATURE_COLS_DEFAULT = ["heart_rate", "steps", "sleep_hours", "calories", "glucose"]
 
+# Number of top z-score features reported per flagged row
+DRIVER_TOP_K = 2
+
+# Upper bound on history rows used when (re)fitting a user's baseline
+MAX_FIT_ROWS = 100_000
+
+
+def parse_max_samples(value: str):
+    # "auto" (min(256, rows)), an integer row count or a float fraction of the training rows
+    if value == "auto":
+        return value
+    return float(value) if "." in value else int(value)
+
+# Forest shape: trees per baseline and training rows drawn per tree
+N_ESTIMATORS = int(os.environ.get("IFOREST_N_ESTIMATORS", "200"))
+MAX_SAMPLES = parse_max_samples(os.environ.get("IFOREST_MAX_SAMPLES", "auto"))
+
+# Scoring: rows converted to float32 at a time, and threads splitting one forest's trees.
+# Batches under SCORE_PARALLEL_MIN_ROWS stay on the calling thread.
+SCORE_CHUNK_ROWS = 50_000
+SCORE_N_JOBS = int(os.environ.get("SCORE_N_JOBS", "1"))
+SCORE_PARALLEL_MIN_ROWS = 20_000
+
+# Rolling engine: exponentially weighted per-metric baselines, updated sample by sample
+ROLLING_ALPHA = 0.02          # weight of the newest sample (~50-sample memory)
+ROLLING_Z_THRESHOLD = 3.5     # robust |z| above which a sample is flagged
+ROLLING_WARMUP = 30           # samples a baseline must have seen before it may flag
+MAD_TO_SIGMA = 1.2533         # sigma / mean absolute deviation for normally distributed data
+
+# Background refits run one at a time, off the request thread
+_refit_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="refit")
+_refit_pending = set()
+_refit_lock = threading.Lock()
+
 def _available_feature_cols(df: pd.DataFrame, candidates: List[str]) -> List[str]:
     return [c for c in candidates if c in df.columns]
 
-def fit_isolation_forest(df: pd.DataFrame, contamination: float = 0.03, random_state: int = 7) -> Tuple[IsolationForest, List[str]]:
-    feature_cols = _available_feature_cols(df, FEATURE_COLS_DEFAULT)
+def usable_feature_cols(df: pd.DataFrame, candidates: Optional[List[str]] = None) -> List[str]:
+    # Columns read back from the DB exist even when an upload never had them
+    candidates = FEATURE_COLS_DEFAULT if candidates is None else candidates
+    return [c for c in _available_feature_cols(df, candidates) if df[c].notna().all()]
+
+@metrics.timed("model.fit_isolation_forest", rows=metrics.first_arg_len)
+def fit_isolation_forest(df: pd.DataFrame, contamination: float = 0.03, random_state: int = 7,
+                         feature_cols: Optional[List[str]] = None, n_jobs: Optional[int] = None,
+                         n_estimators: Optional[int] = None,
+                         max_samples: Optional[object] = None) -> Tuple[IsolationForest, List[str]]:
+    # n_estimators / max_samples default to N_ESTIMATORS / MAX_SAMPLES
+    if feature_cols is None:
+        feature_cols = _available_feature_cols(df, FEATURE_COLS_DEFAULT)
     if not feature_cols:
         raise ValueError("No numeric feature columns found for modeling.")
-    X = df[feature_cols].astype(float).values
+    X = df[feature_cols].to_numpy(dtype=np.float32)  # the trees' own dtype: no internal copy
     model = IsolationForest(
-        n_estimators=200,
+        n_estimators=N_ESTIMATORS if n_estimators is None else n_estimators,
+        max_samples=MAX_SAMPLES if max_samples is None else max_samples,
         contamination=contamination,
-        random_state=random_state
+        random_state=random_state,
+        n_jobs=n_jobs,
     )
     model.fit(X)
     return model, feature_cols
 
-def score_anomalies(df: pd.DataFrame, contamination: float = 0.03) -> pd.DataFrame:
+def forest_matches(model: IsolationForest) -> bool:
+    # Whether a saved forest has the configured shape; others are refitted when next due
+    return model.n_estimators == N_ESTIMATORS and model.max_samples == MAX_SAMPLES
+
+
+class _ForestScorer:
+    """
+    Per-tree lookup of the path length a sample reaching each leaf gets (node depth plus the
+    average path length of the training samples left there), precomputed once per fitted
+    forest so scoring is one Tree.apply per tree and chunk. Matches
+    IsolationForest.score_samples.
+    """
+
+    def __init__(self, model: IsolationForest):
+        self.offset = float(model.offset_)
+        self.trees = []
+        for est, feats in zip(model.estimators_, model.estimators_features_):
+            tree = est.tree_
+            # compute_node_depths() counts the root as depth 1
+            path = tree.compute_node_depths() + _average_path_length(tree.n_node_samples) - 1.0
+            all_feats = len(feats) == model.n_features_in_ and np.array_equal(feats, np.arange(len(feats)))
+            self.trees.append((tree, None if all_feats else np.asarray(feats), path))
+        self.denominator = len(self.trees) * float(_average_path_length(np.array([model.max_samples_]))[0])
+
+    def _depths(self, X: np.ndarray, trees) -> np.ndarray:
+        total = np.zeros(len(X))
+        for tree, feats, path in trees:
+            Xt = X if feats is None else np.ascontiguousarray(X[:, feats])
+            total += path[tree.apply(Xt)]
+        return total
+
+    def decision(self, X: np.ndarray, pool: Optional[ThreadPoolExecutor] = None, n_jobs: int = 1) -> np.ndarray:
+        # decision_function for one float32 chunk; trees are split over `pool` when given
+        if pool is None:
+            depths = self._depths(X, self.trees)
+        else:
+            groups = [self.trees[i::n_jobs] for i in range(n_jobs)]
+            depths = sum(pool.map(lambda g: self._depths(X, g), groups))
+        if self.denominator == 0:
+            return np.full(len(X), -0.5 - self.offset)  # single-sample forests score 0.5
+        return -(2.0 ** (-depths / self.denominator)) - self.offset
+
+
+def _average_path_length(n: np.ndarray) -> np.ndarray:
+    # Average unsuccessful BST search length c(n) of an isolation tree over n samples
+    n = np.asarray(n, dtype=float)
+    out = np.zeros_like(n)
+    out[n == 2] = 1.0
+    big = n > 2
+    out[big] = 2.0 * (np.log(n[big] - 1.0) + np.euler_gamma) - 2.0 * (n[big] - 1.0) / n[big]
+    return out
+
+
+_scorers: "weakref.WeakKeyDictionary[IsolationForest, _ForestScorer]" = weakref.WeakKeyDictionary()
+_scorers_lock = threading.Lock()
+
+def _scorer(model: IsolationForest) -> _ForestScorer:
+    with _scorers_lock:
+        scorer = _scorers.get(model)
+    if scorer is None:
+        scorer = _ForestScorer(model)
+        with _scorers_lock:
+            _scorers[model] = scorer
+    return scorer
+
+@metrics.timed("model.forest_decision", rows=metrics.result_len)
+def forest_decision(model: IsolationForest, df: pd.DataFrame, cols: List[str], n_jobs: Optional[int] = None,
+                    chunk_rows: int = SCORE_CHUNK_ROWS) -> np.ndarray:
+    """
+    IsolationForest.decision_function over df[cols] with a single pass through the trees:
+    negative values are outliers (predict() == -1) and the negated value is the raw anomaly
+    score, so flag and score come from the same traversal. Rows are converted to float32 in
+    chunks of `chunk_rows`, bounding the temporary feature matrix; with `n_jobs` > 1 (default
+    SCORE_N_JOBS) batches of at least SCORE_PARALLEL_MIN_ROWS split the trees across threads.
+    """
+    scorer = _scorer(model)
+    n = len(df)
+    n_jobs = max(1, SCORE_N_JOBS if n_jobs is None else n_jobs)
+    out = np.empty(n)
+    pool = ThreadPoolExecutor(max_workers=n_jobs, thread_name_prefix="score") \
+        if n_jobs > 1 and n >= SCORE_PARALLEL_MIN_ROWS else None
+    try:
+        features = df[cols]
+        for i in range(0, n, chunk_rows):
+            X = np.ascontiguousarray(features.iloc[i:i + chunk_rows].to_numpy(dtype=np.float32))
+            out[i:i + len(X)] = scorer.decision(X, pool, n_jobs)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return out
+
+@metrics.timed("model.fit_baseline", rows=metrics.first_arg_len)
+def fit_baseline(df: pd.DataFrame, contamination: float = 0.03,
+                 feature_cols: Optional[List[str]] = None, n_jobs: Optional[int] = None,
+                 n_estimators: Optional[int] = None, max_samples: Optional[object] = None) -> registry.ModelEntry:
+    # Fit a forest and capture the reference statistics needed to score later batches
+    train = df.tail(MAX_FIT_ROWS)
+    model, cols = fit_isolation_forest(train, contamination=contamination, feature_cols=feature_cols,
+                                       n_jobs=n_jobs, n_estimators=n_estimators, max_samples=max_samples)
+    raw = -forest_decision(model, train, cols, n_jobs=n_jobs)
+    sd = train[cols].std().fillna(0.0).replace(0, 1e-9)
+    return registry.ModelEntry(
+        model=model,
+        feature_cols=cols,
+        contamination=float(contamination),
+        fit_rows=int(len(train)),
+        score_lo=float(raw.min()),
+        score_hi=float(raw.max()),
+        feature_mean=[float(v) for v in train[cols].mean().fillna(0.0)],
+        feature_std=[float(v) for v in sd],
+    )
+
+def top_k_drivers(z: np.ndarray, feature_cols: List[str], k: int = DRIVER_TOP_K) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k features by absolute z-score for every row of `z` (n_rows x n_features).
+    Returns (names, magnitudes), both n_rows x k and ordered by descending magnitude.
+    """
+    z = np.nan_to_num(np.abs(np.asarray(z, dtype=float)), nan=0.0)
+    k = max(1, min(int(k), z.shape[1]))
+    if k < z.shape[1]:
+        idx = np.argpartition(-z, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(k), z.shape).copy()
+    mags = np.take_along_axis(z, idx, axis=1)
+    order = np.argsort(-mags, axis=1, kind="stable")
+    idx = np.take_along_axis(idx, order, axis=1)
+    mags = np.take_along_axis(mags, order, axis=1)
+    names = np.asarray(feature_cols, dtype=object)[idx]
+    return names, mags
+
+def _join_driver_names(names: np.ndarray) -> np.ndarray:
+    # Column-wise string join: k vectorized concatenations instead of one join per row
+    labels = names[:, 0].copy()
+    for j in range(1, names.shape[1]):
+        labels = labels + ", " + names[:, j]
+    return labels
+
+@metrics.timed("model.score_anomalies", rows=metrics.result_len)
+def score_anomalies(df: pd.DataFrame, contamination: float = 0.03,
+                    entry: Optional[registry.ModelEntry] = None,
+                    top_k: int = DRIVER_TOP_K, driver_magnitudes: bool = False,
+                    n_jobs: Optional[int] = None) -> pd.DataFrame:
     out = df.copy()
-    model, cols = fit_isolation_forest(out, contamination=contamination)
+    if entry is None:
+        model, cols = fit_isolation_forest(out, contamination=contamination)
+        score_bounds = None
+        mu = out[cols].mean()
+        sd = out[cols].std().replace(0, 1e-9)
+    else:
+        model, cols = entry.model, entry.feature_cols
+        score_bounds = (entry.score_lo, entry.score_hi)
+        mu = pd.Series(entry.feature_mean, index=cols)
+        sd = pd.Series(entry.feature_std, index=cols)
 
-    X = out[cols].astype(float).values
-    # Higher score = less anomalous in sklearn; we invert to make "higher = more anomalous"
-    raw_score = model.decision_function(X)  # higher is more normal
-    anomaly_score = (-raw_score - (-raw_score).min()) / ((-raw_score).max() - (-raw_score).min() + 1e-9)
+    # One traversal gives both: decision < 0 is predict() == -1, and sklearn's "higher = less
+    # anomalous" is inverted to make "higher = more anomalous"
+    decision = forest_decision(model, out, cols, n_jobs=n_jobs)
+    raw_score = -decision
+    if score_bounds is None:
+        anomaly_score = (raw_score - raw_score.min()) / (raw_score.max() - raw_score.min() + 1e-9)
+    else:
+        # Normalize against the baseline's training range so scores compare across batches
+        lo, hi = score_bounds
+        anomaly_score = np.clip((raw_score - lo) / (hi - lo + 1e-9), 0.0, 1.0)
 
-    pred = model.predict(X)  # -1 anomaly, 1 normal
-    out["anomaly_flag"] = (pred == -1).astype(int)
+    flagged = decision < 0
+    out["anomaly_flag"] = flagged.astype(int)
     out["anomaly_score"] = anomaly_score
 
     # Simple driver attribution: z-score magnitude per feature for flagged points
-    drivers = []
-    mu = out[cols].mean()
-    sd = out[cols].std().replace(0, 1e-9)
-    z = ((out[cols] - mu) / sd).abs()
-    for i in range(len(out)):
-        if out.loc[out.index[i], "anomaly_flag"] == 1:
-            top = z.iloc[i].sort_values(ascending=False).head(2).index.tolist()
-            drivers.append(", ".join(top))
-        else:
-            drivers.append("")
+    X = out.loc[flagged, cols].to_numpy(dtype=float)
+    z = (X - mu.to_numpy(dtype=float)) / sd.to_numpy(dtype=float)
+    names, mags = top_k_drivers(z, cols, k=top_k)
+    drivers = np.full(len(out), "", dtype=object)
+    if flagged.any():
+        drivers[flagged] = _join_driver_names(names)
     out["anomaly_drivers"] = drivers
+    if driver_magnitudes:
+        # anomaly_driver_z1..zk hold |z| of the named drivers, NaN for unflagged rows
+        for j in range(mags.shape[1]):
+            col = np.full(len(out), np.nan)
+            col[flagged] = mags[:, j]
+            out[f"anomaly_driver_z{j + 1}"] = col
     return out
+
+def score_for_user(user_id: int, df: pd.DataFrame, contamination: float = 0.03,
+                   registry_dir: str = registry.REGISTRY_DIR_DEFAULT,
+                   feature_cols: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Scores a batch against the user's saved baseline forest.
+    A baseline is fitted synchronously only when the user has none yet.
+    `feature_cols` restricts the candidate features (default FEATURE_COLS_DEFAULT).
+    """
+    cols = usable_feature_cols(df, feature_cols)
+    if not cols:
+        raise ValueError("No numeric feature columns found for modeling.")
+    entry = registry.load_model(user_id, cols, registry_dir)
+    if entry is None or abs(entry.contamination - contamination) > 1e-12:
+        entry = fit_baseline(df, contamination=contamination, feature_cols=cols)
+        registry.save_model(user_id, entry, registry_dir)
+        return score_anomalies(df, contamination=contamination, entry=entry)
+    out = score_anomalies(df, contamination=contamination, entry=entry)
+    registry.record_scored(user_id, entry, len(df), registry_dir)
+    return out
+
+def _refit_job(user_id: int, cols: List[str], contamination: float,
+               history_loader: Callable[[], pd.DataFrame], registry_dir: str) -> None:
+    key = (user_id, tuple(cols), registry_dir)
+    try:
+        hist = history_loader()
+        if hist is None or hist.empty or any(c not in hist.columns for c in cols):
+            return
+        hist = hist.dropna(subset=cols)
+        if hist.empty:
+            return
+        entry = fit_baseline(hist, contamination=contamination, feature_cols=cols)
+        registry.save_model(user_id, entry, registry_dir)
+    finally:
+        with _refit_lock:
+            _refit_pending.discard(key)
+
+def refit_if_due(user_id: int, feature_cols: List[str], contamination: float,
+                 history_loader: Callable[[], pd.DataFrame],
+                 registry_dir: str = registry.REGISTRY_DIR_DEFAULT):
+    """
+    Schedules a background refit of the user's baseline when the registry policy says it is stale.
+    `history_loader` is called on the worker thread and should return the user's stored records.
+    Returns the Future of the scheduled refit, or None when no refit was needed.
+    """
+    entry = registry.load_model(user_id, feature_cols, registry_dir)
+    if entry is not None and not registry.needs_refit(entry, contamination) and forest_matches(entry.model):
+        return None
+    key = (user_id, tuple(feature_cols), registry_dir)
+    with _refit_lock:
+        if key in _refit_pending:
+            return None
+        _refit_pending.add(key)
+    return _refit_pool.submit(_refit_job, user_id, list(feature_cols), contamination, history_loader, registry_dir)
+
+
+class Detector(ABC):
+    """
+    Anomaly engine interface. score() returns `df` with anomaly_flag/anomaly_score/anomaly_drivers
+    added and persists whatever per-user state the engine keeps; after_ingest() runs once per upload
+    and does nothing unless the engine overrides it.
+    """
+    name = ""
+
+    @abstractmethod
+    def score(self, user_id: int, df: pd.DataFrame, contamination: float = 0.03,
+              feature_cols: Optional[List[str]] = None,
+              registry_dir: str = registry.REGISTRY_DIR_DEFAULT) -> pd.DataFrame:
+        ...
+
+    def after_ingest(self, user_id: int, feature_cols: List[str], contamination: float,
+                     history_loader: Callable[[], pd.DataFrame],
+                     registry_dir: str = registry.REGISTRY_DIR_DEFAULT):
+        return None
+
+
+class IsolationForestDetector(Detector):
+    # Batch engine: per-user baseline forest, refitted in the background when stale
+    name = "isolation_forest"
+
+    def score(self, user_id, df, contamination=0.03, feature_cols=None,
+              registry_dir=registry.REGISTRY_DIR_DEFAULT):
+        return score_for_user(user_id, df, contamination, registry_dir, feature_cols=feature_cols)
+
+    def after_ingest(self, user_id, feature_cols, contamination, history_loader,
+                     registry_dir=registry.REGISTRY_DIR_DEFAULT):
+        return refit_if_due(user_id, feature_cols, contamination, history_loader, registry_dir)
+
+
+def _ew_filter(x: np.ndarray, alpha: float, init: float) -> np.ndarray:
+    # y_t = (1 - alpha) * y_{t-1} + alpha * x_t seeded with y_{-1} = init, in one C-level pass
+    y, _ = lfilter([alpha], [1.0, alpha - 1.0], x, zi=[(1.0 - alpha) * init])
+    return y
+
+def rolling_update(x: np.ndarray, mean: float, mad: float, count: int,
+                   alpha: float = ROLLING_ALPHA) -> Tuple[np.ndarray, float, float, int]:
+    """
+    Scores time-ordered samples `x` of one baseline, each against the state left by the samples
+    before it, then folds them in. The scale is an EW mean absolute deviation, so a single spike
+    inflates it far less than it would a variance. Returns (robust z per sample, mean, mad, count).
+    """
+    if count == 0:
+        mean = float(x[0])
+    m = _ew_filter(x, alpha, mean)
+    m_prev = np.r_[mean, m[:-1]]
+    dev = x - m_prev
+    s = _ew_filter(np.abs(dev), alpha, mad)
+    s_prev = np.r_[mad, s[:-1]]
+    scale = np.maximum(MAD_TO_SIGMA * s_prev, 1e-3 * np.abs(m_prev) + 1e-9)
+    seen = count + np.arange(len(x))
+    z = np.where(seen >= ROLLING_WARMUP, dev / scale, 0.0)
+    return z, float(m[-1]), float(s[-1]), count + len(x)
+
+
+class RollingDetector(Detector):
+    """
+    Online engine: keeps an EW mean and mean absolute deviation per metric (optionally one per hour
+    of day) and flags samples whose robust z exceeds `threshold`. New rows update the state in O(1)
+    each; nothing is ever refitted. `contamination` is not used.
+    """
+
+    def __init__(self, name: str = "rolling", time_of_day: bool = False, alpha: float = ROLLING_ALPHA,
+                 threshold: float = ROLLING_Z_THRESHOLD):
+        self.name = name
+        self.time_of_day = time_of_day
+        self.alpha = alpha
+        self.threshold = threshold
+
+    @metrics.timed("model.rolling_score", rows=metrics.result_len)
+    def score(self, user_id, df, contamination=0.03, feature_cols=None,
+              registry_dir=registry.REGISTRY_DIR_DEFAULT):
+        candidates = FEATURE_COLS_DEFAULT if feature_cols is None else feature_cols
+        cols = [c for c in _available_feature_cols(df, candidates) if df[c].notna().any()]
+        if not cols:
+            raise ValueError("No numeric feature columns found for modeling.")
+        df = df.sort_values("timestamp")
+        n_keys = 24 if self.time_of_day else 1
+        keys = df["timestamp"].dt.hour.to_numpy() if self.time_of_day else np.zeros(len(df), dtype=int)
+        z = np.zeros((len(df), len(cols)))
+        with registry.state_lock(user_id, self.name, registry_dir):
+            state = registry.load_state(user_id, self.name, registry_dir) or {"metrics": {}}
+            for j, c in enumerate(cols):
+                st = state["metrics"].get(c) or {"mean": [0.0] * n_keys, "mad": [0.0] * n_keys, "count": [0] * n_keys}
+                x = df[c].to_numpy(dtype=float)
+                present = ~np.isnan(x)
+                for k in np.unique(keys[present]):
+                    idx = np.flatnonzero(present & (keys == k))
+                    z[idx, j], st["mean"][k], st["mad"][k], st["count"][k] = rolling_update(
+                        x[idx], st["mean"][k], st["mad"][k], st["count"][k], self.alpha)
+                state["metrics"][c] = st
+            registry.save_state(user_id, self.name, state, registry_dir)
+        return self._result(df, z, cols)
+
+    def _result(self, df: pd.DataFrame, z: np.ndarray, cols: List[str]) -> pd.DataFrame:
+        out = df.copy()
+        peak = np.abs(z).max(axis=1)
+        flagged = peak > self.threshold
+        out["anomaly_flag"] = flagged.astype(int)
+        # threshold maps to 0.5 so scores stay comparable with the forest's 0..1 range
+        out["anomaly_score"] = np.clip(peak / (2.0 * self.threshold), 0.0, 1.0)
+        names, _ = top_k_drivers(z[flagged], cols)
+        drivers = np.full(len(out), "", dtype=object)
+        if flagged.any():
+            drivers[flagged] = _join_driver_names(names)
+        out["anomaly_drivers"] = drivers
+        return out
+
+
+DETECTORS: Dict[str, Detector] = {
+    "isolation_forest": IsolationForestDetector(),
+    "rolling": RollingDetector(),
+    "rolling_tod": RollingDetector("rolling_tod", time_of_day=True),
+}
+DEFAULT_ENGINE = "isolation_forest"
+
+def get_detector(engine: Optional[str] = None) -> Detector:
+    engine = engine or DEFAULT_ENGINE
+    if engine not in DETECTORS:
+        raise ValueError(f"Unknown detector engine: {engine}")
+    return DETECTORS[engine]
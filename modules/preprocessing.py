@@ -1,7 +1,39 @@
+import codecs
 import io
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Tuple
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from . import columnar
+from . import metrics
+from .db import HEALTH_COLUMNS
+
+# Streaming ingest defaults
+STREAM_CHUNK_ROWS = 50_000
+STREAM_SNIFF_BYTES = 64 * 1024
+STREAM_DEDUPE_WINDOW = 200_000   # recent timestamps remembered for cross-chunk dedupe
+STREAM_RESERVOIR_SIZE = 50_000   # per-column sample used for approximate clip quantiles
+STREAM_MAX_CARRY_ROWS = 100_000  # trailing gap rows held back waiting for the next valid value
+
+# Resampling grid (resample_to_grid): step name -> seconds
+GRID_STEPS = {"1min": 60, "5min": 300, "hourly": 3600}
+GRID_STEP_DEFAULT = "5min"
+GRID_MAX_GAP_DEFAULT = "1h"      # longer gaps stay empty instead of being filled
+GRID_MAX_BUCKETS = 1_000_000
+
+# How readings within one grid step combine: per-reading quantities add up, levels average
+AGG_RULES = {
+    "heart_rate": "mean",
+    "steps": "sum",
+    "sleep_hours": "sum",
+    "calories": "sum",
+    "blood_pressure_systolic": "mean",
+    "blood_pressure_diastolic": "mean",
+    "glucose": "mean",
+}
+
+class SchemaError(ValueError):
+    pass
 
 REQUIRED_COLS = []
 NUMERIC_COLS = [
@@ -9,6 +41,7 @@ NUMERIC_COLS = [
     "blood_pressure_systolic", "blood_pressure_diastolic", "glucose"
 ]
 
+@metrics.timed("preprocessing.read_csv_flex", rows=metrics.result_len, bytes_in=metrics.first_arg_len)
 def read_csv_flex(file_bytes: bytes) -> pd.DataFrame:
     # Accept comma-separated CSV or tab-separated TSV automatically
     try:
@@ -22,6 +55,54 @@ def read_csv_flex(file_bytes: bytes) -> pd.DataFrame:
     return pd.read_csv(io.StringIO(text), sep=sep)
 
 
+def rows_to_df(rows) -> pd.DataFrame:
+    # sqlite3.Row results -> time-ordered frame
+    if not rows:
+        return pd.DataFrame()
+    df = pd.DataFrame([dict(r) for r in rows])
+    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+    df = df.dropna(subset=["timestamp"]).sort_values("timestamp")
+    return df
+
+
+@metrics.timed("preprocessing.records_to_df", rows=metrics.result_len)
+def records_to_df(records: List[Dict[str, Any]], max_errors: int = 5) -> pd.DataFrame:
+    """
+    Validates a batch of JSON records ({"timestamp": ISO-8601 string, <metric>: number|null, ...})
+    against NUMERIC_COLS. Returns a timestamp-sorted frame with duplicate timestamps dropped
+    (first wins); raises SchemaError describing the first few bad records. No filling or clipping.
+    """
+    if not records:
+        raise SchemaError("Batch contains no records.")
+    if not all(isinstance(r, dict) for r in records):
+        raise SchemaError("Every record must be a JSON object.")
+    df = pd.DataFrame.from_records(records)
+    unknown = [c for c in df.columns if c != "timestamp" and c not in NUMERIC_COLS]
+    if unknown:
+        raise SchemaError(f"Unknown field(s): {', '.join(map(str, unknown))}. Allowed: timestamp, {', '.join(NUMERIC_COLS)}")
+    if "timestamp" not in df.columns:
+        raise SchemaError("Every record needs a timestamp.")
+
+    errors = []
+    raw_ts = df["timestamp"]
+    ts = pd.to_datetime(raw_ts.where(raw_ts.map(type) == str), errors="coerce", utc=True, format="mixed")
+    for i in np.flatnonzero(ts.isna().to_numpy())[:max_errors]:
+        errors.append(f"record {i}: invalid timestamp {raw_ts.iloc[i]!r}")
+    df["timestamp"] = ts.dt.tz_localize(None).dt.floor("s")  # stored at second resolution
+    for c in NUMERIC_COLS:
+        if c not in df.columns:
+            continue
+        raw = df[c]
+        # bools are ints to pandas; a reading is never true/false
+        valid = raw.isna() | raw.map(lambda v: isinstance(v, (int, float)) and not isinstance(v, bool))
+        for i in np.flatnonzero(~valid.to_numpy())[:max_errors - len(errors)]:
+            errors.append(f"record {i}: {c} must be a number or null, got {raw.iloc[i]!r}")
+        df[c] = pd.to_numeric(raw.where(valid), errors="coerce")
+    if errors:
+        raise SchemaError("; ".join(errors[:max_errors]))
+
+    return df.drop_duplicates(subset=["timestamp"]).sort_values("timestamp", kind="stable").reset_index(drop=True)
+
 def validate_schema(df: pd.DataFrame) -> Tuple[bool, str]:
     # Normalize column
     df.columns = [str(c).strip().lower() for c in df.columns]
@@ -32,6 +113,29 @@ def validate_schema(df: pd.DataFrame) -> Tuple[bool, str]:
     return True, ""
 
 
+def interpolate_time(t: np.ndarray, y: np.ndarray, max_gap: Optional[float] = None) -> np.ndarray:
+    """
+    Fills NaNs in `y` linearly in time `t` (sorted, any numeric unit). Without `max_gap`, leading
+    and trailing gaps take the nearest value (interpolate(limit_direction="both"), but weighted
+    by time instead of row position). With it, gaps whose neighbouring readings are more than
+    `max_gap` apart, and gaps at either end, stay NaN. Returns a new array.
+    """
+    y = np.array(y, dtype=float)
+    ok = ~np.isnan(y)
+    if ok.all() or not ok.any():
+        return y
+    t = np.asarray(t, dtype=float)
+    miss = np.flatnonzero(~ok)
+    tv = t[ok]
+    y[miss] = np.interp(t[miss], tv, y[ok])
+    if max_gap is not None:
+        nxt = np.searchsorted(tv, t[miss], side="right")
+        inner = (nxt > 0) & (nxt < len(tv))
+        nxt = np.clip(nxt, 1, len(tv) - 1)
+        y[miss[~inner | (tv[nxt] - tv[nxt - 1] > max_gap)]] = np.nan
+    return y
+
+
 def coerce_types_and_fill(df: pd.DataFrame) -> pd.DataFrame:
     out = df.copy()
 
@@ -45,11 +149,11 @@ def coerce_types_and_fill(df: pd.DataFrame) -> pd.DataFrame:
         if c in out.columns:
             out[c] = pd.to_numeric(out[c], errors="coerce")
 
-    # Fill missing values
+    # Fill missing values, weighted by time; only all-empty columns are left with gaps
+    t = out["timestamp"].to_numpy(dtype="datetime64[ns]").astype(np.int64)
     for c in NUMERIC_COLS:
         if c in out.columns:
-            out[c] = out[c].interpolate(limit_direction="both")
-            out[c] = out[c].fillna(out[c].median())
+            out[c] = interpolate_time(t, out[c].to_numpy(dtype=float))
 
     return out
 
@@ -65,24 +169,372 @@ def clip_outliers(df: pd.DataFrame) -> pd.DataFrame:
                 out[c] = out[c].clip(lo, hi)
     return out
 
+def _fill_and_clip(m: np.ndarray, t: np.ndarray) -> None:
+    """
+    In place on a (columns, rows) float matrix with row times `t`: time-weighted gap
+    interpolation with edge fill (interpolate_time), then 1%/99% clipping with bounds from
+    one nanquantile call over all columns. Interpolation leaves gaps only in all-empty columns.
+    """
+    missing = np.isnan(m)
+    has_values = ~missing.all(axis=1)
+    if missing.any():
+        t = np.asarray(t, dtype=float)
+        for i in np.flatnonzero(missing.any(axis=1) & has_values):
+            ok = ~missing[i]
+            m[i, ~ok] = np.interp(t[~ok], t[ok], m[i, ok])
+    if not has_values.any():
+        return
+    rows = np.flatnonzero(has_values)
+    q = np.nanquantile(m if len(rows) == len(m) else m[rows], [0.01, 0.99], axis=1)
+    use = q[0] < q[1]
+    lo = np.full(len(m), -np.inf)
+    hi = np.full(len(m), np.inf)
+    lo[rows[use]] = q[0, use]
+    hi[rows[use]] = q[1, use]
+    np.clip(m, lo[:, None], hi[:, None], out=m)
+
+
+@metrics.timed("preprocessing.clean_health_df", rows=metrics.result_len)
 def clean_health_df(df: pd.DataFrame) -> pd.DataFrame:
-    df2 = df.copy()
-    df2.columns = [str(c).strip().lower() for c in df2.columns]
+    """
+    Dedupe, timestamp coercion and sort, numeric coercion, time-weighted gap interpolation and
+    outlier clipping. Numeric columns are gathered once into a float matrix and cleaned in place
+    (_fill_and_clip); the input frame is never copied. Equivalent to
+    clip_outliers(coerce_types_and_fill(remove_duplicates(df))), with numeric columns as float64.
+    """
+    names = [str(c).strip().lower() for c in df.columns]
+    src = {name: df.iloc[:, i] for i, name in enumerate(names)}
+
+    # Create timestamp if missing (hourly, ending now; regular, so time-weighted filling is positional)
+    if "timestamp" not in src:
+        names.append("timestamp")
+        src["timestamp"] = pd.Series(pd.date_range(end=pd.Timestamp.now(), periods=len(df), freq="h"),
+                                     index=df.index)
+
+    # Dedupe on the raw values (first wins), then drop unparseable timestamps and sort
+    keep = np.flatnonzero(~src["timestamp"].duplicated().to_numpy())
+    ts = pd.to_datetime(src["timestamp"].take(keep), errors="coerce")
+    valid = ts.notna().to_numpy()
+    keep, ts = keep[valid], ts[valid]
+    order = ts.array.argsort(kind="stable")
+    keep, ts = keep[order], ts.array.take(order)
+
+    cols = [c for c in NUMERIC_COLS if c in src]
+    m = np.empty((len(cols), len(keep)))
+    for i, c in enumerate(cols):
+        m[i] = pd.to_numeric(src[c].take(keep), errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    _fill_and_clip(m, ts.to_numpy(dtype="datetime64[ns]").astype(np.int64))
+
+    rows = dict(zip(cols, m))
+    out = {}
+    for name in names:
+        if name == "timestamp":
+            out[name] = ts
+        elif name in rows:
+            out[name] = rows[name]
+        else:
+            out[name] = src[name].array.take(keep)
+    return pd.DataFrame(out, index=df.index.take(keep), copy=False)
+
+
+def _spread_sums(idx: np.ndarray, v: np.ndarray, max_gap_steps: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Time-weighted spreading for "sum" columns: a reading that follows the previous one by at most
+    `max_gap_steps` grid steps is split evenly over the steps it covers (those after the previous
+    reading's step, up to its own), so totals are kept. Returns (target step, amount) pairs.
+    """
+    k = np.ones(len(idx), dtype=np.int64)
+    if len(idx) > 1:
+        gap = np.diff(idx)
+        k[1:] = np.where(gap <= max_gap_steps, np.maximum(gap, 1), 1)
+    starts = np.cumsum(k) - k
+    offset = np.arange(int(k.sum())) - np.repeat(starts, k)
+    return np.repeat(idx, k) - offset, np.repeat(v / k, k)
+
+
+@metrics.timed("preprocessing.resample_to_grid", rows=metrics.first_arg_len)
+def resample_to_grid(df: pd.DataFrame, step: str = GRID_STEP_DEFAULT, max_gap: Any = GRID_MAX_GAP_DEFAULT,
+                     rules: Optional[Dict[str, str]] = None, start: Any = None, end: Any = None) -> pd.DataFrame:
+    """
+    Snaps cleaned, time-ordered records onto a fixed grid of GRID_STEPS[step], one row per step
+    from the first to the last reading (or over [start, end)). Per column, AGG_RULES (or `rules`)
+    decide how readings in a step combine:
+    - "mean": mean of the readings; steps without any take time-weighted interpolation between
+      the neighbouring readings (interpolate_time)
+    - "sum": total of the readings; a reading after a gap is spread evenly over the steps since
+      the previous one, so a coarser device cadence is not counted once per step
+    Gaps longer than `max_gap` (a Timedelta or string like "1h"; None = no limit) stay NaN, as do
+    steps before the first and after the last reading.
+
+    The frame has the shape of db.load_series_frame tiers: `timestamp` (step start),
+    record_count, anomaly_count, and per metric the value plus `<metric>_count` (readings in the
+    step; 0 where the value was filled). attrs["tier"] holds the step in seconds, attrs["grid"]
+    the step name and attrs["rules"] the rules used. Raises ValueError for unknown steps or
+    rules and for grids over GRID_MAX_BUCKETS steps.
+    """
+    if step not in GRID_STEPS:
+        raise ValueError(f"Unknown grid step: {step}. Allowed: {', '.join(GRID_STEPS)}")
+    rules = {**AGG_RULES, **(rules or {})}
+    bad = sorted({r for c, r in rules.items() if r not in ("mean", "sum")})
+    if bad:
+        raise ValueError(f"Unknown aggregation rule(s): {', '.join(bad)}")
+    width = GRID_STEPS[step]
+    gap_s = np.inf if max_gap is None else pd.Timedelta(max_gap).total_seconds()
+    cols = [c for c in NUMERIC_COLS if c in df.columns]
+
+    t = df["timestamp"].to_numpy(dtype="datetime64[ns]").astype(np.int64) // 10**9
+    lo = _epoch_s(start) if start is not None else int(t.min()) if len(t) else 0
+    hi = _epoch_s(end) if end is not None else int(t.max()) + 1 if len(t) else 0
+    lo -= lo % width
+    n = max(-(-(hi - lo) // width), 0)
+    if n > GRID_MAX_BUCKETS:
+        raise ValueError(f"Grid of {n} {step} steps exceeds {GRID_MAX_BUCKETS}; use a coarser step or shorter range.")
+    inside = (t >= lo) & (t < lo + n * width)
+    t = t[inside]
+    idx = (t - lo) // width
+
+    out = {
+        "timestamp": (lo + width * np.arange(n, dtype=np.int64)).view("datetime64[s]"),
+        "record_count": np.bincount(idx, minlength=n).astype(np.int64),
+    }
+    if "anomaly_flag" in df.columns:
+        flags = np.nan_to_num(df["anomaly_flag"].to_numpy(dtype=float)[inside])
+        out["anomaly_count"] = np.bincount(idx, weights=flags, minlength=n).astype(np.int64)
+    else:
+        out["anomaly_count"] = np.zeros(n, dtype=np.int64)
+    mid = lo + width * (np.arange(n) + 0.5)
+    for c in cols:
+        v = df[c].to_numpy(dtype=float)[inside]
+        ok = ~np.isnan(v)
+        i, v, tc = idx[ok], v[ok], t[ok]
+        count = np.bincount(i, minlength=n)
+        has = count > 0
+        if rules.get(c, "mean") == "sum":
+            target, amount = _spread_sums(i, v, gap_s / width)
+            value = np.bincount(target, weights=amount, minlength=n).astype(float)
+            covered = np.bincount(target, minlength=n) > 0
+            value[~covered] = np.nan
+        else:
+            value = np.full(n, np.nan)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                value[has] = (np.bincount(i, weights=v, minlength=n) / count)[has]
+                # Empty steps are interpolated from the steps' mean reading times
+                t_mean = np.bincount(i, weights=tc.astype(float), minlength=n) / count
+            x = np.where(has, t_mean, mid)
+            value = interpolate_time(x, value, gap_s)
+        out[c] = value
+        out[f"{c}_count"] = count.astype(np.int64)
+
+    grid = pd.DataFrame(out)
+    grid.attrs.update(tier=width, grid=step, rules={c: rules.get(c, "mean") for c in cols})
+    return grid
+
 
-    # Create timestamp if missing
-    if "timestamp" not in df2.columns:
-        df2["timestamp"] = pd.date_range(
-            end=pd.Timestamp.now(),
-            periods=len(df2),
-            freq="H"
-        )
+def _epoch_s(value: Any) -> int:
+    # Naive timestamps are UTC, like the stored ts column
+    return int(pd.Timestamp(value).timestamp())
 
-    df2 = remove_duplicates(df2)
-    df2 = coerce_types_and_fill(df2)
-    df2 = clip_outliers(df2)
-    return df2
 
+class _PrefixedStream(io.RawIOBase):
+    # Replays bytes already read for sniffing before continuing with the wrapped stream
+    def __init__(self, head: bytes, rest: IO[bytes]):
+        self._head = head
+        self._rest = rest
 
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if self._head:
+            n = min(len(b), len(self._head))
+            b[:n] = self._head[:n]
+            self._head = self._head[n:]
+            return n
+        data = self._rest.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+def open_text_stream(binary: IO[bytes], sniff_bytes: int = STREAM_SNIFF_BYTES) -> Tuple[IO[str], str]:
+    """
+    Wraps an upload stream for chunked parsing. Separator and encoding are sniffed
+    from the first bytes only, mirroring read_csv_flex.
+    """
+    head = binary.read(sniff_bytes)
+    try:
+        text = codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        encoding = "utf-8"
+    except UnicodeDecodeError:
+        text = head.decode("latin-1")
+        encoding = "latin-1"
+    first_line = text.splitlines()[0] if text else ""
+    sep = "\t" if "\t" in first_line else ","
+    raw = io.BufferedReader(_PrefixedStream(head, binary))
+    return io.TextIOWrapper(raw, encoding=encoding, errors="replace", newline=""), sep
+
+
+class StreamingCleaner:
+    """
+    Chunk-at-a-time equivalent of clean_health_df with bounded state:
+    - duplicates are dropped against a sliding window of recent timestamps
+    - gaps are interpolated across chunk boundaries (trailing gap rows are held
+      back until the next valid value arrives, or flushed by finish())
+    - 1%/99% clip bounds come from a fixed-size reservoir sample per column
+    Rows are sorted within each chunk; the file is assumed to be roughly time-ordered. Late rows
+    (earlier than rows already emitted) are interpolated against the last emitted row, not the
+    full history, so gaps in them can differ from clean_health_df.
+    """
+
+    def __init__(self, seed: int = 7):
+        self._rng = np.random.default_rng(seed)
+        self._recent = np.empty(0, dtype=np.int64)  # ring of recent timestamps (ns)
+        self._anchor: Optional[pd.Series] = None   # last emitted numeric values
+        self._carry: Optional[pd.DataFrame] = None  # raw rows waiting for a right-hand value
+        self._reservoir: Dict[str, np.ndarray] = {}
+        self._seen: Dict[str, int] = {}
+        self._has_values = set()  # columns with at least one valid value so far
+        self.rows_in = 0
+        self.rows_out = 0
+
+    def _dedupe(self, df: pd.DataFrame) -> pd.DataFrame:
+        df = remove_duplicates(df)
+        keys = df["timestamp"].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        fresh = ~np.isin(keys, self._recent)
+        self._recent = np.concatenate([self._recent, keys[fresh]])[-STREAM_DEDUPE_WINDOW:]
+        return df if fresh.all() else df[fresh]
+
+    def _sample(self, c: str, values: np.ndarray) -> None:
+        # Vectorized reservoir sampling (Algorithm R)
+        values = values[~np.isnan(values)]
+        res = self._reservoir.get(c, np.empty(0))
+        seen = self._seen.get(c, 0)
+        room = STREAM_RESERVOIR_SIZE - len(res)
+        if room > 0:
+            res = np.concatenate([res, values[:room]])
+            seen += min(room, len(values))
+            values = values[room:]
+        if len(values):
+            t = seen + np.arange(1, len(values) + 1)
+            j = (self._rng.random(len(values)) * t).astype(np.int64)
+            keep = j < STREAM_RESERVOIR_SIZE
+            res[j[keep]] = values[keep]
+            seen += len(values)
+        self._reservoir[c] = res
+        self._seen[c] = seen
+
+    def _clip(self, df: pd.DataFrame) -> pd.DataFrame:
+        # Like clip_outliers, bounds are taken from interpolated (pre-clip) values
+        for c in NUMERIC_COLS:
+            if c in df.columns:
+                self._sample(c, df[c].to_numpy(dtype=float))
+            if c in df.columns and len(self._reservoir.get(c, ())):
+                lo, hi = np.quantile(self._reservoir[c], [0.01, 0.99])
+                if lo < hi:
+                    df[c] = df[c].clip(lo, hi)
+        return df
+
+    def _interpolate(self, df: pd.DataFrame, cols: List[str]) -> pd.DataFrame:
+        # The last emitted row anchors time-weighted interpolation across the chunk boundary.
+        # Late rows (earlier than the anchor) are sorted in ahead of it, so times always increase.
+        if self._anchor is None:
+            if not len(df):
+                return df
+            is_anchor = np.zeros(len(df), dtype=bool)
+        else:
+            df = pd.concat([self._anchor.to_frame().T.astype({"timestamp": df["timestamp"].dtype}), df])
+            order = np.argsort(df["timestamp"].to_numpy(), kind="stable")
+            df = df.iloc[order]
+            is_anchor = order == 0
+        t = df["timestamp"].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        for c in cols:
+            df[c] = interpolate_time(t, df[c].to_numpy(dtype=float))
+        self._anchor = df[["timestamp"] + cols].iloc[-1]
+        return df[~is_anchor] if is_anchor.any() else df
+
+    @metrics.timed("preprocessing.stream_clean_chunk", rows=metrics.result_len)
+    def push(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """Cleans one raw chunk; returns the rows that are ready to be scored and stored."""
+        df = chunk
+        df.columns = [str(c).strip().lower() for c in df.columns]
+        self.rows_in += len(df)
+        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+        df = self._dedupe(df.dropna(subset=["timestamp"])).sort_values("timestamp")
+        cols = [c for c in NUMERIC_COLS if c in df.columns]
+        for c in cols:
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+            if df[c].notna().any():
+                self._has_values.add(c)
+        if self._carry is not None:
+            df = pd.concat([self._carry, df]).sort_values("timestamp", kind="stable")
+            self._carry = None
+
+        # Hold back the trailing run of rows with gaps; the next chunk may close them.
+        # Until the first rows are emitted, columns with no values yet count too (leading gaps).
+        tracked = cols if self._anchor is None else [c for c in cols if c in self._has_values]
+        if tracked and len(df):
+            missing = df[tracked].isna().any(axis=1).to_numpy()
+            if missing[-1]:
+                complete = np.flatnonzero(~missing)
+                cut = complete[-1] + 1 if len(complete) else 0
+                if len(df) - cut <= STREAM_MAX_CARRY_ROWS:
+                    self._carry = df.iloc[cut:]
+                    df = df.iloc[:cut]
+
+        out = self._clip(self._interpolate(df, cols))
+        self.rows_out += len(out)
+        return out
+
+    def finish(self) -> pd.DataFrame:
+        """Flushes rows still held back at end of stream."""
+        if self._carry is None:
+            return pd.DataFrame()
+        held, self._carry = self._carry, None
+        cols = [c for c in NUMERIC_COLS if c in held.columns]
+        out = self._clip(self._interpolate(held, cols))
+        self.rows_out += len(out)
+        return out
+
+
+def iter_clean_chunks(binary: IO[bytes], chunk_rows: int = STREAM_CHUNK_ROWS,
+                      on_stage: Optional[Callable[[str], None]] = None) -> Iterator[pd.DataFrame]:
+    """
+    Streams an uploaded CSV/TSV (or Parquet / Arrow IPC file, detected by magic bytes and
+    read column-wise without any text parsing) and yields cleaned chunks ready for scoring.
+    Memory is bounded by the chunk size plus the StreamingCleaner state.
+    Files without a timestamp column fall back to the in-memory clean_health_df path,
+    since synthesized timestamps depend on the total row count.
+    `on_stage` is called with "parse"/"clean" as each chunk moves through.
+    """
+    stage = on_stage or (lambda name: None)
+    stage("parse")
+    fmt = columnar.sniff_format(binary) if binary.seekable() else "text"
+    if fmt == "text":
+        text, sep = open_text_stream(binary)
+        reader = pd.read_csv(text, sep=sep, chunksize=chunk_rows)
+    elif not columnar.available():
+        raise SchemaError(f"{fmt.title()} uploads need the optional 'pyarrow' package.")
+    else:
+        reader = columnar.iter_columnar_chunks(binary, fmt, chunk_rows)
+    cleaner = StreamingCleaner()
+    for chunk in reader:
+        stage("clean")
+        ok, err = validate_schema(chunk)
+        if not ok:
+            raise SchemaError(err)
+        if "timestamp" not in chunk.columns:
+            rest = [chunk] + list(reader)
+            yield clean_health_df(pd.concat(rest, ignore_index=True))
+            return
+        out = cleaner.push(chunk)
+        if len(out):
+            yield out
+        stage("parse")
+    stage("clean")
+    tail = cleaner.finish()
+    if len(tail):
+        yield tail
+
+
+@metrics.timed("preprocessing.to_db_rows", rows=metrics.result_len)
 def to_db_rows(df: pd.DataFrame) -> List[Dict]:
     # Convert
     rows = []
@@ -98,3 +550,42 @@ def to_db_rows(df: pd.DataFrame) -> List[Dict]:
             "glucose": float(r["glucose"]) if "glucose" in df.columns else None,
         })
     return rows
+
+
+def _object_column(values: np.ndarray) -> np.ndarray:
+    # float array -> Python floats with NaN mapped to None (SQL NULL)
+    out = values.astype(object)
+    out[np.isnan(values)] = None
+    return out
+
+@metrics.timed("preprocessing.to_db_tuples", rows=metrics.result_len)
+def to_db_tuples(df: pd.DataFrame, user_id: int) -> List[List[Any]]:
+    """
+    Column-wise conversion of a scored frame into insert_health_tuples input.
+    Each row is [user_id, *HEALTH_COLUMNS]; no per-row Python work is done here.
+    """
+    n = len(df)
+    out = np.empty((n, len(HEALTH_COLUMNS) + 1), dtype=object)
+    out[:, 0] = int(user_id)
+
+    ts = pd.to_datetime(df["timestamp"])
+    if ts.dt.tz is not None:
+        ts = ts.dt.tz_convert("UTC").dt.tz_localize(None)
+    out[:, 1] = ts.to_numpy(dtype="datetime64[s]").astype(str).astype(object)
+
+    for j, c in enumerate(HEALTH_COLUMNS[1:], start=2):
+        if c == "anomaly_flag":
+            flags = df[c].to_numpy(dtype=float) if c in df.columns else np.zeros(n)
+            out[:, j] = np.nan_to_num(flags).astype(np.int64).astype(object)
+        elif c == "anomaly_drivers":
+            if c in df.columns:
+                drivers = df[c].to_numpy(dtype=object).copy()
+                drivers[pd.isna(drivers) | (drivers == "")] = None
+                out[:, j] = drivers
+            else:
+                out[:, j] = None
+        elif c in df.columns:
+            out[:, j] = _object_column(df[c].to_numpy(dtype=float))
+        else:
+            out[:, j] = None
+    return out.tolist()
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+import joblib
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; sidecar updates are then only serialized within one process
+    fcntl = None
+
+REGISTRY_DIR_DEFAULT = os.path.join("instance", "models")
+
+# Refit policy: a saved baseline is refreshed once enough new rows were scored
+# against it, or once it is older than the max age.
+REFIT_AFTER_ROWS = 5000
+REFIT_AFTER_SECONDS = 7 * 24 * 3600
+
+_cache: Dict[str, Any] = {}
+_lock = threading.Lock()
+_sidecar_lock = threading.Lock()
+
+
+@dataclass
+class ModelEntry:
+    model: Any
+    feature_cols: List[str]
+    contamination: float
+    fit_rows: int
+    score_lo: float
+    score_hi: float
+    feature_mean: List[float] = field(default_factory=list)
+    feature_std: List[float] = field(default_factory=list)
+    fitted_at: float = field(default_factory=time.time)
+    rows_since_fit: int = 0
+
+
+def _model_key(user_id: int, feature_cols: List[str]) -> str:
+    digest = hashlib.sha1("|".join(feature_cols).encode("utf-8")).hexdigest()[:10]
+    return f"user{int(user_id)}_{digest}"
+
+def _paths(user_id: int, feature_cols: List[str], registry_dir: str):
+    key = _model_key(user_id, feature_cols)
+    return os.path.join(registry_dir, key + ".joblib"), os.path.join(registry_dir, key + ".json")
+
+def _meta(entry: ModelEntry) -> Dict[str, Any]:
+    return {
+        "feature_cols": entry.feature_cols,
+        "contamination": entry.contamination,
+        "fit_rows": entry.fit_rows,
+        "score_lo": entry.score_lo,
+        "score_hi": entry.score_hi,
+        "feature_mean": entry.feature_mean,
+        "feature_std": entry.feature_std,
+        "fitted_at": entry.fitted_at,
+        "rows_since_fit": entry.rows_since_fit,
+    }
+
+def _write_json(path: str, data: Dict[str, Any]) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fp:
+        json.dump(data, fp)
+    os.replace(tmp, path)
+
+@contextmanager
+def _sidecar_locked(path: str) -> Iterator[None]:
+    # Exclusive hold on a JSON sidecar's read-modify-write across threads, gunicorn workers and
+    # rescore processes. The lock lives in a separate `.lock` file because writes replace the sidecar.
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if fcntl is None:
+        with _sidecar_lock:
+            yield
+        return
+    with open(path + ".lock", "a") as fp:
+        fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+        yield
+
+def save_model(user_id: int, entry: ModelEntry, registry_dir: str = REGISTRY_DIR_DEFAULT) -> None:
+    os.makedirs(registry_dir, exist_ok=True)
+    model_path, meta_path = _paths(user_id, entry.feature_cols, registry_dir)
+    tmp = model_path + ".tmp"
+    joblib.dump(entry.model, tmp)
+    os.replace(tmp, model_path)
+    with _sidecar_locked(meta_path):
+        _write_json(meta_path, _meta(entry))
+    with _lock:
+        _cache[model_path] = (os.path.getmtime(model_path), entry.model)
+
+def load_model(user_id: int, feature_cols: List[str], registry_dir: str = REGISTRY_DIR_DEFAULT) -> Optional[ModelEntry]:
+    model_path, meta_path = _paths(user_id, feature_cols, registry_dir)
+    if not (os.path.exists(model_path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as fp:
+        meta = json.load(fp)
+    # Keep deserialized forests in memory; reload only when the file changed
+    mtime = os.path.getmtime(model_path)
+    with _lock:
+        cached = _cache.get(model_path)
+    if cached is not None and cached[0] == mtime:
+        model = cached[1]
+    else:
+        model = joblib.load(model_path)
+        with _lock:
+            _cache[model_path] = (mtime, model)
+    return ModelEntry(model=model, **meta)
+
+def _state_path(user_id: int, name: str, registry_dir: str) -> str:
+    return os.path.join(registry_dir, f"user{int(user_id)}_{name}.state.json")
+
+def state_lock(user_id: int, name: str, registry_dir: str = REGISTRY_DIR_DEFAULT):
+    """
+    Context manager serializing one detector's load_state/save_state cycle for a user across
+    threads and processes, so concurrent uploads or rescoring never lose each other's updates.
+    """
+    return _sidecar_locked(_state_path(user_id, name, registry_dir))
+
+def save_state(user_id: int, name: str, state: Dict[str, Any], registry_dir: str = REGISTRY_DIR_DEFAULT) -> None:
+    # JSON state for online detectors, which update in place instead of refitting
+    os.makedirs(registry_dir, exist_ok=True)
+    _write_json(_state_path(user_id, name, registry_dir), state)
+
+def load_state(user_id: int, name: str, registry_dir: str = REGISTRY_DIR_DEFAULT) -> Optional[Dict[str, Any]]:
+    path = _state_path(user_id, name, registry_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as fp:
+        return json.load(fp)
+
+def record_scored(user_id: int, entry: ModelEntry, n_rows: int, registry_dir: str = REGISTRY_DIR_DEFAULT) -> None:
+    # Only the metadata sidecar is rewritten; the forest itself is untouched. The count is added to
+    # the sidecar as stored now, since other workers (or a refit) may have rewritten it since `entry` was loaded.
+    _, meta_path = _paths(user_id, entry.feature_cols, registry_dir)
+    with _sidecar_locked(meta_path):
+        if not os.path.exists(meta_path):
+            entry.rows_since_fit += int(n_rows)
+            return
+        with open(meta_path, "r", encoding="utf-8") as fp:
+            meta = json.load(fp)
+        meta["rows_since_fit"] = int(meta.get("rows_since_fit", 0)) + int(n_rows)
+        _write_json(meta_path, meta)
+    entry.rows_since_fit = meta["rows_since_fit"]
+
+def needs_refit(entry: Optional[ModelEntry], contamination: float, now: Optional[float] = None) -> bool:
+    if entry is None:
+        return True
+    now = time.time() if now is None else now
+    if abs(entry.contamination - contamination) > 1e-12:
+        return True
+    if entry.rows_since_fit >= REFIT_AFTER_ROWS:
+        return True
+    return now - entry.fitted_at >= REFIT_AFTER_SECONDS
+
+def _user_files(user_id: int, registry_dir: str) -> List[str]:
+    if not os.path.isdir(registry_dir):
+        return []
+    prefix = f"user{int(user_id)}_"
+    return [name for name in os.listdir(registry_dir) if name.startswith(prefix)]
+
+def delete_user_models(user_id: int, registry_dir: str = REGISTRY_DIR_DEFAULT) -> None:
+    # Saved forests and their sidecars only; online detector state (save_state) is kept
+    for name in _user_files(user_id, registry_dir):
+        if name.endswith((".joblib", ".json")) and not name.endswith(".state.json"):
+            path = os.path.join(registry_dir, name)
+            with _lock:
+                _cache.pop(path, None)
+            os.remove(path)
+
+def delete_user_state(user_id: int, registry_dir: str = REGISTRY_DIR_DEFAULT) -> None:
+    # Every online detector's state for the user
+    for name in _user_files(user_id, registry_dir):
+        if name.endswith(".state.json"):
+            os.remove(os.path.join(registry_dir, name))
+
+def clear_registry(registry_dir: str = REGISTRY_DIR_DEFAULT) -> None:
+    if not os.path.isdir(registry_dir):
+        return
+    for name in os.listdir(registry_dir):
+        os.remove(os.path.join(registry_dir, name))
+    with _lock:
+        _cache.clear()
@@ -1,6 +1,16 @@
 import io
 import pandas as pd
-from typing import Dict, Tuple
+from typing import Dict, List, Tuple
+
+from . import metrics
+
+REPORT_METRICS = ["heart_rate", "steps", "sleep_hours", "calories", "glucose"]
+
+INTERPRETATION = (
+    "This weekly summary highlights recent trends and any data points that were flagged as unusual compared "
+    "to the user's recent baseline. A higher anomaly count does not automatically indicate a medical issue; "
+    "it may reflect sensor noise, schedule changes, or one-time events. Use flagged periods as prompts to review context."
+)
 
 def _week_window(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty:
@@ -10,7 +20,13 @@ def _week_window(df: pd.DataFrame) -> pd.DataFrame:
     start = max_ts - pd.Timedelta(days=7)
     return df[df["timestamp"] >= start]
 
+@metrics.timed("report.generate_weekly_summary", rows=metrics.first_arg_len)
 def generate_weekly_summary(df: pd.DataFrame) -> Dict:
+    """
+    Summary of the last 7 days of raw records, or of a pre-aggregated tier frame
+    (db.load_series_frame) or resampled grid (modules.grid), whose buckets are merged into
+    days without touching raw rows.
+    """
     if df.empty:
         return {}
 
@@ -18,6 +34,9 @@ def generate_weekly_summary(df: pd.DataFrame) -> Dict:
     if dfw.empty:
         dfw = df.copy()
 
+    if df.attrs.get("tier"):
+        return generate_summary_from_rollups(_tier_to_daily_rollups(dfw), [])
+
     # Daily rollup
     dfw["date"] = dfw["timestamp"].dt.date
     metrics = [c for c in ["heart_rate","steps","sleep_hours","calories","glucose"] if c in dfw.columns]
@@ -29,29 +48,68 @@ def generate_weekly_summary(df: pd.DataFrame) -> Dict:
     # Drivers
     top_drivers = "N/A"
     if "anomaly_drivers" in dfw.columns:
-        d = dfw[dfw["anomaly_flag"] == 1]["anomaly_drivers"]
+        d = dfw[dfw["anomaly_flag"] == 1]["anomaly_drivers"].dropna()
         d = d[d.astype(str).str.len() > 0]
         if len(d) > 0:
             top_drivers = ", ".join(d.value_counts().head(3).index.tolist())
 
-    interpretation = (
-        "This weekly summary highlights recent trends and any data points that were flagged as unusual compared "
-        "to the user's recent baseline. A higher anomaly count does not automatically indicate a medical issue; "
-        "it may reflect sensor noise, schedule changes, or one-time events. Use flagged periods as prompts to review context."
-    )
+    return _summary(daily, int(len(dfw)), int(dfw["anomaly_flag"].sum()), top_drivers)
 
+def _summary(daily: pd.DataFrame, records: int, anomalies: int, top_drivers: str) -> Dict:
     date_range = f"{daily['date'].min()} to {daily['date'].max()}"
 
     return {
         "date_range": date_range,
-        "records": int(len(dfw)),
-        "anomalies": int(dfw["anomaly_flag"].sum()),
+        "records": records,
+        "anomalies": anomalies,
         "top_drivers": top_drivers,
-        "interpretation": interpretation,
+        "interpretation": INTERPRETATION,
         "daily_df": daily,
         "table_html": daily.to_html(index=False, classes=None, border=0)
     }
 
+def _tier_to_daily_rollups(tier_df: pd.DataFrame) -> pd.DataFrame:
+    # Tier buckets (count and mean per metric) -> daily_rollups-shaped rows (count and sum).
+    # Resampled grids (modules.grid) hold totals for "sum" columns and filled steps with count 0.
+    rules = tier_df.attrs.get("rules", {})
+    parts = {
+        "day": tier_df["timestamp"].dt.strftime("%Y-%m-%d"),
+        "record_count": tier_df["record_count"],
+        "anomaly_count": tier_df["anomaly_count"],
+    }
+    for m in REPORT_METRICS:
+        count = tier_df[f"{m}_count"]
+        parts[f"{m}_count"] = count
+        total = tier_df[m] if rules.get(m) == "sum" else tier_df[m] * count
+        parts[f"{m}_sum"] = total.fillna(0.0)
+    return pd.DataFrame(parts).groupby("day", as_index=False).sum()
+
+def daily_from_rollups(rollups: pd.DataFrame) -> pd.DataFrame:
+    # daily_rollups rows (count/sum per metric) -> the same daily table generate_weekly_summary builds
+    daily = pd.DataFrame({"date": pd.to_datetime(rollups["day"]).dt.date})
+    for m in REPORT_METRICS:
+        count = rollups[f"{m}_count"]
+        daily[m] = rollups[f"{m}_sum"] / count.where(count > 0)
+    daily["anomalies"] = rollups["anomaly_count"].astype(int)
+    return daily
+
+@metrics.timed("report.generate_summary_from_rollups", rows=metrics.first_arg_len)
+def generate_summary_from_rollups(rollups: pd.DataFrame, top_drivers: List[str]) -> Dict:
+    """
+    Summary over pre-aggregated daily rows (see db.get_daily_rollups) for any date range.
+    `top_drivers` are the most frequent driver labels in the range (db.get_top_anomaly_drivers).
+    """
+    if rollups.empty:
+        return {}
+    daily = daily_from_rollups(rollups)
+    return _summary(
+        daily,
+        int(rollups["record_count"].sum()),
+        int(rollups["anomaly_count"].sum()),
+        ", ".join(top_drivers) if top_drivers else "N/A",
+    )
+
+@metrics.timed("report.to_report_csv_bytes", bytes_out=metrics.result_len)
 def to_report_csv_bytes(daily_df: pd.DataFrame) -> bytes:
     buf = io.StringIO()
     daily_df.to_csv(buf, index=False)
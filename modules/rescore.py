@@ -0,0 +1,241 @@
+"""
+Admin-wide rescoring: refits every user's baseline with new model settings and rewrites
+stored anomaly flags, scores and drivers. Users are spread across worker processes.
+
+    python -m modules.rescore --contamination 0.05 --workers 4
+    python -m modules.rescore --resume
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+from . import db
+from . import jobs
+from . import model
+from . import registry
+
+CONTAMINATION_DEFAULT = 0.03
+
+# Rows read, scored and written back per UPDATE transaction
+RESCORE_BATCH_ROWS = 20_000
+
+
+
+class AlreadyRunning(Exception):
+    def __init__(self):
+        super().__init__("A rescore is already running.")
+
+
+def _run_alive(pid: Optional[int]) -> bool:
+    # Runs record the process executing them: an app worker's background thread or the CLI
+    return pid is not None and (pid == os.getpid() or jobs.pid_alive(pid))
+
+
+def current_settings(db_path: str = db.DB_PATH_DEFAULT) -> Tuple[float, List[str]]:
+    # (contamination, feature_cols) used for new uploads; rescoring is what changes them
+    contamination = float(db.get_setting("contamination", str(CONTAMINATION_DEFAULT), db_path))
+    cols = db.get_setting("feature_cols", None, db_path)
+    return contamination, (json.loads(cols) if cols else list(model.FEATURE_COLS_DEFAULT))
+
+
+def _plan_workers(n_users: int, workers: Optional[int], cpu_budget: Optional[int]) -> Tuple[int, int]:
+    # Split the CPU budget between processes and per-forest threads so they don't oversubscribe
+    cpu_budget = max(1, cpu_budget or os.cpu_count() or 1)
+    workers = max(1, min(workers or cpu_budget, cpu_budget, max(n_users, 1)))
+    return workers, max(1, cpu_budget // workers)
+
+
+def rescore_user(user_id: int, contamination: float, feature_cols: List[str], n_jobs: int = 1,
+                 batch_rows: int = RESCORE_BATCH_ROWS, db_path: str = db.DB_PATH_DEFAULT,
+                 registry_dir: str = registry.REGISTRY_DIR_DEFAULT) -> Tuple[int, int, float]:
+    """
+    Refits one user's baseline on their newest history and rescores all of their records.
+    Returns (user_id, rows_scored, seconds).
+    """
+    t0 = time.perf_counter()
+    train = pd.DataFrame([dict(r) for r in db.get_latest_health_records(
+        user_id, ["timestamp"] + list(feature_cols), model.MAX_FIT_ROWS, db_path)])
+    cols = model.usable_feature_cols(train, feature_cols) if not train.empty else []
+    if not cols:
+        return user_id, 0, time.perf_counter() - t0
+    entry = model.fit_baseline(train, contamination=contamination, feature_cols=cols, n_jobs=n_jobs)
+    means = dict(zip(cols, entry.feature_mean))
+
+    n = 0
+    for rows in db.iter_feature_batches(user_id, cols, batch_rows, db_path):
+        batch = pd.DataFrame(rows, columns=["record_id"] + cols)
+        # Older rows outside the fit window may have gaps; score them at the baseline mean
+        batch[cols] = batch[cols].astype(float).fillna(means)
+        scored = model.score_anomalies(batch, contamination=contamination, entry=entry, n_jobs=n_jobs)
+        drivers = scored["anomaly_drivers"].to_numpy(dtype=object)
+        drivers[drivers == ""] = None
+        n += db.update_anomaly_results(zip(
+            scored["anomaly_flag"].tolist(),
+            scored["anomaly_score"].tolist(),
+            drivers.tolist(),
+            batch["record_id"].tolist(),
+        ), db_path)
+
+    registry.delete_user_models(user_id, registry_dir)
+    registry.save_model(user_id, entry, registry_dir)
+    db.rebuild_daily_rollups(user_id, db_path)
+    return user_id, n, time.perf_counter() - t0
+
+
+def _rescore_worker(args) -> Tuple[int, int, float]:
+    try:
+        return rescore_user(*args)
+    finally:
+        db.close_conn()
+
+
+def run_rescore(contamination: Optional[float] = None, feature_cols: Optional[List[str]] = None,
+                workers: Optional[int] = None, cpu_budget: Optional[int] = None, resume: bool = False,
+                run_id: Optional[int] = None, db_path: str = db.DB_PATH_DEFAULT,
+                registry_dir: str = registry.REGISTRY_DIR_DEFAULT) -> int:
+    """
+    Rescores every user with stored records. With `resume`, continues the newest unfinished
+    run (keeping its settings) and skips users it already completed. Pass `run_id` to execute
+    a run created by start_run(). Raises AlreadyRunning while another process runs one.
+    Returns the run id.
+    """
+    # Users on an online engine keep their own scores; only forest baselines are refitted here
+    user_ids = [u for u in db.list_user_ids_with_records(db_path)
+                if db.get_user_engine(u, db_path) == model.IsolationForestDetector.name]
+    if run_id is None and resume:
+        run = db.get_unfinished_rescore_run(db_path)
+        if run is not None:
+            if not db.resume_rescore_run(run["run_id"], os.getpid(), _run_alive, db_path):
+                raise AlreadyRunning()
+            run_id = run["run_id"]
+    if run_id is None:
+        run_id = start_run(contamination, feature_cols, workers, db_path)
+        if run_id is None:
+            raise AlreadyRunning()
+    run = db.get_rescore_run(run_id, db_path)
+    contamination = float(run["contamination"])
+    feature_cols = json.loads(run["feature_cols"])
+    done = {r["user_id"]: r for r in db.get_rescore_progress(run_id, db_path)}
+    todo = [u for u in user_ids if u not in done]
+
+    n_workers, n_jobs = _plan_workers(len(todo), workers or run["workers"], cpu_budget)
+    db.update_rescore_run(run_id, {"status": "running", "error": None}, db_path)
+    rows = sum(r["rows_scored"] for r in done.values())
+    t0 = time.perf_counter()
+    elapsed_before = float(run["seconds"] or 0.0)
+    try:
+        # spawn: workers must not inherit the parent's SQLite connections or job threads
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=ctx) as pool:
+            futures = [
+                pool.submit(_rescore_worker, (uid, contamination, feature_cols, n_jobs,
+                                              RESCORE_BATCH_ROWS, db_path, registry_dir))
+                for uid in todo
+            ]
+            for fut in as_completed(futures):
+                uid, n, seconds = fut.result()
+                rows += n
+                db.record_rescore_progress(run_id, uid, n, seconds, db_path)
+                db.update_rescore_run(run_id, {
+                    "rows_scored": rows, "seconds": elapsed_before + time.perf_counter() - t0,
+                }, db_path)
+    except Exception as e:
+        db.update_rescore_run(run_id, {"status": "failed", "error": str(e), "finished_at": time.time()}, db_path)
+        raise
+    db.set_setting("contamination", repr(contamination), db_path)
+    db.set_setting("feature_cols", json.dumps(feature_cols), db_path)
+    db.update_rescore_run(run_id, {
+        "status": "done", "rows_scored": rows,
+        "seconds": elapsed_before + time.perf_counter() - t0, "finished_at": time.time(),
+    }, db_path)
+    return run_id
+
+
+def start_run(contamination: Optional[float] = None, feature_cols: Optional[List[str]] = None,
+              workers: Optional[int] = None, db_path: str = db.DB_PATH_DEFAULT) -> Optional[int]:
+    # Claims a new run for this process, or None while another (in any process) is running;
+    # unspecified settings default to the current ones
+    cur_contamination, cur_cols = current_settings(db_path)
+    contamination = cur_contamination if contamination is None else float(contamination)
+    feature_cols = cur_cols if feature_cols is None else list(feature_cols)
+    if not feature_cols:
+        raise ValueError("Select at least one feature column.")
+    unknown = [c for c in feature_cols if c not in model.FEATURE_COLS_DEFAULT]
+    if unknown:
+        raise ValueError(f"Unknown feature column(s): {', '.join(unknown)}")
+    if not 0.0 < contamination <= 0.5:
+        raise ValueError("Contamination must be in (0, 0.5].")
+    workers, _ = _plan_workers(len(db.list_user_ids_with_records(db_path)), workers, None)
+    return db.create_rescore_run(contamination, json.dumps(feature_cols), workers, os.getpid(), _run_alive, db_path)
+
+
+def start_background(contamination: Optional[float] = None, feature_cols: Optional[List[str]] = None,
+                     workers: Optional[int] = None) -> Optional[int]:
+    """
+    Starts a run on a daemon thread and returns its id, or None if one is already running in
+    any app worker or CLI process (the run row is claimed in the database).
+    Cached dashboards/reports go stale on their own: rollup rebuilds bump each user's data version.
+    """
+    run_id = start_run(contamination, feature_cols, workers)
+    if run_id is None:
+        return None
+
+    def _target():
+        try:
+            run_rescore(run_id=run_id, workers=workers)
+        except Exception:
+            pass  # failure is recorded on the run row
+
+    threading.Thread(target=_target, name=f"rescore-{run_id}", daemon=True).start()
+    return run_id
+
+
+def is_running() -> bool:
+    return any(_run_alive(r["worker_pid"]) for r in db.list_running_rescore_runs())
+
+
+def fail_orphaned_runs() -> None:
+    # Call at startup: runs left 'running' by an exited process (or an earlier run with this
+    # process's reused pid) are marked failed and can be resumed
+    db.fail_orphaned_rescore_runs(lambda pid: pid is not None and pid != os.getpid() and jobs.pid_alive(pid))
+
+
+def run_summary(run) -> dict:
+    out = {k: run[k] for k in ("run_id", "contamination", "status", "workers", "rows_scored", "error")}
+    out["feature_cols"] = ", ".join(json.loads(run["feature_cols"]))
+    out["seconds"] = round(run["seconds"] or 0.0, 2)
+    out["rows_per_sec"] = int(run["rows_scored"] / run["seconds"]) if run["seconds"] else None
+    return out
+
+
+def main(argv=None) -> None:
+    p = argparse.ArgumentParser(description="Refit and rescore every user's stored records.")
+    p.add_argument("--contamination", type=float, default=None)
+    p.add_argument("--features", default=None, help="comma-separated feature columns")
+    p.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU budget)")
+    p.add_argument("--cpu-budget", type=int, default=None, help="total cores to use (default: all)")
+    p.add_argument("--resume", action="store_true", help="continue the newest unfinished run")
+    p.add_argument("--db", default=db.DB_PATH_DEFAULT)
+    args = p.parse_args(argv)
+
+    db.init_db(args.db)
+    features = [c.strip() for c in args.features.split(",") if c.strip()] if args.features else None
+    try:
+        run_id = run_rescore(args.contamination, features, args.workers, args.cpu_budget,
+                             resume=args.resume, db_path=args.db)
+    except AlreadyRunning as e:
+        raise SystemExit(str(e))
+    s = run_summary(db.get_rescore_run(run_id, args.db))
+    print(f"run {s['run_id']}: {s['rows_scored']} rows in {s['seconds']}s "
+          f"({s['rows_per_sec']} rows/s, {s['workers']} workers)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+Retention: raw records older than a user's policy are written to compressed archives under
+instance/archive/, then deleted in small batches. Rollups (daily and series tiers) keep
+covering the archived range, so long dashboard views and reports are unchanged; freed pages
+are returned to the filesystem with incremental VACUUM.
+
+Policies are days to keep, per role and optionally per user (the user policy wins); users
+without one keep everything. An archived range can be rehydrated on demand.
+
+    python -m modules.retention --dry-run
+    python -m modules.retention --convert-vacuum
+"""
+import argparse
+import csv
+import gzip
+import os
+import shutil
+import threading
+import time
+from itertools import chain
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from . import db
+
+ARCHIVE_DIR_DEFAULT = os.path.join("instance", "archive")
+
+# Rows per DELETE transaction; the pause between batches lets uploads and readers in
+DELETE_BATCH_ROWS = 5_000
+DELETE_PAUSE_S = 0.01
+
+# Pages freed per incremental_vacuum step
+VACUUM_STEP_PAGES = 2_000
+
+_ROLE_KEY = "retention.role."
+_USER_KEY = "retention.user."
+
+_FLOAT_COLS = [c for c in db.HEALTH_COLUMNS if c not in ("timestamp", "anomaly_flag", "anomaly_drivers")]
+
+# Only one admin-triggered run at a time per app process
+_run_lock = threading.Lock()
+
+
+def get_policies(db_path: str = db.DB_PATH_DEFAULT) -> Dict[str, Dict[Any, int]]:
+    # {"roles": {role: days}, "users": {user_id: days}}
+    settings = db.list_settings("retention.", db_path)
+    return {
+        "roles": {k[len(_ROLE_KEY):]: int(v) for k, v in settings.items() if k.startswith(_ROLE_KEY)},
+        "users": {int(k[len(_USER_KEY):]): int(v) for k, v in settings.items() if k.startswith(_USER_KEY)},
+    }
+
+
+def set_policy(days: Optional[int], role: Optional[str] = None, user_id: Optional[int] = None,
+               db_path: str = db.DB_PATH_DEFAULT) -> None:
+    # days=None removes the policy
+    if (role is None) == (user_id is None):
+        raise ValueError("Give either a role or a user.")
+    key = _ROLE_KEY + role if role is not None else _USER_KEY + str(int(user_id))
+    if days is None:
+        db.delete_setting(key, db_path)
+        return
+    if int(days) < 1:
+        raise ValueError("Retention must be at least 1 day.")
+    db.set_setting(key, str(int(days)), db_path)
+
+
+def _cutoff(days: int, now: Optional[float] = None) -> pd.Timestamp:
+    # Archives always end on a UTC day boundary
+    now = pd.Timestamp(now if now is not None else time.time(), unit="s")
+    return (now - pd.Timedelta(days=days)).normalize()
+
+
+def plan(now: Optional[float] = None, db_path: str = db.DB_PATH_DEFAULT) -> List[Dict[str, Any]]:
+    """
+    Per user with something to do: the policy, the archive cutoff (None when nothing new is due,
+    only rehydrated rows to drop) and the raw rows that would be deleted.
+    """
+    policies = get_policies(db_path)
+    out = []
+    for u in db.list_users(db_path):
+        uid = u["user_id"]
+        days = policies["users"].get(uid, policies["roles"].get(u["role"]))
+        mark = db.get_archive_watermark(uid, db_path)
+        mark_ts = pd.Timestamp(mark, unit="s") if mark is not None else None
+        cutoff = _cutoff(days, now) if days is not None else None
+        if cutoff is not None and mark_ts is not None and cutoff <= mark_ts:
+            cutoff = None
+        boundary = cutoff if cutoff is not None else mark_ts
+        if boundary is None:
+            continue
+        rows = db.count_health_records_before(uid, boundary, db_path)
+        if rows:
+            out.append({"user_id": uid, "username": u["username"], "days": days, "watermark": mark_ts,
+                        "cutoff": cutoff, "boundary": boundary, "rows": rows})
+    return out
+
+
+def _archive_path(user_id: int, start: pd.Timestamp, end: pd.Timestamp, archive_dir: str) -> str:
+    return os.path.join(archive_dir, f"user{int(user_id)}",
+                        f"{start.strftime('%Y%m%d')}-{end.strftime('%Y%m%d')}.csv.gz")
+
+
+def archive_user(user_id: int, start: Optional[pd.Timestamp], end: pd.Timestamp,
+                 archive_dir: str = ARCHIVE_DIR_DEFAULT, db_path: str = db.DB_PATH_DEFAULT) -> Dict[str, Any]:
+    """
+    Writes the user's records in [start, end) to a gzip CSV and adds it to the catalog, which
+    moves the user's watermark to `end`. Returns {"rows", "bytes", "path"}; rows is 0 (and
+    nothing is written) for an empty range.
+    """
+    batches = db.iter_health_batches(user_id, db.HEALTH_COLUMNS, db.INSERT_CHUNK_SIZE, start=start, end=end,
+                                     db_path=db_path)
+    first = next(iter(batches), None)
+    if not first:
+        return {"rows": 0, "bytes": 0, "path": None}
+    lo = pd.Timestamp(first[0]["timestamp"]).normalize() if start is None else start
+    path = _archive_path(user_id, lo, end, archive_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    n = 0
+    with gzip.open(tmp, "wt", newline="", encoding="utf-8") as fp:
+        w = csv.writer(fp)
+        w.writerow(db.HEALTH_COLUMNS)
+        for batch in chain([first], batches):
+            w.writerows(tuple(r) for r in batch)
+            n += len(batch)
+    os.replace(tmp, path)
+    nbytes = os.path.getsize(path)
+    db.record_archive(user_id, int(lo.timestamp()), int(end.timestamp()), n, nbytes, path, db_path)
+    return {"rows": n, "bytes": nbytes, "path": path}
+
+
+def purge_user(user_id: int, before: pd.Timestamp, batch_rows: int = DELETE_BATCH_ROWS,
+               db_path: str = db.DB_PATH_DEFAULT) -> int:
+    # Deletes raw rows before `before` in bounded transactions; rollups are left as they are
+    n = 0
+    while True:
+        k = db.delete_records_before(user_id, before, batch_rows, db_path)
+        n += k
+        if k < batch_rows:
+            return n
+        time.sleep(DELETE_PAUSE_S)
+
+
+def reclaim_space(convert: bool = False, db_path: str = db.DB_PATH_DEFAULT) -> None:
+    """
+    Returns free pages to the filesystem in steps. Files created before auto_vacuum was enabled
+    only reuse them internally unless `convert` runs the one-off full VACUUM that switches them.
+    """
+    if db.space_stats(db_path)["auto_vacuum"] != 2:
+        if not convert:
+            return
+        db.convert_to_incremental_vacuum(db_path)
+    while db.incremental_vacuum(VACUUM_STEP_PAGES, db_path):
+        time.sleep(DELETE_PAUSE_S)
+
+
+def run_retention(convert_vacuum: bool = False, run_id: Optional[int] = None, now: Optional[float] = None,
+                  archive_dir: str = ARCHIVE_DIR_DEFAULT, db_path: str = db.DB_PATH_DEFAULT) -> int:
+    # Archives, purges and vacuums per plan(); progress and space reclaimed go on a run row
+    if run_id is None:
+        run_id = db.create_retention_run(db_path)
+    t0 = time.perf_counter()
+    before = db.space_stats(db_path)["bytes"]
+    db.update_retention_run(run_id, {"db_bytes_before": before}, db_path)
+    totals = {"users": 0, "rows_archived": 0, "rows_deleted": 0, "archive_bytes": 0}
+    try:
+        for p in plan(now, db_path):
+            if p["cutoff"] is not None:
+                a = archive_user(p["user_id"], p["watermark"], p["cutoff"], archive_dir, db_path)
+                totals["rows_archived"] += a["rows"]
+                totals["archive_bytes"] += a["bytes"]
+            totals["rows_deleted"] += purge_user(p["user_id"], p["boundary"], db_path=db_path)
+            totals["users"] += 1
+            db.update_retention_run(run_id, {**totals, "seconds": time.perf_counter() - t0}, db_path)
+        reclaim_space(convert_vacuum, db_path)
+    except Exception as e:
+        db.update_retention_run(run_id, {"status": "failed", "error": str(e), "finished_at": time.time(),
+                                         "seconds": time.perf_counter() - t0}, db_path)
+        raise
+    db.update_retention_run(run_id, {
+        **totals, "status": "done", "db_bytes_after": db.space_stats(db_path)["bytes"],
+        "seconds": time.perf_counter() - t0, "finished_at": time.time(),
+    }, db_path)
+    return run_id
+
+
+def _read_archive(path: str, start: Any = None, end: Any = None):
+    # Yields archive rows as HEALTH_COLUMNS tuples, typed as stored, within [start, end)
+    lo = pd.Timestamp(start).isoformat() if start is not None else None
+    hi = pd.Timestamp(end).isoformat() if end is not None else None
+    idx = {c: i for i, c in enumerate(db.HEALTH_COLUMNS)}
+    floats = [idx[c] for c in _FLOAT_COLS]
+    with gzip.open(path, "rt", newline="", encoding="utf-8") as fp:
+        r = csv.reader(fp)
+        next(r)
+        for row in r:
+            ts = row[0]
+            if (lo is not None and ts < lo) or (hi is not None and ts >= hi):
+                continue
+            out: List[Any] = [v if v != "" else None for v in row]
+            for i in floats:
+                if out[i] is not None:
+                    out[i] = float(out[i])
+            out[idx["anomaly_flag"]] = int(out[idx["anomaly_flag"]] or 0)
+            yield tuple(out)
+
+
+def rehydrate(user_id: int, start: Any = None, end: Any = None, db_path: str = db.DB_PATH_DEFAULT) -> int:
+    """
+    Restores archived raw records of [start, end) to health_records, e.g. for an export or an
+    investigation. Rollups already count them; the next retention run deletes them again.
+    Returns rows restored.
+    """
+    lo = int(pd.Timestamp(start).timestamp()) if start is not None else None
+    hi = int(pd.Timestamp(end).timestamp()) if end is not None else None
+    n = 0
+    for a in db.list_archives(user_id, db_path):
+        if (lo is not None and a["end_ts"] <= lo) or (hi is not None and a["start_ts"] >= hi):
+            continue
+        rows = ((user_id, *r) for r in _read_archive(a["path"], start, end))
+        n += db.restore_health_tuples(rows, db_path)
+    return n
+
+
+def delete_user_archives(user_id: int, archive_dir: str = ARCHIVE_DIR_DEFAULT) -> None:
+    shutil.rmtree(os.path.join(archive_dir, f"user{int(user_id)}"), ignore_errors=True)
+
+
+def clear_archives(archive_dir: str = ARCHIVE_DIR_DEFAULT) -> None:
+    shutil.rmtree(archive_dir, ignore_errors=True)
+
+
+def start_background(convert_vacuum: bool = False) -> Optional[int]:
+    # Starts a run on a daemon thread and returns its id, or None if one is already running
+    if not _run_lock.acquire(blocking=False):
+        return None
+    try:
+        run_id = db.create_retention_run()
+    except Exception:
+        _run_lock.release()
+        raise
+
+    def _target():
+        try:
+            run_retention(convert_vacuum, run_id=run_id)
+        except Exception:
+            pass  # failure is recorded on the run row
+        finally:
+            _run_lock.release()
+
+    threading.Thread(target=_target, name=f"retention-{run_id}", daemon=True).start()
+    return run_id
+
+
+def is_running() -> bool:
+    return _run_lock.locked()
+
+
+def run_summary(run) -> dict:
+    out = {k: run[k] for k in ("run_id", "status", "users", "rows_archived", "rows_deleted", "error")}
+    out["seconds"] = round(run["seconds"] or 0.0, 2)
+    out["archive_mb"] = round(run["archive_bytes"] / 2**20, 2)
+    before, after = run["db_bytes_before"], run["db_bytes_after"]
+    out["db_mb_before"] = round(before / 2**20, 2) if before is not None else None
+    out["db_mb_after"] = round(after / 2**20, 2) if after is not None else None
+    out["reclaimed_mb"] = round((before - after) / 2**20, 2) if before is not None and after is not None else None
+    return out
+
+
+def archive_summary(a) -> dict:
+    out = {k: a[k] for k in ("archive_id", "user_id", "username", "rows", "path")}
+    out["start"] = pd.Timestamp(a["start_ts"], unit="s").date()
+    out["end"] = pd.Timestamp(a["end_ts"], unit="s").date()
+    out["kib"] = round(a["bytes"] / 1024, 1)
+    return out
+
+
+def main(argv=None) -> None:
+    p = argparse.ArgumentParser(description="Archive and delete raw records older than the retention policies.")
+    p.add_argument("--dry-run", action="store_true", help="list what would be archived and deleted")
+    p.add_argument("--convert-vacuum", action="store_true",
+                   help="switch an older database file to incremental vacuum (one full VACUUM)")
+    p.add_argument("--db", default=db.DB_PATH_DEFAULT)
+    p.add_argument("--archive-dir", default=ARCHIVE_DIR_DEFAULT)
+    args = p.parse_args(argv)
+
+    db.init_db(args.db)
+    if args.dry_run:
+        for u in plan(db_path=args.db):
+            what = f"archive before {u['cutoff'].date()}" if u["cutoff"] is not None else "drop rehydrated rows"
+            print(f"user {u['user_id']} ({u['username']}): keep {u['days'] or '-'} days, {what}, "
+                  f"{u['rows']} rows")
+        return
+    s = run_summary(db.get_retention_run(run_retention(args.convert_vacuum, archive_dir=args.archive_dir,
+                                                       db_path=args.db), args.db))
+    print(f"run {s['run_id']}: {s['users']} users, {s['rows_archived']} rows archived ({s['archive_mb']} MiB), "
+          f"{s['rows_deleted']} deleted, database {s['db_mb_before']} -> {s['db_mb_after']} MiB in {s['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
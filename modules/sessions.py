@@ -0,0 +1,122 @@
+"""
+Server-side sessions: the cookie carries an opaque random id, the session data lives in the
+`sessions` table (keyed by the id's SHA-256), so logouts and user changes revoke sessions
+everywhere. Loaded sessions are cached per process for SESSION_CACHE_TTL_S; a session revoked
+in another worker process is honoured here within that time.
+"""
+import hashlib
+import json
+import secrets
+import time
+from typing import Any, Optional
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from . import db
+from .cache import LRUCache
+
+SESSION_CACHE_TTL_S = 30
+
+# (data dict, expires_at, cached_at) per sid hash
+_cache = LRUCache(max_entries=10_000, max_bytes=16 * 1024 * 1024)
+
+
+def _hash(sid: str) -> str:
+    return hashlib.sha256(sid.encode("utf-8")).hexdigest()
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial: Optional[dict] = None, sid: Optional[str] = None, expires_at: float = 0.0):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.modified = False
+        # Set by regenerate(): the previous id, deleted when the response is saved
+        self.replaced_sid: Optional[str] = None
+
+
+def regenerate(session: Any) -> None:
+    # New id for the same session (call on login, against session fixation)
+    if isinstance(session, ServerSession) and session.sid is not None:
+        session.replaced_sid = session.replaced_sid or session.sid
+        session.sid = None
+        session.modified = True
+
+
+def revoke_user(user_id: int, db_path: str = db.DB_PATH_DEFAULT) -> int:
+    # Ends every session of the user; returns how many were stored
+    for key in _cache.keys():
+        entry = _cache.get(key)
+        if entry is not None and entry[0].get("user_id") == user_id:
+            _cache.pop(key)
+    return db.delete_sessions(user_id=user_id, db_path=db_path)
+
+
+def clear_cache() -> None:
+    _cache.clear()
+
+
+class SqliteSessionInterface(SessionInterface):
+    def __init__(self, db_path: str = db.DB_PATH_DEFAULT):
+        self.db_path = db_path
+
+    def _load(self, sid: str):
+        key = _hash(sid)
+        now = time.time()
+        entry = _cache.get(key)
+        if entry is not None and now - entry[2] < SESSION_CACHE_TTL_S:
+            data, expires_at, _ = entry
+        else:
+            row = db.load_session(key, self.db_path)
+            if row is None:
+                _cache.pop(key)
+                return None
+            data, expires_at = json.loads(row["data"]), row["expires_at"]
+            _cache.put(key, (data, expires_at, now))
+        if expires_at <= now:
+            return None
+        return ServerSession(dict(data), sid, expires_at)
+
+    def open_session(self, app, request) -> ServerSession:
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            session = self._load(sid)
+            if session is not None:
+                return session
+        return ServerSession()
+
+    def save_session(self, app, session: ServerSession, response) -> None:
+        name = self.get_cookie_name(app)
+        domain, path = self.get_cookie_domain(app), self.get_cookie_path(app)
+        if session.replaced_sid is not None:
+            _cache.pop(_hash(session.replaced_sid))
+            db.delete_sessions(sid_hash=_hash(session.replaced_sid), db_path=self.db_path)
+        if session.sid is not None or session.replaced_sid is not None:
+            response.vary.add("Cookie")
+        if not session:
+            if session.sid is not None:
+                _cache.pop(_hash(session.sid))
+                db.delete_sessions(sid_hash=_hash(session.sid), db_path=self.db_path)
+            if session.sid is not None or session.replaced_sid is not None:
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        now = time.time()
+        # Unchanged sessions are only rewritten to slide the expiry, at most once per half lifetime
+        if not session.modified and session.sid is not None and session.expires_at - now > lifetime / 2:
+            return
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        session.expires_at = now + lifetime
+        data = dict(session)
+        key = _hash(session.sid)
+        db.save_session(key, data.get("user_id"), json.dumps(data), session.expires_at, self.db_path)
+        _cache.put(key, (data, session.expires_at, now))
+        response.set_cookie(
+            name, session.sid, expires=session.expires_at, httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path, secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app),
+        )
@@ -0,0 +1,30 @@
+import pytest
+
+from modules import db
+
+
+@pytest.fixture
+def instance_dir(tmp_path, monkeypatch):
+    # Modules default to instance/app.db and instance/models relative to the working directory
+    db.close_conn()
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "instance").mkdir()
+    db.init_db()
+    yield tmp_path
+    db.close_conn()
+
+
+@pytest.fixture
+def client(instance_dir, monkeypatch):
+    import app as webapp  # the first import initializes instance/ under the test's working directory
+
+    from modules import auth, compute
+    # Fresh compute workers: a pool thread's cached connection still points at the last test's instance/
+    executor = compute.BoundedExecutor("compute", compute.COMPUTE_WORKERS, compute.COMPUTE_QUEUE)
+    monkeypatch.setattr(compute, "_default", executor)
+    auth.ensure_default_users()  # also drops cached users and sessions
+    auth._ip_limiter.reset()
+    auth._user_limiter.reset()
+    webapp.app.config["TESTING"] = True
+    yield webapp.app.test_client()
+    executor._pool.shutdown()
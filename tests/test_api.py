@@ -0,0 +1,39 @@
+import json
+
+import pandas as pd
+
+from modules import auth, db
+
+
+def _records(n: int):
+    ts = pd.date_range("2026-01-01", periods=n, freq="h").strftime("%Y-%m-%dT%H:%M:%S")
+    return [{"timestamp": t, "heart_rate": 60 + i % 24, "steps": 10 * i} for i, t in enumerate(ts)]
+
+
+def test_records_api_needs_bearer_token_and_json(client):
+    client.post("/login", data={"username": "user", "password": "user123"})
+    body = json.dumps(_records(3))
+    # A cross-site form post carries the session cookie, never a bearer token
+    assert client.post("/api/v1/records", data=body, content_type="text/plain").status_code == 401
+    assert client.post("/api/v1/records", data=body, content_type="application/json").status_code == 401
+
+    token = auth.issue_api_token(db.get_user_by_username("user")["user_id"])
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.post("/api/v1/records", data=body, headers=headers, content_type="text/plain").status_code == 415
+    assert client.post("/api/v1/records", data=body, headers=headers,
+                       content_type="application/x-www-form-urlencoded").status_code == 415
+
+
+def test_duplicate_batch_inserts_nothing(client):
+    uid = db.get_user_by_username("user")["user_id"]
+    headers = {"Authorization": f"Bearer {auth.issue_api_token(uid)}"}
+    body = json.dumps({"records": _records(24)})
+    r = client.post("/api/v1/records", data=body, headers=headers, content_type="application/json")
+    assert r.status_code == 200 and r.json == {"received": 24, "inserted": 24, "duplicates": 0}
+
+    r = client.post("/api/v1/records", data=body, headers=headers, content_type="application/json")
+    assert r.json == {"received": 24, "inserted": 0, "duplicates": 24}
+    nd = "\n".join(json.dumps(rec) for rec in _records(26))
+    r = client.post("/api/v1/records", data=nd, headers=headers, content_type="application/x-ndjson")
+    assert r.json == {"received": 26, "inserted": 2, "duplicates": 24}
+    assert db.count_health_records(uid) == 26
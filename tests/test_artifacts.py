@@ -0,0 +1,35 @@
+import os
+
+from modules.artifacts import ArtifactStore
+
+
+def test_artifacts_are_shared_through_disk_and_deleted_per_user(tmp_path):
+    directory = str(tmp_path / "reports")
+    store = ArtifactStore(directory)
+    store.put((1, 100, "csv"), b"user one")
+    store.put((2, 100, "csv"), b"user two")
+
+    # A second store stands in for another worker process or a restart
+    other = ArtifactStore(directory)
+    assert other.get((1, 100, "csv")) == b"user one"
+    assert other.get((1, 101, "csv")) is None
+    with other.open((2, 100, "csv")) as fp:
+        assert fp.read() == b"user two"
+
+    store.delete_user(1)
+    assert store.get((1, 100, "csv")) is None
+    assert ArtifactStore(directory).get((1, 100, "csv")) is None
+    assert store.get((2, 100, "csv")) == b"user two"
+
+
+def test_disk_tier_is_pruned_oldest_first(tmp_path):
+    directory = str(tmp_path / "reports")
+    store = ArtifactStore(directory, max_disk_bytes=250)
+    for i in range(2):
+        store.put((1, i), b"x" * 100)
+        os.utime(store._path((1, i)), (1000 + i, 1000 + i))
+    store.put((1, 2), b"x" * 100)
+
+    fresh = ArtifactStore(directory)
+    assert fresh.get((1, 0)) is None
+    assert fresh.get((1, 1)) is not None and fresh.get((1, 2)) is not None
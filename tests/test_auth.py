@@ -0,0 +1,39 @@
+from modules import auth, db
+
+
+def _login(client, username: str, password: str):
+    return client.post("/login", data={"username": username, "password": password})
+
+
+def test_login_rate_limited_per_username(client):
+    for _ in range(auth.LOGIN_LIMIT_PER_USER):
+        assert b"Incorrect password." in _login(client, "user", "wrong").data
+    r = _login(client, "user", "user123")
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) >= 1
+
+
+def test_admin_changes_revoke_sessions_and_refresh_login(client):
+    import app as webapp
+    other = webapp.app.test_client()
+    assert _login(other, "user", "user123").status_code == 302
+    assert other.get("/dashboard").status_code == 200
+    uid = db.get_user_by_username("user")["user_id"]
+
+    assert _login(client, "admin", "admin123").status_code == 302
+    assert b'name="user_id"' in client.get("/admin").data
+    client.post("/admin/users", data={"user_id": uid, "action": "password", "password": "new-pass"})
+
+    r = other.get("/dashboard")
+    assert r.status_code == 302 and "/login" in r.headers["Location"]
+    # The cached login row was dropped with the sessions
+    assert b"Incorrect password." in _login(other, "user", "user123").data
+    assert _login(other, "user", "new-pass").status_code == 302
+
+    client.post("/admin/users", data={"user_id": uid, "action": "role:admin"})
+    assert other.get("/dashboard").status_code == 302
+    assert auth.get_user(uid)["role"] == "admin"
+
+    client.post("/admin/users", data={"user_id": uid, "action": "delete"})
+    assert auth.get_user(uid) is None
+    assert b"Unknown username." in _login(other, "user", "new-pass").data
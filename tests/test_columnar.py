@@ -0,0 +1,30 @@
+import io
+
+import pytest
+
+from modules import columnar, db
+
+pa = pytest.importorskip("pyarrow")
+
+
+def test_export_accepts_legacy_timestamps(tmp_path):
+    # Rows written by the old to_db_rows/isoformat() path: fractional seconds and UTC offsets
+    path = str(tmp_path / "app.db")
+    db.init_db(path)
+    stamps = ["2024-01-01T00:00:00", "2024-01-01T01:00:00.500000", "2024-01-01T02:00:00+00:00",
+              "2024-01-01T04:30:00.250000+01:00"]
+    rows = [[1, t, 70.0 + i, None, None, None, None, None, None, 0, 0.1, None] for i, t in enumerate(stamps)]
+    assert db.insert_health_tuples(rows, db_path=path) == len(stamps)
+
+    for fmt in ("arrow", "parquet"):
+        data = b"".join(columnar.iter_export(1, fmt, batch_rows=2, db_path=path))
+        if fmt == "arrow":
+            table = pa.ipc.open_stream(data).read_all()
+        else:
+            import pyarrow.parquet as pq
+            table = pq.read_table(io.BytesIO(data))
+        got = [t.isoformat() for t in table.column("timestamp").to_pylist()]
+        assert got == ["2024-01-01T00:00:00", "2024-01-01T01:00:00", "2024-01-01T02:00:00",
+                       "2024-01-01T03:30:00"]
+        assert table.column("heart_rate").to_pylist() == [70.0, 71.0, 72.0, 73.0]
+    db.close_conn(path)
@@ -0,0 +1,60 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from modules import dashboard, db
+
+
+def test_downsampled_figures_keep_every_anomaly():
+    n = 10_000
+    rng = np.random.default_rng(5)
+    df = pd.DataFrame({"timestamp": pd.date_range("2026-01-01", periods=n, freq="min"),
+                       "heart_rate": 70.0 + rng.normal(0, 5, n),
+                       "anomaly_flag": 0, "anomaly_drivers": None})
+    flagged = rng.choice(n, 300, replace=False)
+    df.loc[flagged, "anomaly_flag"] = 1
+    df.loc[flagged, "anomaly_drivers"] = "heart_rate"
+
+    for method in dashboard.DOWNSAMPLE_METHODS:
+        fig, = dashboard.build_timeseries_figures(df, max_points=500, method=method)
+        normal, anomaly = json.loads(fig["data_json"])
+        assert len(normal["x"]) <= 500
+        assert len(anomaly["x"]) == len(flagged)
+        expected = df.loc[np.sort(flagged), "heart_rate"].to_numpy()
+        np.testing.assert_allclose(anomaly["y"], expected)
+
+
+def test_lttb_keeps_endpoints_and_spikes():
+    x = np.arange(1000)
+    y = np.zeros(1000)
+    y[[137, 612]] = [50.0, -50.0]
+    idx = dashboard.lttb_indices(x, y, 20)
+    assert len(idx) == 20
+    assert idx[0] == 0 and idx[-1] == 999
+    assert {137, 612} <= set(idx.tolist())
+    assert (np.diff(idx) > 0).all()
+
+
+def _insert(user_id: int, n: int, start: str):
+    ts = pd.date_range(start, periods=n, freq="min").strftime("%Y-%m-%dT%H:%M:%S")
+    db.insert_health_tuples([[user_id, t, 70.0, 10.0, 0.0, 1.0, 120.0, 80.0, 95.0, 0, 0.0, None] for t in ts])
+
+
+def test_cached_series_payload_follows_the_data_version(client):
+    client.post("/login", data={"username": "user", "password": "user123"})
+    uid = db.get_user_by_username("user")["user_id"]
+    _insert(uid, 100, "2026-01-01")
+    version = db.get_data_version(uid)
+
+    def points():
+        data = client.get("/dashboard/series?metric=heart_rate").get_json()["data"]
+        return len(data[0]["x"])
+
+    assert points() == 100
+    assert points() == 100  # served from the payload cache
+    _insert(uid, 50, "2026-01-02")
+    assert db.get_data_version(uid) != version
+    assert points() == 150
+    db.delete_user_records(uid)
+    assert client.get("/dashboard/series?metric=heart_rate").get_json() == {"data": []}
@@ -0,0 +1,15 @@
+import io
+
+
+def test_unknown_engine_renders_the_data_page_for_forms(client):
+    client.post("/login", data={"username": "user", "password": "user123"})
+    upload = {"file": (io.BytesIO(b"timestamp,heart_rate\n2026-01-01 00:00:00,60\n"), "a.csv"), "engine": "nope"}
+    r = client.post("/data/upload", data=upload, content_type="multipart/form-data")
+    assert r.status_code == 200 and r.mimetype == "text/html"
+    assert b"Unknown detector engine: nope" in r.data
+
+    r = client.post("/data/engine", data={"engine": "nope"})
+    assert r.mimetype == "text/html" and b"Unknown detector engine: nope" in r.data
+
+    r = client.post("/data/engine", data={"engine": "nope"}, headers={"Accept": "application/json"})
+    assert r.status_code == 400 and r.json == {"error": "Unknown detector engine: nope"}
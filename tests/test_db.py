@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules import db
+
+
+def test_failed_write_leaves_no_open_transaction(tmp_path):
+    path = str(tmp_path / "app.db")
+    db.init_db(path)
+    db.create_job("j1", 1, "upload", db_path=path)
+    with pytest.raises(Exception):
+        db.update_job("j1", {"error": {"not": "bindable"}}, db_path=path)
+    with pytest.raises(Exception):
+        db.set_setting("k", object(), db_path=path)
+    # The cached connection is reused by the thread's next request; it must not hold the write lock
+    assert not db.get_conn(path).in_transaction
+    db.set_setting("k", "v", db_path=path)
+    assert db.get_setting("k", db_path=path) == "v"
+    db.close_conn(path)
+
+
+def test_load_health_frame_matches_get_health_records(tmp_path):
+    path = str(tmp_path / "app.db")
+    db.init_db(path)
+    ts = pd.date_range("2026-01-01", periods=250, freq="min").strftime("%Y-%m-%dT%H:%M:%S")
+    rows = [[1, t, 60.0 + i % 9, None if i % 4 else float(i), 7.5, None, 120.0, 80.0, 95.0,
+             int(i % 10 == 0), i / 250, "glucose" if i % 10 == 0 else None] for i, t in enumerate(ts)]
+    db.insert_health_tuples(rows, db_path=path)
+
+    start, end = "2026-01-01T00:10:00", "2026-01-01T03:00:00"
+    frame = db.load_health_frame(1, start=start, end=end, batch_size=64, db_path=path)
+    expected = pd.DataFrame([dict(r) for r in db.get_health_records(1, start=start, end=end, db_path=path)])
+    assert len(frame) == 170
+    assert frame["timestamp"].dtype == "datetime64[s]"
+    assert (frame["timestamp"] == pd.to_datetime(expected["timestamp"])).all()
+    for c in db.HEALTH_COLUMNS[1:]:
+        if c in db.HEALTH_TEXT_COLUMNS:
+            assert frame[c].tolist() == expected[c].tolist()
+        else:
+            assert frame[c].dtype == np.float64
+            np.testing.assert_array_equal(frame[c].to_numpy(), expected[c].to_numpy(dtype=float))
+
+    subset = db.load_health_frame(1, columns=["glucose", "anomaly_drivers"], end=start, db_path=path)
+    assert list(subset.columns) == ["timestamp", "glucose", "anomaly_drivers"] and len(subset) == 10
+    db.close_conn(path)
@@ -0,0 +1,74 @@
+import threading
+
+import pandas as pd
+
+from modules import db
+
+
+def _tuples(user_id: int, n: int, start: str = "2026-01-01"):
+    ts = pd.date_range(start, periods=n, freq="min").strftime("%Y-%m-%dT%H:%M:%S")
+    return [[user_id, t, 70.0, 10.0, 0.0, 1.0, 120.0, 80.0, 95.0, 0, 0.0, None] for t in ts]
+
+
+def _run_threads(fn, n_threads: int) -> None:
+    errors = []
+
+    def target(i: int) -> None:
+        try:
+            fn(i)
+        except Exception as e:  # surfaced below; a thread can't fail the test itself
+            errors.append(e)
+        finally:
+            db.close_conn()
+
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(n_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors, errors
+
+
+def _totals(path: str, user_id: int):
+    conn = db.get_conn(path)
+    records = db.count_health_records(user_id, db_path=path)
+    daily = conn.execute("SELECT TOTAL(record_count) FROM daily_rollups WHERE user_id = ?", (user_id,)).fetchone()[0]
+    tiers = dict(conn.execute("SELECT tier, TOTAL(record_count) FROM series_rollups WHERE user_id = ? GROUP BY tier",
+                              (user_id,)).fetchall())
+    return records, int(daily), {t: int(v) for t, v in tiers.items()}
+
+
+def test_concurrent_inserts_fold_each_row_once(tmp_path):
+    path = str(tmp_path / "app.db")
+    db.init_db(path)
+    n_users, n_rows = 4, 2000
+
+    _run_threads(lambda i: db.insert_health_tuples(_tuples(i + 1, n_rows), chunk_size=250, db_path=path), n_users)
+
+    for uid in range(1, n_users + 1):
+        records, daily, tiers = _totals(path, uid)
+        assert records == n_rows
+        assert daily == n_rows
+        assert tiers == {t: n_rows for t in db.SERIES_TIERS}
+    db.close_conn(path)
+
+
+def test_concurrent_restore_and_insert_count_each_row_once(tmp_path):
+    path = str(tmp_path / "app.db")
+    db.init_db(path)
+    n_rows = 2000
+
+    def work(i: int) -> None:
+        if i % 2:
+            db.restore_health_tuples(_tuples(i + 1, n_rows), db_path=path)
+        else:
+            db.insert_health_tuples(_tuples(i + 1, n_rows), chunk_size=250, db_path=path)
+
+    _run_threads(work, 4)
+
+    for uid in range(1, 5):
+        records, daily, _ = _totals(path, uid)
+        assert records == n_rows
+        # Restored rows are already covered by rollups, so only inserted ones are folded
+        assert daily == (0 if uid % 2 == 0 else n_rows)
+    db.close_conn(path)
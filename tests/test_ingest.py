@@ -0,0 +1,52 @@
+import io
+
+import pandas as pd
+
+from modules import db, ingest, preprocessing, registry
+
+
+def _csv(start: str, n: int) -> bytes:
+    ts = pd.date_range(start, periods=n, freq="h")
+    df = pd.DataFrame({"timestamp": ts, "heart_rate": 60.0 + (pd.RangeIndex(n) % 7), "steps": 100.0})
+    return df.to_csv(index=False).encode()
+
+
+def _state_count() -> int:
+    return registry.load_state(1, "rolling")["metrics"]["heart_rate"]["count"][0]
+
+
+def test_reupload_does_not_advance_rolling_state(instance_dir):
+    data = _csv("2026-01-01", 48)
+    assert ingest.ingest_stream(1, io.BytesIO(data), engine="rolling") == 48
+    assert _state_count() == 48
+
+    assert ingest.ingest_stream(1, io.BytesIO(data), engine="rolling") == 0
+    assert _state_count() == 48
+
+    # Overlapping upload: only the 12 new hours are scored
+    assert ingest.ingest_stream(1, io.BytesIO(_csv("2026-01-02 12:00", 24)), engine="rolling") == 12
+    assert _state_count() == 60
+    assert db.count_health_records(1) == 60
+
+
+def test_db_tuples_round_trip_through_insert(tmp_path):
+    path = str(tmp_path / "app.db")
+    db.init_db(path)
+    df = pd.DataFrame({
+        "timestamp": pd.to_datetime(["2026-01-01 01:00:00+01:00", "2026-01-01 01:30:00+01:00"]),
+        "heart_rate": [70.5, float("nan")],
+        "steps": [12.0, 0.0],
+        "anomaly_flag": [0.0, 1.0],
+        "anomaly_score": [0.1, 0.9],
+        "anomaly_drivers": ["", "heart_rate (low)"],
+    })
+    rows = preprocessing.to_db_tuples(df, 7)
+    assert rows[0] == [7, "2026-01-01T00:00:00", 70.5, 12.0, None, None, None, None, None, 0, 0.1, None]
+    assert db.insert_health_tuples(rows, db_path=path) == 2
+
+    got = [dict(r) for r in db.get_health_records(7, db_path=path)]
+    assert [r["timestamp"] for r in got] == ["2026-01-01T00:00:00", "2026-01-01T00:30:00"]
+    assert got[1]["heart_rate"] is None and got[1]["steps"] == 0.0
+    assert [r["anomaly_flag"] for r in got] == [0, 1]
+    assert got[1]["anomaly_drivers"] == "heart_rate (low)"
+    db.close_conn(path)
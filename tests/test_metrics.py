@@ -0,0 +1,22 @@
+import time
+
+from modules import compute, metrics
+
+
+def _busy(seconds: float) -> int:
+    n = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        n += 1
+    return n
+
+
+def test_profiled_request_samples_the_compute_worker():
+    sampler = metrics.StackSampler(interval=0.002).start()
+    try:
+        compute.run("test", _busy, 0.2)
+    finally:
+        sampler.stop()
+    assert metrics.active_sampler() is None
+    worker = sum(n for stack, n in sampler.stacks.items() if stack.endswith("test_metrics.py:_busy"))
+    assert worker >= sum(sampler.stacks.values()) // 2
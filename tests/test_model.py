@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from modules import model
+
+
+def _frame(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({"heart_rate": rng.normal(70, 8, n), "steps": rng.gamma(2.0, 50.0, n),
+                       "glucose": rng.normal(100, 15, n)})
+    df.iloc[::97] *= 3.0  # injected outliers
+    return df
+
+
+def test_forest_decision_matches_sklearn(monkeypatch):
+    df = _frame(3000)
+    cols = list(df.columns)
+    X = df[cols].to_numpy()
+    monkeypatch.setattr(model, "SCORE_PARALLEL_MIN_ROWS", 0)
+    for max_samples in ("auto", 512, 0.5, 1):
+        forest, _ = model.fit_isolation_forest(df, feature_cols=cols, n_estimators=40, max_samples=max_samples)
+        ref = forest.decision_function(X)
+        flags = forest.predict(X) == -1
+        for n_jobs, chunk_rows in ((1, 50_000), (1, 700), (3, 700)):
+            d = model.forest_decision(forest, df, cols, n_jobs=n_jobs, chunk_rows=chunk_rows)
+            np.testing.assert_allclose(d, ref, rtol=0, atol=1e-12)
+            assert np.array_equal(d < 0, flags)
+
+
+def test_top_k_drivers_match_per_row_ranking():
+    rng = np.random.default_rng(1)
+    z = rng.normal(0, 2, (500, 5))
+    z[::50, 2] = np.nan
+    cols = ["a", "b", "c", "d", "e"]
+    names, mags = model.top_k_drivers(z, cols, k=2)
+    for row, got_names, got_mags in zip(np.nan_to_num(np.abs(z)), names, mags):
+        order = sorted(range(len(cols)), key=lambda j: -row[j])[:2]
+        assert list(got_names) == [cols[j] for j in order]
+        np.testing.assert_allclose(got_mags, row[order])
+    assert model.top_k_drivers(z[:, :1], ["a"], k=3)[0].shape == (500, 1)
+
+
+def test_score_anomalies_names_drivers_of_flagged_rows_only():
+    df = _frame(2000)
+    df.loc[10, "glucose"] = 900.0
+    out = model.score_anomalies(df, contamination=0.02, driver_magnitudes=True)
+    flagged = out["anomaly_flag"] == 1
+    assert flagged.any() and (out.loc[~flagged, "anomaly_drivers"] == "").all()
+    assert out.loc[10, "anomaly_flag"] == 1 and out.loc[10, "anomaly_drivers"].startswith("glucose, ")
+    assert out.loc[flagged, "anomaly_drivers"].str.count(", ").eq(1).all()
+    assert out.loc[~flagged, "anomaly_driver_z1"].isna().all()
+    assert (out.loc[flagged, "anomaly_driver_z1"] >= out.loc[flagged, "anomaly_driver_z2"]).all()
@@ -0,0 +1,89 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from modules import preprocessing
+
+
+def _clean_both(raw: pd.DataFrame, chunk_rows: int):
+    data = raw.to_csv(index=False).encode()
+    one_shot = preprocessing.clean_health_df(preprocessing.read_csv_flex(data))
+    streamed = pd.concat(list(preprocessing.iter_clean_chunks(io.BytesIO(data), chunk_rows=chunk_rows)))
+    return one_shot.reset_index(drop=True), streamed.sort_values("timestamp").reset_index(drop=True)
+
+
+def test_streaming_matches_one_shot_on_out_of_order_input():
+    n = 200
+    ts = pd.date_range("2026-01-01", periods=n, freq="h")
+    # Min and max each cover 10% of every chunk, so the 1%/99% clip is a no-op on both paths
+    raw = pd.DataFrame({"timestamp": ts, "heart_rate": 60.0 + 40.0 * (np.arange(n) % 10) / 9,
+                        "steps": 100.0 * (np.arange(n) % 5)})
+    raw.loc[[45, 46, 52, 53, 61, 62, 63, 104, 118, 140], "heart_rate"] = np.nan
+    raw.loc[[44, 64, 65, 106, 141], "steps"] = np.nan
+    # Late rows: hours 40-49 and 100-109 arrive one chunk after later hours were read
+    order = np.r_[0:40, 50:60, 40:50, 60:100, 110:150, 100:110, 150:200]
+    one_shot, streamed = _clean_both(raw.iloc[order], chunk_rows=50)
+
+    assert len(streamed) == n
+    assert (streamed["timestamp"] == one_shot["timestamp"]).all()
+    for c in ("heart_rate", "steps"):
+        np.testing.assert_allclose(streamed[c].to_numpy(), one_shot[c].to_numpy())
+
+
+def test_fused_clean_matches_pandas_pipeline():
+    rng = np.random.default_rng(3)
+    n = 500
+    ts = pd.date_range("2026-01-01", periods=n, freq="7min").strftime("%Y-%m-%d %H:%M:%S").to_numpy(dtype=object)
+    raw = pd.DataFrame({"Timestamp": ts, "Heart_Rate": rng.normal(70, 10, n),
+                        "steps": rng.gamma(2.0, 40.0, n).astype(object), "glucose": np.nan, "note": "x"})
+    raw.loc[rng.choice(n, 60, replace=False), "Heart_Rate"] = np.nan
+    raw.loc[5, "Heart_Rate"] = 400.0
+    raw.loc[7, "steps"] = "n/a"
+    raw.loc[9, "Timestamp"] = "not a time"
+    raw = pd.concat([raw, raw.iloc[[20, 21]]]).sample(frac=1.0, random_state=0)  # duplicates, shuffled
+
+    expected = raw.copy()
+    expected.columns = [c.strip().lower() for c in expected.columns]
+    expected = preprocessing.clip_outliers(preprocessing.coerce_types_and_fill(preprocessing.remove_duplicates(expected)))
+    got = preprocessing.clean_health_df(raw)
+
+    assert list(got.columns) == list(expected.columns)
+    assert got.index.equals(expected.index)
+    assert (got["timestamp"] == expected["timestamp"]).all()
+    for c in ("heart_rate", "steps", "glucose"):
+        np.testing.assert_allclose(got[c].to_numpy(dtype=float), expected[c].to_numpy(dtype=float), equal_nan=True)
+    assert (got["note"] == "x").all()
+
+
+def test_interpolate_time_weights_by_time_and_respects_max_gap():
+    t = np.array([0.0, 1.0, 10.0, 20.0, 100.0, 150.0])
+    y = np.array([0.0, np.nan, 10.0, 20.0, np.nan, 40.0])
+    filled = preprocessing.interpolate_time(t, y)
+    # Row-position interpolation would give 5.0 and 30.0
+    assert filled[1] == 1.0
+    assert filled[4] == 20.0 + 20.0 * 80 / 130
+    gapped = preprocessing.interpolate_time(t, y, max_gap=50.0)
+    assert gapped[1] == 1.0
+    assert np.isnan(gapped[4])
+
+
+def test_resample_to_grid_fills_irregular_readings():
+    df = pd.DataFrame({
+        "timestamp": pd.to_datetime(["2026-01-01 00:00:00", "2026-01-01 00:20:00", "2026-01-01 03:00:00"]),
+        "heart_rate": [60.0, 100.0, 80.0],
+        "steps": [100.0, 400.0, 50.0],
+    })
+    grid = preprocessing.resample_to_grid(df, "5min", max_gap="1h")
+
+    assert len(grid) == 37
+    assert grid["record_count"].sum() == 3
+    # Empty steps take the value at the step midpoint, between the readings' times
+    np.testing.assert_allclose(grid["heart_rate"][:5], [60.0, 75.0, 85.0, 95.0, 100.0])
+    # A sum reading is spread over the steps since the previous one, keeping the total
+    np.testing.assert_allclose(grid["steps"][:5], [100.0, 100.0, 100.0, 100.0, 100.0])
+    assert grid["steps_count"][:5].tolist() == [1, 0, 0, 0, 1]
+    # The 2h40m gap is longer than max_gap: it stays empty
+    assert grid["heart_rate"][5:36].isna().all()
+    assert grid["steps"][5:36].isna().all()
+    assert grid["heart_rate"].iloc[-1] == 80.0 and grid["steps"].iloc[-1] == 50.0
@@ -0,0 +1,52 @@
+import multiprocessing
+import os
+
+import pandas as pd
+import pytest
+
+from modules import model, registry
+
+
+def test_delete_user_models_keeps_detector_state(tmp_path):
+    reg = str(tmp_path / "models")
+    df = pd.DataFrame({"heart_rate": [60.0, 62.0, 65.0, 90.0] * 20, "steps": [0.0, 10.0, 5.0, 300.0] * 20})
+    registry.save_model(1, model.fit_baseline(df, feature_cols=["heart_rate", "steps"]), reg)
+    registry.save_state(1, "rolling", {"metrics": {}}, reg)
+    registry.save_state(2, "rolling", {"metrics": {}}, reg)
+
+    # What rescore_user does before saving the refitted forest
+    registry.delete_user_models(1, reg)
+    assert registry.load_model(1, ["heart_rate", "steps"], reg) is None
+    assert registry.load_state(1, "rolling", reg) == {"metrics": {}}
+
+    registry.delete_user_state(1, reg)
+    assert registry.load_state(1, "rolling", reg) is None
+    assert registry.load_state(2, "rolling", reg) is not None
+    assert sorted(n for n in os.listdir(reg) if not n.endswith(".lock")) == ["user2_rolling.state.json"]
+
+
+def _score_slice(reg: str, i: int) -> None:
+    ts = pd.date_range("2026-01-01", periods=50, freq="min") + pd.Timedelta(hours=i)
+    df = pd.DataFrame({"timestamp": ts, "heart_rate": 60.0 + i})
+    model.get_detector("rolling").score(1, df, feature_cols=["heart_rate"], registry_dir=reg)
+    entry = model.fit_baseline(pd.DataFrame({"heart_rate": [60.0, 61.0, 62.0, 90.0] * 10}), feature_cols=["heart_rate"])
+    for _ in range(5):
+        registry.record_scored(1, entry, 10, reg)
+
+
+@pytest.mark.skipif(registry.fcntl is None, reason="cross-process sidecar locking needs fcntl")
+def test_sidecar_updates_from_several_processes_are_not_lost(tmp_path):
+    reg = str(tmp_path / "models")
+    registry.save_model(1, model.fit_baseline(pd.DataFrame({"heart_rate": [60.0, 61.0, 62.0, 90.0] * 10}),
+                                              feature_cols=["heart_rate"]), reg)
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_score_slice, args=(reg, i)) for i in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    assert all(p.exitcode == 0 for p in procs)
+
+    state = registry.load_state(1, "rolling", reg)
+    assert state["metrics"]["heart_rate"]["count"] == [4 * 50]
+    assert registry.load_model(1, ["heart_rate"], reg).rows_since_fit == 4 * 5 * 10
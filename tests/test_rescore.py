@@ -0,0 +1,42 @@
+import multiprocessing
+
+from modules import db, rescore
+
+
+def _claim(path: str, barrier, results) -> None:
+    barrier.wait()
+    results.put(rescore.start_run(0.05, ["heart_rate"], 1, db_path=path))
+    barrier.wait()  # stay alive until both have tried, so neither run looks orphaned
+
+
+def test_only_one_process_claims_a_rescore_run(tmp_path):
+    path = str(tmp_path / "app.db")
+    db.init_db(path)
+    db.close_conn()
+    ctx = multiprocessing.get_context("fork")
+    barrier, results = ctx.Barrier(2), ctx.Queue()
+    procs = [ctx.Process(target=_claim, args=(path, barrier, results)) for _ in range(2)]
+    for p in procs:
+        p.start()
+    claimed = [results.get(timeout=30) for _ in procs]
+    for p in procs:
+        p.join()
+    assert sorted(claimed, key=lambda r: r is None) == [1, None]
+    assert [r["run_id"] for r in db.list_running_rescore_runs(path)] == [1]
+    db.close_conn()
+
+
+def test_run_of_an_exited_process_is_failed_not_blocking(tmp_path):
+    path = str(tmp_path / "app.db")
+    db.init_db(path)
+    db.close_conn()
+    ctx = multiprocessing.get_context("fork")
+    p = ctx.Process(target=rescore.start_run, args=(0.05, ["heart_rate"], 1), kwargs={"db_path": path})
+    p.start()
+    p.join()
+    assert db.get_rescore_run(1, path)["status"] == "running"
+
+    assert rescore.start_run(0.05, ["heart_rate"], 1, db_path=path) == 2
+    assert db.get_rescore_run(1, path)["status"] == "failed"
+    assert rescore.start_run(0.05, ["heart_rate"], 1, db_path=path) is None
+    db.close_conn()
@@ -0,0 +1,11 @@
+"""
+Production entry point. `python app.py` is the single-process debug server; serve with e.g.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    uvicorn --interface wsgi --workers 4 wsgi:app
+
+Run from the repo root: the database and artifacts live under ./instance, shared by all workers.
+"""
+from app import app
+
+application = app